@@ -2,14 +2,47 @@
 
 
 # Flask本体とCORS（クロスオリジン対応）、SQLAlchemy、Flask-Migrateをインポート
-from flask import Flask, jsonify, request, abort
+from flask import Flask, Response, g, jsonify, request, abort
+from flask.cli import AppGroup
+import click
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from werkzeug.exceptions import BadRequest, Unauthorized, UnprocessableEntity, Forbidden
+from werkzeug.exceptions import BadRequest, Conflict, Unauthorized, UnprocessableEntity, Forbidden
 # 認証用
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+import cProfile
 import datetime
+import hashlib
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from idempotency import IdempotencyConflict, IdempotencyInProgress, IdempotencyStore
+from matching_cache import BatchCache, delta_hash, snapshot_hash
+from matching_diff import diff_batches
+from matching_engine import ENGINE_VERSION, deferred_acceptance, satisfaction_score
+from matching_incremental import rematch_incremental, vacated_seats
+from matching_jobs import JobContext, MatchingJobRunner, new_batch_id, QUEUED, CANCELLED, FINISHED_STATUSES
+from matching_scenarios import Scenario, run_scenarios
+from matching_snapshot import (load_snapshot, load_student_inputs, pack_snapshot, patch_snapshot, unpack_snapshot,
+                               vacancy_snapshot)
+from matching_storage import ASSIGNMENT_DTYPE, REMOVED, BatchArrays, pack_batch, unpack_array, unpack_ids
+from matching_strategies import DEFAULT_STRATEGY, get_strategy, run_strategies, run_strategy
+from matching_trace import explain_student, pack_trace, unpack_trace
+from matching_verify import DEFAULT_REPORT_LIMIT, verify_assignment, verify_changes
+from preference_import import PreferenceImportError, diff_preferences, iter_csv_rows, iter_ndjson_rows, validate_rows
+from sqlite_profile import (DEFAULT_PRAGMAS, READ_ENGINE_KEY, RoutingSession, create_read_engine, install_pragmas,
+                            is_file_sqlite, pool_options, read_transaction)
 
 # JWTエラー用ハンドラ追加
 from flask_jwt_extended.exceptions import JWTExtendedException
@@ -18,14 +51,50 @@ from flask_jwt_extended.exceptions import JWTExtendedException
 # Flaskアプリケーション初期化
 
 app = Flask(__name__)
-# SQLiteデータベース設定
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sotsuken.db'
+# SQLiteデータベース設定（SOTSUKEN_DATABASE_URI で別のDB（本番DBのコピー等）を指定できる）
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SOTSUKEN_DATABASE_URI', 'sqlite:///sotsuken.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # JWT設定
 app.config['JWT_SECRET_KEY'] = 'your-secret-key'  # 本番は安全な値に変更
 app.config['JWT_TOKEN_LOCATION'] = ['headers']
+# マッチングジョブのワーカー数
+app.config['MATCHING_WORKERS'] = 2
+# マッチング結果キャッシュ（メモリ・ディスクの保持件数）
+app.config['MATCHING_CACHE_DIR'] = os.path.join(app.instance_path, 'matching_cache')
+app.config['MATCHING_CACHE_MEMORY'] = 32
+app.config['MATCHING_CACHE_DISK'] = 256
+# 学生CSVインポートの1チャンク（1回の重複確認・INSERT・コミット）の行数
+app.config['STUDENT_IMPORT_CHUNK'] = 1000
+# Idempotency-Key の応答の保存期間（秒）とメモリ上の件数上限
+app.config['IDEMPOTENCY_TTL'] = 24 * 60 * 60
+app.config['IDEMPOTENCY_MAX_ENTRIES'] = 1024
+# SQLiteの接続プロファイル（接続ごとに設定するPRAGMA。Noneの項目は設定しない）
+app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_PRAGMAS)
+# ファイルDBの書き込み用プール（ワーカー・ジョブスレッドで共有）
+app.config['SQLITE_POOL_SIZE'] = 5
+app.config['SQLITE_MAX_OVERFLOW'] = 10
+app.config['SQLITE_POOL_TIMEOUT'] = 30
+# GETリクエストの読み取りを読み取り専用プールに振り分ける（ファイルDBのみ）
+app.config['SQLITE_READ_POOL'] = True
+app.config['SQLITE_READ_POOL_SIZE'] = 10
+if is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options(app.config)
 # SQLAlchemy初期化
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+with app.app_context():
+    install_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    if app.config['SQLITE_READ_POOL'] and is_file_sqlite(db.engine.url):
+        app.extensions[READ_ENGINE_KEY] = create_read_engine(
+            db.engine.url, app.config['SQLITE_PRAGMAS'],
+            {"pool_size": app.config['SQLITE_READ_POOL_SIZE'], "max_overflow": app.config['SQLITE_MAX_OVERFLOW'],
+             "pool_timeout": app.config['SQLITE_POOL_TIMEOUT']})
+
+
+@app.before_request
+def route_reads_to_read_pool():
+    g.read_only_db = request.method in ('GET', 'HEAD')
+
+
 # Flask-Migrate初期化
 migrate = Migrate(app, db)
 # CORS有効化（フロントエンドと別ドメインでもAPI利用可能に）
@@ -44,14 +113,14 @@ class User(db.Model):
     email = db.Column(db.String(128), unique=True, nullable=False)
     password = db.Column(db.String(128), nullable=False)  # ハッシュ化推奨
     role = db.Column(db.String(16), nullable=False)  # 'student', 'teacher', 'admin' など
-    student_id = db.Column(db.String(16), db.ForeignKey('students.student_id'), nullable=True)
+    student_id = db.Column(db.String(16), db.ForeignKey('students.student_id'), nullable=True, index=True)
 class Laboratory(db.Model):
     __tablename__ = 'laboratories'
     lab_id = db.Column(db.String(16), primary_key=True)
     lab_name = db.Column(db.String(64), unique=True, nullable=False)
     teacher_name = db.Column(db.String(64), nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
-    field_tag = db.Column(db.String(64), nullable=True)
+    field_tag = db.Column(db.String(64), nullable=True, index=True)
     # 配属学生リレーション
     students = db.relationship('Student', backref='laboratory', lazy='dynamic')
     # 特別希望学生リレーション（中間テーブルで正規化）
@@ -62,6 +131,8 @@ class LabSpecialStudent(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     lab_id = db.Column(db.String(16), db.ForeignKey('laboratories.lab_id'))
     student_id = db.Column(db.String(16), db.ForeignKey('students.student_id'))
+    # 研究室ごとの特別希望学生一覧（登録順）を索引だけで返す
+    __table_args__ = (db.Index('ix_lab_special_students_lab_student', 'lab_id', 'id', 'student_id'),)
 
 class Student(db.Model):
     __tablename__ = 'students'
@@ -69,9 +140,9 @@ class Student(db.Model):
     name = db.Column(db.String(64), nullable=False)
     email = db.Column(db.String(128), nullable=False)
     gpa = db.Column(db.Float, nullable=True)
-    assigned_lab = db.Column(db.String(16), db.ForeignKey('laboratories.lab_id'))
+    assigned_lab = db.Column(db.String(16), db.ForeignKey('laboratories.lab_id'), index=True)
     satisfaction = db.Column(db.Integer, nullable=True)  # 納得度
-    preferences = db.relationship('Preference', backref='student', lazy='joined')
+    preferences = db.relationship('Preference', backref='student', lazy='select')
 
 class Preference(db.Model):
     __tablename__ = 'preferences'
@@ -79,19 +150,85 @@ class Preference(db.Model):
     student_id = db.Column(db.String(16), db.ForeignKey('students.student_id'))
     lab_id = db.Column(db.String(16), db.ForeignKey('laboratories.lab_id'))
     rank = db.Column(db.Integer, nullable=False)
-    __table_args__ = (db.UniqueConstraint('student_id', 'lab_id', name='uq_student_lab'),)
+    # 学生ごとの希望一覧（rank順）を表を読まずに索引だけで返す（id は rowid のため索引に含まれる）
+    __table_args__ = (db.UniqueConstraint('student_id', 'lab_id', name='uq_student_lab'),
+                      db.Index('ix_preferences_student_rank', 'student_id', 'rank', 'lab_id'))
 
 # --- マッチング履歴テーブル ---
-class MatchingResult(db.Model):
-    __tablename__ = 'matching_results'
+# バッチ単位のヘッダ（実行日時・バージョン・サマリは1回だけ持つ）
+# 配属結果は学生順序表と研究室indexの詰めた配列で持つ（matching_storage）
+class MatchingBatch(db.Model):
+    __tablename__ = 'matching_batches'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    batch_id = db.Column(db.String(64), nullable=False, index=True)  # 実行単位ID
+    batch_id = db.Column(db.String(64), nullable=False, unique=True)  # 実行単位ID
     executed_at = db.Column(db.DateTime, nullable=False)
     version = db.Column(db.String(32), nullable=True)
+    summary = db.Column(db.Text, nullable=True)  # サマリ情報（JSON）
+    num_students = db.Column(db.Integer, nullable=False)
+    student_ids = db.Column(db.LargeBinary, nullable=False)  # 学生順序表（zlib圧縮）
+    lab_ids = db.Column(db.LargeBinary, nullable=False)  # 研究室表（zlib圧縮）
+    assignment = db.Column(db.LargeBinary, nullable=False)  # int16 研究室index（未配属は-1）
+    satisfaction = db.Column(db.LargeBinary, nullable=False)  # int8 納得度
+    trace = db.Column(db.LargeBinary, nullable=True)  # 事象トレース（記録した場合のみ、matching_trace）
+
+# 学生単位の参照（結果一覧・学生ごとの履歴）用の索引テーブル
+class MatchingResult(db.Model):
+    __tablename__ = 'matching_results'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    batch_id = db.Column(db.String(64), db.ForeignKey('matching_batches.batch_id'), nullable=False)
     student_id = db.Column(db.String(16), db.ForeignKey('students.student_id'))
     assigned_lab = db.Column(db.String(16), db.ForeignKey('laboratories.lab_id'))
     satisfaction = db.Column(db.Integer, nullable=True)
-    summary = db.Column(db.Text, nullable=True)  # サマリ情報（JSON等）
+    # 結果一覧のキーセットページング用（batch_id内をstudent_id順に走査）
+    # 学生ごとの履歴用（student_idで絞り、バッチのヘッダへ結合する列まで索引だけで読む）
+    __table_args__ = (db.Index('ix_matching_results_batch_student', 'batch_id', 'student_id', unique=True),
+                      db.Index('ix_matching_results_student_history', 'student_id', 'batch_id', 'assigned_lab',
+                               'satisfaction'))
+
+# --- マッチング入力スナップショット（締切時点の凍結） ---
+# 学生・GPA・研究室・定員・希望・特別希望枠を配列として詰めて1行に持つ（matching_snapshot.pack_snapshot）
+class MatchingInputSnapshot(db.Model):
+    __tablename__ = 'matching_input_snapshots'
+    snapshot_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    frozen_at = db.Column(db.DateTime, nullable=False)  # 締切（この時点までに確定した書き込みを含む）
+    label = db.Column(db.String(64), nullable=True)
+    input_hash = db.Column(db.String(64), nullable=True, index=True)
+    num_students = db.Column(db.Integer, nullable=True)
+    num_labs = db.Column(db.Integer, nullable=True)
+    num_preferences = db.Column(db.Integer, nullable=True)
+    # 凍結と同じトランザクションで書き込むため、確定した行では常に値を持つ
+    student_ids = db.Column(db.LargeBinary, nullable=True)
+    gpa = db.Column(db.LargeBinary, nullable=True)
+    lab_ids = db.Column(db.LargeBinary, nullable=True)
+    capacity = db.Column(db.LargeBinary, nullable=True)
+    pref_ptr = db.Column(db.LargeBinary, nullable=True)
+    pref_lab = db.Column(db.LargeBinary, nullable=True)
+    special = db.Column(db.LargeBinary, nullable=True)
+
+# --- Idempotency-Key の保存済み応答 ---
+class IdempotencyRecord(db.Model):
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(64), primary_key=True)  # sha256(パス, 利用者, Idempotency-Key)
+    fingerprint = db.Column(db.String(64), nullable=False)  # リクエスト内容の指紋
+    status = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    mimetype = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# --- マッチングジョブテーブル ---
+class MatchingJob(db.Model):
+    __tablename__ = 'matching_jobs'
+    job_id = db.Column(db.String(64), primary_key=True)  # batch_idと同じ値
+    status = db.Column(db.String(16), nullable=False)  # queued/running/succeeded/failed/cancelled
+    phase = db.Column(db.String(32), nullable=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    timings = db.Column(db.Text, nullable=True)  # フェーズごとの所要時間（JSON, ミリ秒）
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
 
 
 # --- DBマイグレーション用コマンド例 ---
@@ -99,22 +236,6 @@ class MatchingResult(db.Model):
 # flask db migrate -m "init"
 # flask db upgrade
 
-# --- ダミーデータ（本来はDBで管理） ---
-labs = [
-    {"lab_id": "LAB01", "lab_name": "研究室A", "teacher_name": "佐藤", "capacity": 10, "field_tag": "AI"},
-    {"lab_id": "LAB02", "lab_name": "研究室B", "teacher_name": "鈴木", "capacity": 8, "field_tag": "ロボティクス"}
-]
-students = [
-    {"student_id": "20250001", "name": "山田 太郎", "email": "yamada@example.com", "gpa": 3.6, "assigned_lab": "LAB01"}
-]
-preferences = {
-    "20250001": [
-        {"lab_id": "LAB01", "rank": 1},
-        {"lab_id": "LAB02", "rank": 2}
-    ]
-
-}
-
 # ===== 共通エラーハンドラ（113行目） =====
 @app.errorhandler(BadRequest)
 def handle_bad_request(e):
@@ -215,12 +336,113 @@ def role_required(roles):
             return fn(*args, **kwargs)
         return wrapper
     return decorator
+
+
+# --- Idempotency-Key（重複POSTの排除） ---
+IDEMPOTENCY_HASH_CHUNK = 1024 * 1024
+
+
+def idempotency_fingerprint():
+    """リクエスト内容の指紋
+
+    multipart（CSV等）はフォームの値と、アップロードされたファイルの名前・内容（チャンクごとに読んで
+    ハッシュし、読み終えたら先頭に戻す）から作る。境界文字列（boundary）は送信ごとに変わるため含めない。
+    """
+    h = hashlib.sha256(f"{request.method} {request.path}".encode('utf-8'))
+    if request.mimetype != 'multipart/form-data':
+        h.update((request.content_type or '').encode('utf-8'))
+        h.update(request.get_data(cache=True))
+        return h.hexdigest()
+    h.update(request.mimetype.encode('utf-8'))
+    fields = sorted(request.form.items(multi=True))
+    h.update(json.dumps(fields, ensure_ascii=False).encode('utf-8'))
+    for name, file in sorted(request.files.items(multi=True), key=lambda item: (item[0], item[1].filename or '')):
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: file.stream.read(IDEMPOTENCY_HASH_CHUNK), b''):
+            digest.update(chunk)
+        file.stream.seek(0)
+        h.update(json.dumps([name, file.filename, digest.hexdigest()], ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_idempotency_record(key):
+    row = db.session.get(IdempotencyRecord, key)
+    if row is None or row.expires_at < datetime.datetime.now():
+        return None
+    return {"fingerprint": row.fingerprint, "status": row.status, "body": row.body, "mimetype": row.mimetype,
+            "expires_at": row.expires_at.timestamp()}
+
+
+def save_idempotency_record(key, record):
+    now = datetime.datetime.now()
+    try:
+        # 期限切れの行はここで消し、テーブルが際限なく増えないようにする
+        db.session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at < now))
+        db.session.add(IdempotencyRecord(key=key, fingerprint=record["fingerprint"], status=record["status"],
+                                         body=record["body"], mimetype=record["mimetype"], created_at=now,
+                                         expires_at=now + datetime.timedelta(seconds=idempotency_store.ttl)))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+
+
+def idempotent(fn):
+    """Idempotency-Key ヘッダ付きのリクエストは、同じキーの応答を保存・再送して二重実行しない
+
+    キーは利用者（JWTのidentity）とパスごとに区別する。5xxと例外は保存しないため同じキーで再試行できる。
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        raw_key = request.headers.get('Idempotency-Key')
+        if not raw_key:
+            return fn(*args, **kwargs)
+        if len(raw_key) > 255:
+            raise ValidationError("Idempotency-Keyは255文字以内で指定してください")
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            identity = None
+        key = hashlib.sha256(json.dumps([request.path, identity, raw_key], sort_keys=True,
+                                        ensure_ascii=False).encode('utf-8')).hexdigest()
+        fingerprint = idempotency_fingerprint()
+        try:
+            record = idempotency_store.begin(key, fingerprint, load=load_idempotency_record)
+        except IdempotencyInProgress as e:
+            raise Conflict(str(e))
+        except IdempotencyConflict as e:
+            raise UnprocessableEntity(str(e))
+        if record is not None:
+            response = app.response_class(record["body"], status=record["status"], mimetype=record["mimetype"])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            response = app.make_response(fn(*args, **kwargs))
+        except BaseException:
+            idempotency_store.abort(key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            idempotency_store.abort(key)
+            return response
+        record = {"fingerprint": fingerprint, "status": response.status_code,
+                  "body": response.get_data(as_text=True), "mimetype": response.mimetype}
+        save_idempotency_record(key, record)
+        idempotency_store.finish(key, record)
+        return response
+    return wrapper
+
+
 # 422 Unprocessable Entity handler
 @app.errorhandler(UnprocessableEntity)
 def handle_unprocessable_entity(e):
     return jsonify({"error": "Unprocessable Entity", "message": str(e)}), 422
 
 
+# 409 Conflict handler（同じIdempotency-Keyのリクエストが実行中のまま待ち合わせが時間切れ）
+@app.errorhandler(Conflict)
+def handle_conflict(e):
+    return jsonify({"error": "Conflict", "message": str(e)}), 409
+
+
 # 例: 管理者のみアクセス可能なAPI
 @app.route('/api/v1/admin/secure', methods=['GET'])
 @role_required(['admin'])
@@ -395,6 +617,77 @@ def delete_laboratory(lab_id):
     return jsonify({"message": f"{lab.lab_name} を削除しました"})
 
 
+# --- 特別希望枠（lab_special_students）の一括管理API ---
+def special_students_of(lab_id):
+    return [sid for (sid,) in db.session.query(LabSpecialStudent.student_id)
+            .filter_by(lab_id=lab_id).order_by(LabSpecialStudent.id)]
+
+
+def check_special_entries(lab_ids, student_ids):
+    """研究室・学生の存在をそれぞれ1クエリで確認する"""
+    known_labs = {lab_id for (lab_id,) in db.session.query(Laboratory.lab_id).filter(Laboratory.lab_id.in_(lab_ids))}
+    unknown = [lab_id for lab_id in lab_ids if lab_id not in known_labs]
+    if unknown:
+        from werkzeug.exceptions import NotFound
+        raise NotFound(f"研究室が見つかりません: {', '.join(unknown)}")
+    known = {sid for (sid,) in db.session.query(Student.student_id).filter(Student.student_id.in_(student_ids))}
+    unknown = [sid for sid in student_ids if sid not in known]
+    if unknown:
+        raise ValidationError(f"存在しない学生IDです: {', '.join(unknown[:20])}")
+
+
+@app.route('/api/v1/admin/laboratories/<lab_id>/special_students', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def get_special_students(lab_id):
+    if not db.session.query(Laboratory.lab_id).filter_by(lab_id=lab_id).first():
+        from werkzeug.exceptions import NotFound
+        raise NotFound("研究室が見つかりません")
+    return jsonify({"lab_id": lab_id, "student_ids": special_students_of(lab_id)})
+
+
+@app.route('/api/v1/admin/laboratories/<lab_id>/special_students', methods=['PUT'])
+@jwt_required()
+@role_required(['admin'])
+def replace_special_students(lab_id):
+    """研究室の特別希望枠を丸ごと置き換える（リストの順が登録順＝優先順）"""
+    data = request.get_json(silent=True) or {}
+    student_ids = data.get("student_ids")
+    if not isinstance(student_ids, list) or not all(isinstance(sid, str) for sid in student_ids):
+        raise ValidationError("student_idsは学生IDの配列で指定してください")
+    student_ids = list(dict.fromkeys(student_ids))
+    check_special_entries([lab_id], student_ids)
+    db.session.execute(delete(LabSpecialStudent).where(LabSpecialStudent.lab_id == lab_id))
+    if student_ids:
+        db.session.execute(insert(LabSpecialStudent),
+                           [{"lab_id": lab_id, "student_id": sid} for sid in student_ids])
+    db.session.commit()
+    return jsonify({"lab_id": lab_id, "student_ids": student_ids})
+
+
+@app.route('/api/v1/admin/special_students/bulk', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def bulk_add_special_students():
+    """複数研究室の特別希望枠へまとめて追加する（登録済みの組は読み飛ばす）"""
+    data = request.get_json(silent=True) or {}
+    entries = data.get("entries")
+    if not isinstance(entries, list) or not all(
+            isinstance(e, dict) and isinstance(e.get("lab_id"), str) and isinstance(e.get("student_id"), str)
+            for e in entries):
+        raise ValidationError("entriesは {lab_id, student_id} の配列で指定してください")
+    pairs = list(dict.fromkeys((e["lab_id"], e["student_id"]) for e in entries))
+    lab_ids = list(dict.fromkeys(lab_id for lab_id, _ in pairs))
+    check_special_entries(lab_ids, list(dict.fromkeys(sid for _, sid in pairs)))
+    existing = set(db.session.query(LabSpecialStudent.lab_id, LabSpecialStudent.student_id)
+                   .filter(LabSpecialStudent.lab_id.in_(lab_ids)))
+    rows = [{"lab_id": lab_id, "student_id": sid} for lab_id, sid in pairs if (lab_id, sid) not in existing]
+    if rows:
+        db.session.execute(insert(LabSpecialStudent), rows)
+    db.session.commit()
+    return jsonify({"added": len(rows), "skipped": len(pairs) - len(rows)}), 201
+
+
 
 
 # --- 学生API ---
@@ -495,7 +788,11 @@ def get_student_assignment(student_id):
 # --- 学生の納得度・マッチング履歴取得API ---
 @app.route('/api/v1/students/<student_id>/matching_history', methods=['GET'])
 def get_student_matching_history(student_id):
-    results = MatchingResult.query.filter_by(student_id=student_id).order_by(MatchingResult.executed_at.desc()).all()
+    results = db.session.query(
+        MatchingResult.batch_id, MatchingBatch.executed_at, MatchingResult.assigned_lab,
+        MatchingResult.satisfaction, MatchingBatch.summary
+    ).join(MatchingBatch, MatchingBatch.batch_id == MatchingResult.batch_id) \
+        .filter(MatchingResult.student_id == student_id).order_by(MatchingBatch.executed_at.desc()).all()
     history = [
         {
             "batch_id": r.batch_id,
@@ -508,6 +805,32 @@ def get_student_matching_history(student_id):
     ]
     return jsonify(history)
 
+# --- 学生の配属経緯取得API ---
+# 保存済みの事象トレースから1人分の提案・拒否・押し出しを復元する（再マッチングはしない）
+@app.route('/api/v1/students/<student_id>/matching_explanation', methods=['GET'])
+def get_student_matching_explanation(student_id):
+    from werkzeug.exceptions import NotFound
+    batch_id = request.args.get('batch_id') or latest_batch_id()
+    row = db.session.query(MatchingBatch.student_ids, MatchingBatch.lab_ids, MatchingBatch.assignment,
+                           MatchingBatch.trace).filter_by(batch_id=batch_id).first() if batch_id else None
+    if row is None:
+        raise NotFound("マッチング結果が見つかりません")
+    if row.trace is None:
+        raise NotFound("このバッチには事象トレースが記録されていません")
+    student_ids = unpack_ids(row.student_ids)
+    try:
+        s = student_ids.index(student_id)
+    except ValueError:
+        raise NotFound("このバッチに学生が含まれていません")
+    lab_ids = unpack_ids(row.lab_ids)
+    lab = int(unpack_array(row.assignment, ASSIGNMENT_DTYPE)[s])
+    return jsonify({
+        "student_id": student_id,
+        "batch_id": batch_id,
+        "assigned_lab": lab_ids[lab] if lab >= 0 else None,
+        "events": explain_student(unpack_trace(row.trace), s, lab_ids, student_ids),
+    })
+
 # 学生詳細取得API（DB連携）
 @app.route('/api/v1/students/<student_id>', methods=['GET'])
 def get_student_detail(student_id):
@@ -536,102 +859,1031 @@ def get_preferences(student_id):
     ]
     return jsonify(prefs_list)
 
+IN_CLAUSE_CHUNK = 500  # IN句1回あたりのID数（SQLiteのバインド変数上限に余裕を持たせる）
+MAX_PREFERENCE_BATCH = 500  # 希望登録APIで1リクエストに含められる学生数
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        part = list(islice(items, size))
+        if not part:
+            return
+        yield part
+
+
+def parse_preference_list(prefs, where=''):
+    """[{lab_id, rank}] を {lab_id: rank} にする（rankは1以上の整数、lab_id・rankの重複は不可）"""
+    desired = {}
+    ranks = set()
+    for i, pref in enumerate(prefs):
+        lab_id = pref.get("lab_id") if isinstance(pref, dict) else None
+        rank = pref.get("rank") if isinstance(pref, dict) else None
+        if not lab_id or not isinstance(lab_id, str):
+            raise ValidationError(f"{where}preferences[{i}]: lab_idは必須です")
+        if not isinstance(rank, int) or isinstance(rank, bool) or rank < 1:
+            raise ValidationError(f"{where}preferences[{i}]: rankは1以上の整数で指定してください")
+        if lab_id in desired:
+            raise ValidationError(f"{where}preferences[{i}]: lab_idが重複しています")
+        if rank in ranks:
+            raise ValidationError(f"{where}preferences[{i}]: rankが重複しています")
+        desired[lab_id] = rank
+        ranks.add(rank)
+    return desired
+
+
 # 学生の希望登録API（DB連携）
+# {student_id, preferences} 1件、または {students: [{student_id, preferences}, ...]} の複数件。
+# 既存の希望を1回で読み、差分（追加・rank変更・削除）だけを1トランザクションで書き込む
 @app.route('/api/v1/preferences', methods=['POST'])
+@idempotent
 def set_preferences():
-    data = request.json
-    student_id = data.get("student_id")
-    prefs = data.get("preferences")
-    if not student_id or not isinstance(prefs, list):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
         raise ValidationError("student_idとpreferencesは必須です")
-    # 既存の希望を削除
-    Preference.query.filter_by(student_id=student_id).delete()
-    # 新しい希望を追加
-    for pref in prefs:
-        lab_id = pref.get("lab_id")
-        rank = pref.get("rank")
-        if not lab_id or not isinstance(rank, int):
-            continue
-        db.session.add(Preference(student_id=student_id, lab_id=lab_id, rank=rank))
-    db.session.commit()
-    return jsonify({"message": "希望を登録しました"})
+    batch = "students" in data
+    items = data["students"] if batch else [data]
+    if batch and (not isinstance(items, list) or not items):
+        raise ValidationError("studentsは1件以上のリストで指定してください")
+    if len(items) > MAX_PREFERENCE_BATCH:
+        raise ValidationError(f"studentsは{MAX_PREFERENCE_BATCH}件以内で指定してください")
+    desired = {}
+    for i, item in enumerate(items):
+        where = f"students[{i}]: " if batch else ''
+        student_id = item.get("student_id") if isinstance(item, dict) else None
+        prefs = item.get("preferences") if isinstance(item, dict) else None
+        if not student_id or not isinstance(prefs, list):
+            raise ValidationError(f"{where}student_idとpreferencesは必須です")
+        if student_id in desired:
+            raise ValidationError(f"{where}student_idが重複しています")
+        desired[student_id] = parse_preference_list(prefs, where)
+
+    # 学生・研究室の存在確認と既存の希望の読み込み（各1回）
+    student_ids = list(desired)
+    lab_ids = {lab_id for prefs in desired.values() for lab_id in prefs}
+    known = {sid for (sid,) in db.session.query(Student.student_id).filter(Student.student_id.in_(student_ids))}
+    unknown = [sid for sid in student_ids if sid not in known]
+    if unknown:
+        raise ValidationError(f"存在しない学生が指定されています: {', '.join(unknown)}")
+    known_labs = {lab_id for (lab_id,) in db.session.query(Laboratory.lab_id).filter(Laboratory.lab_id.in_(lab_ids))}
+    unknown = sorted(lab_ids - known_labs)
+    if unknown:
+        raise ValidationError(f"存在しない研究室が指定されています: {', '.join(unknown)}")
+    current = {}
+    for pref_id, sid, lab_id, rank in (db.session.query(Preference.id, Preference.student_id, Preference.lab_id,
+                                                        Preference.rank)
+                                       .filter(Preference.student_id.in_(student_ids))):
+        current.setdefault(sid, {})[lab_id] = (pref_id, rank)
+
+    deletes, updates, inserts = [], [], []
+    results = []
+    for sid, prefs in desired.items():
+        d, u, ins = diff_preferences(current.get(sid, {}), prefs)
+        deletes += d
+        updates += u
+        inserts += [dict(row, student_id=sid) for row in ins]
+        results.append({"student_id": sid, "unchanged": not (d or u or ins),
+                        "inserted": len(ins), "updated": len(u), "deleted": len(d)})
+    unchanged = not (deletes or updates or inserts)
+    if not unchanged:
+        for part in chunked(deletes, IN_CLAUSE_CHUNK):
+            db.session.execute(delete(Preference).where(Preference.id.in_(part)))
+        if updates:
+            db.session.execute(update(Preference), updates)
+        if inserts:
+            db.session.execute(insert(Preference), inserts)
+        db.session.commit()
+    body = {
+        "message": "希望に変更はありません" if unchanged else "希望を登録しました",
+        "unchanged": unchanged,
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deletes),
+    }
+    if batch:
+        body["students"] = results
+    return jsonify(body)
 
 
 # --- マッチングAPI ---
+# マッチングジョブ実行用ワーカープール（ワーカースレッド内でapp contextを有効化）
+matching_runner = MatchingJobRunner(max_workers=app.config['MATCHING_WORKERS'], context=app.app_context)
+MATCHING_PHASES = ['match', 'verify', 'save']
+# 入力ハッシュ → 保存済みバッチ のキャッシュ
+matching_cache = BatchCache(app.config['MATCHING_CACHE_DIR'], max_memory=app.config['MATCHING_CACHE_MEMORY'],
+                            max_disk=app.config['MATCHING_CACHE_DISK'])
+# Idempotency-Key → 保存済み応答（実行中の同一キーの待ち合わせを含む）
+idempotency_store = IdempotencyStore(ttl=app.config['IDEMPOTENCY_TTL'],
+                                     max_entries=app.config['IDEMPOTENCY_MAX_ENTRIES'])
+
+
+def job_to_dict(job):
+    elapsed = None
+    if job.started_at:
+        end = job.finished_at or datetime.datetime.now()
+        elapsed = round((end - job.started_at).total_seconds() * 1000, 3)
+    return {
+        "job_id": job.job_id,
+        "batch_id": job.job_id,
+        "status": job.status,
+        "phase": job.phase,
+        "progress": job.progress,
+        "timings": json.loads(job.timings) if job.timings else {},
+        "elapsed_ms": elapsed,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def report_matching_job(ctx):
+    # ジョブの状態をmatching_jobsテーブルへ反映（ワーカースレッドから呼ばれる）
+    if ctx.status in FINISHED_STATUSES:
+        db.session.rollback()
+    db.session.execute(update(MatchingJob).where(MatchingJob.job_id == ctx.job_id).values(
+        status=ctx.status,
+        phase=ctx.phase,
+        progress=ctx.progress,
+        timings=json.dumps(ctx.timings),
+        error=ctx.error,
+        started_at=ctx.started_at,
+        finished_at=ctx.finished_at,
+    ))
+    db.session.commit()
+
+
+def execute_matching_job(ctx, snapshot, input_hash, load_ms, strategy=DEFAULT_STRATEGY, time_budget=None,
+                         trace=False, snapshot_id=None):
+    # 入力は受付時に凍結したスナップショット（ハッシュ計算と同一の入力で実行する）
+    ctx.timings['load'] = load_ms
+
+    # --- 指定の配属方式で配属（既定は学生希望順・GPA優先のDeferred Acceptance） ---
+    with ctx.phase_timer('match'):
+        outcome, stats = run_strategy(strategy, snapshot, should_stop=ctx.cancelled, time_budget=time_budget,
+                                      trace=trace)
+    complete_matching_run(ctx, snapshot, outcome, stats, input_hash, snapshot_id=snapshot_id)
+
+
+def complete_matching_run(ctx, snapshot, outcome, stats, input_hash, snapshot_id=None, dry_run=False):
+    """配属結果の検証・保存（verify/saveフェーズ）。dry_run は保存まで実行してロールバックする"""
+    # 保存前にブロッキングペア・定員超過・希望外配属を検証し、結果をsummaryに記録する
+    with ctx.phase_timer('verify'):
+        verification = verify_assignment(snapshot, outcome.assignment).summary()
+
+    # DBへ一括保存（学生は主キー指定のbulk UPDATE、履歴はexecutemanyで一括INSERT）
+    with ctx.phase_timer('save'):
+        ctx.check_cancelled()
+        summary = save_matching_batch(ctx.job_id, snapshot, outcome, version=input_hash[:32], extra_summary={
+            "input_hash": input_hash,
+            "snapshot_id": snapshot_id,
+            "engine": get_strategy(stats["strategy"]).version,
+            "strategy": stats["strategy"],
+            "rejections": stats["rejections"],
+            "match_ms": stats["elapsed_ms"],
+            "verification": verification,
+            **{k: v for k, v in stats.items() if k not in ("strategy", "proposals", "rejections", "elapsed_ms")},
+        })
+        if dry_run:
+            db.session.rollback()
+            return summary
+        db.session.commit()
+    # 時間制限で打ち切った暫定解は同じ入力でも結果が変わりうるためキャッシュしない
+    if outcome.extra.get("optimal", True):
+        matching_cache.put(input_hash, {"batch_id": ctx.job_id, "summary": summary})
+    return summary
+
+
+def save_matching_batch(batch_id, snapshot, outcome, version=ENGINE_VERSION, extra_summary=None):
+    prefs = snapshot.prefs
+    executed_at = datetime.datetime.now()
+    student_rows = []
+    satisfactions = []
+    total_satisfaction = 0
+    assigned = 0
+    for s, sid in enumerate(snapshot.student_ids):
+        lab = outcome.assignment[s]
+        satisfaction = satisfaction_score(outcome.ranks[s], len(prefs[s]))
+        satisfactions.append(satisfaction)
+        total_satisfaction += satisfaction
+        assigned += lab >= 0
+        student_rows.append({
+            "student_id": sid,
+            "assigned_lab": snapshot.lab_ids[lab] if lab >= 0 else None,
+            "satisfaction": satisfaction,
+        })
+    summary = {
+        "students": snapshot.num_students,
+        "assigned": int(assigned),
+        "unassigned": snapshot.num_students - int(assigned),
+        "average_satisfaction": round(total_satisfaction / snapshot.num_students, 2) if snapshot.num_students else 0,
+        "proposals": int(outcome.proposals),
+        "engine": ENGINE_VERSION,
+    }
+    summary.update(extra_summary or {})
+    if outcome.trace is not None:
+        summary["trace_events"] = outcome.trace.size
+    if student_rows:
+        db.session.execute(insert(MatchingBatch).values(
+            batch_id=batch_id, executed_at=executed_at, version=version,
+            summary=json.dumps(summary, ensure_ascii=False), num_students=snapshot.num_students,
+            trace=pack_trace(outcome.trace) if outcome.trace is not None else None,
+            **pack_batch(snapshot.student_ids, snapshot.lab_ids, outcome.assignment, satisfactions)))
+        db.session.execute(update(Student), student_rows)
+        db.session.execute(insert(MatchingResult), [dict(row, batch_id=batch_id) for row in student_rows])
+    return summary
+
+
+INPUT_HASH_VERSION = 'input'
+
+
+def input_snapshot_to_dict(frozen):
+    return {
+        "snapshot_id": frozen.snapshot_id,
+        "frozen_at": frozen.frozen_at.isoformat(),
+        "label": frozen.label,
+        "input_hash": frozen.input_hash,
+        "students": frozen.num_students,
+        "labs": frozen.num_labs,
+        "preferences": frozen.num_preferences,
+    }
+
+
+def freeze_matching_input(label=None):
+    """現在の入力を読み込み、matching_input_snapshots に凍結する。(行, スナップショット, 再利用したか) を返す
+
+    各テーブルは1つの読み取りトランザクション（ファイルDBでは読み取り専用プール）で1クエリずつ読む。
+    読み込み中に他の書き込み（希望の削除→再登録など）が途中まで見えることはなく、読み込み・配列の
+    詰め込みの間は書き込みロックを持たない。凍結行のINSERTは最後の短い書き込みトランザクションで行う。
+    内容が直前の凍結と同じ場合は新しい行を作らずそれを返す。
+    """
+    frozen_at = datetime.datetime.now()
+    if is_file_sqlite(db.engine.url):
+        with read_transaction(app.extensions.get(READ_ENGINE_KEY) or db.engine) as conn:
+            snapshot = load_snapshot(conn)
+    else:
+        snapshot = load_snapshot(db.session)
+    input_hash = snapshot_hash(snapshot, INPUT_HASH_VERSION)
+    previous = db.session.query(MatchingInputSnapshot) \
+        .order_by(MatchingInputSnapshot.snapshot_id.desc()).first()
+    if previous is not None and previous.input_hash == input_hash and label is None:
+        return previous, snapshot, True
+    frozen = MatchingInputSnapshot(frozen_at=frozen_at, label=label, input_hash=input_hash,
+                                   **pack_snapshot(snapshot))
+    db.session.add(frozen)
+    db.session.commit()
+    return frozen, snapshot, False
+
+
+def load_input_snapshot(snapshot_id):
+    frozen = db.session.get(MatchingInputSnapshot, snapshot_id)
+    if frozen is None:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("入力スナップショットが見つかりません")
+    return frozen, unpack_snapshot(frozen)
+
+
+# 入力スナップショット作成API（締切時の凍結）
+@app.route('/api/v1/admin/matching/snapshots', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def create_input_snapshot():
+    data = request.get_json(silent=True) or {}
+    label = data.get("label")
+    if label is not None and (not isinstance(label, str) or len(label) > 64):
+        raise ValidationError("labelは64文字以内の文字列で指定してください")
+    frozen, _, reused = freeze_matching_input(label)
+    return jsonify(dict(input_snapshot_to_dict(frozen), reused=reused)), 200 if reused else 201
+
+
+# 入力スナップショット一覧取得API
+@app.route('/api/v1/admin/matching/snapshots', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def list_input_snapshots():
+    limit = min(int(request.args.get('limit', 20)), 100)
+    rows = MatchingInputSnapshot.query.order_by(MatchingInputSnapshot.snapshot_id.desc()).limit(limit).all()
+    return jsonify({"snapshots": [input_snapshot_to_dict(row) for row in rows]})
+
+
 @app.route('/api/v1/admin/matching/run', methods=['POST'])
 @jwt_required()
 @role_required(['admin'])
+@idempotent
 def run_matching():
-    # --- DBからデータ取得 ---
-    students = Student.query.all()
-    laboratories = Laboratory.query.all()
-    if not students:
+    data = request.get_json(silent=True) or {}
+    try:
+        strategy = get_strategy(data.get("strategy"))
+    except ValueError as e:
+        raise ValidationError(str(e))
+    time_budget = data.get("time_budget")
+    if time_budget is not None and (not isinstance(time_budget, (int, float)) or time_budget <= 0):
+        raise ValidationError("time_budgetは正の秒数で指定してください")
+    trace = data.get("trace", False)
+    if not isinstance(trace, bool):
+        raise ValidationError("traceはtrue/falseで指定してください")
+    if trace and 'trace' not in strategy.options:
+        raise ValidationError(f"{strategy.name} は事象トレースに対応していません")
+    snapshot_id = data.get("snapshot_id")
+    if snapshot_id is not None and (not isinstance(snapshot_id, int) or isinstance(snapshot_id, bool)):
+        raise ValidationError("snapshot_idは整数で指定してください")
+    start = time.perf_counter()
+    # ジョブは凍結済みの入力だけを読む（指定が無ければこの時点の入力を凍結する）
+    if snapshot_id is not None:
+        frozen, snapshot = load_input_snapshot(snapshot_id)
+    else:
+        frozen, snapshot, _ = freeze_matching_input()
+    if not snapshot.num_students:
         raise ValidationError("学生データが存在しません")
-    if not laboratories:
+    if not snapshot.num_labs:
         raise ValidationError("研究室データが存在しません")
-    lab_dict = {lab.lab_id: lab for lab in laboratories}
-    # 各研究室の割当学生リストを初期化
-    lab_assignments = {lab.lab_id: [] for lab in laboratories}
-    # 学生ごとに希望順位リストを取得
-    student_prefs = {}
-    for s in students:
-        prefs = Preference.query.filter_by(student_id=s.student_id).order_by(Preference.rank).all()
-        student_prefs[s.student_id] = [p.lab_id for p in prefs]
-    # 未配属学生リスト
-    unassigned = students[:]
-
-    # --- 学生希望順・GPA優先で配属 ---
-    # 1. 希望順位順に各学生が応募
-    while unassigned:
-        for student in unassigned[:]:
-            prefs = student_prefs.get(student.student_id, [])
-            for lab_id in prefs:
-                if len(lab_assignments[lab_id]) < lab_dict[lab_id].capacity:
-                    lab_assignments[lab_id].append(student)
-                    student.assigned_lab = lab_id
-                    unassigned.remove(student)
-                    break
-            # どこにも入れなかった場合は未配属
-
-    # 2. 定員超過時のGPA優先選抜
-    for lab_id, assigned in lab_assignments.items():
-        if len(assigned) > lab_dict[lab_id].capacity:
-            # GPA順で定員分だけ残す
-            assigned.sort(key=lambda s: (-s.gpa, student_prefs[s.student_id].index(lab_id) if lab_id in student_prefs[s.student_id] else 99))
-            selected = assigned[:lab_dict[lab_id].capacity]
-            lab_assignments[lab_id] = selected
-            # 落選者は未配属
-            for s in assigned[lab_dict[lab_id].capacity:]:
-                s.assigned_lab = None
-
-    # 3. DBへ保存
+    # 同じ結果になる方式（ヒープ版・NumPy版）はバージョンを共有し、キャッシュも共有する
+    input_hash = snapshot_hash(snapshot, strategy.version)
+    load_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    # 入力が前回から変わっていなければ保存済みバッチをそのまま返す
+    # トレースを記録する実行は保存済みバッチにトレースが無い場合があるため再実行する
+    # 保存済みバッチが最新でない（後の別方式・補充ラウンド等が配属を書き換えた）場合は再実行して配属を戻す
+    cached = None if data.get("force") or trace else matching_cache.get(input_hash)
+    if cached is not None and cached["batch_id"] == latest_batch_id():
+        return jsonify({
+            "message": "入力が変更されていないため保存済みの結果を返します",
+            "cached": True,
+            "strategy": strategy.name,
+            "job_id": cached["batch_id"],
+            "result_id": cached["batch_id"],
+            "input_hash": input_hash,
+            "snapshot_id": frozen.snapshot_id,
+            "summary": cached.get("summary"),
+        })
+
+    batch_id = new_batch_id()
+    db.session.add(MatchingJob(job_id=batch_id, status=QUEUED, progress=0.0, cancel_requested=False,
+                               created_at=datetime.datetime.now()))
+    db.session.commit()
+    job = partial(execute_matching_job, snapshot=snapshot, input_hash=input_hash, load_ms=load_ms,
+                  strategy=strategy.name, time_budget=time_budget, trace=trace,
+                  snapshot_id=frozen.snapshot_id)
+    matching_runner.submit(batch_id, job, MATCHING_PHASES, report=report_matching_job)
+    return jsonify({
+        "message": "マッチングジョブを登録しました",
+        "cached": False,
+        "strategy": strategy.name,
+        "job_id": batch_id,
+        "result_id": batch_id,
+        "input_hash": input_hash,
+        "snapshot_id": frozen.snapshot_id,
+        "status_url": f"/api/v1/admin/matching/jobs/{batch_id}",
+    }), 202
+
+# マッチングジョブ一覧取得API
+@app.route('/api/v1/admin/matching/jobs', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def list_matching_jobs():
+    limit = min(int(request.args.get('limit', 20)), 100)
+    jobs = MatchingJob.query.order_by(MatchingJob.created_at.desc()).limit(limit).all()
+    return jsonify({"jobs": [job_to_dict(job) for job in jobs]})
+
+# マッチングジョブ状態取得API
+@app.route('/api/v1/admin/matching/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def get_matching_job(job_id):
+    job = db.session.get(MatchingJob, job_id)
+    if not job:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("マッチングジョブが見つかりません")
+    return jsonify(job_to_dict(job))
+
+# マッチングジョブキャンセルAPI
+@app.route('/api/v1/admin/matching/jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def cancel_matching_job(job_id):
+    job = db.session.get(MatchingJob, job_id)
+    if not job:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("マッチングジョブが見つかりません")
+    if job.status in FINISHED_STATUSES:
+        raise ValidationError("マッチングジョブは既に終了しています")
+    job.cancel_requested = True
+    db.session.commit()
+    if not matching_runner.cancel(job_id):
+        # ワーカーが保持していない（再起動等）ジョブはその場で取消扱いにする
+        db.session.execute(update(MatchingJob).where(
+            MatchingJob.job_id == job_id, MatchingJob.status.notin_(FINISHED_STATUSES)
+        ).values(status=CANCELLED, finished_at=datetime.datetime.now()))
+        db.session.commit()
+    return jsonify({"message": "キャンセルを受け付けました", "job_id": job_id}), 202
+
+def latest_batch_id():
+    latest = db.session.query(MatchingBatch.batch_id).order_by(MatchingBatch.id.desc()).first()
+    return latest.batch_id if latest else None
+
+
+def load_batch_summary(batch_id):
+    row = db.session.query(MatchingBatch.summary).filter_by(batch_id=batch_id).first()
+    return json.loads(row.summary) if row and row.summary else {}
+
+
+def is_diff_batch(summary):
+    """変更のあった学生の行だけを持つ差分バッチか（増分再マッチング・補充ラウンド）"""
+    return bool(summary.get("diff")) or summary.get("mode") == "supplementary"
+
+
+def load_batch_arrays(batch_id):
+    """バッチの配属結果を BatchArrays で返す（存在しなければNotFound）
+
+    ヘッダ1行の配列を展開するだけで、学生ごとの行は読まない。差分バッチは
+    対象学生だけを持つため、起点バッチの配属に重ねて返す。
+    """
+    row = db.session.query(MatchingBatch.summary, MatchingBatch.student_ids, MatchingBatch.lab_ids,
+                           MatchingBatch.assignment, MatchingBatch.satisfaction).filter_by(batch_id=batch_id).first()
+    if row is None:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("マッチング結果が見つかりません")
+    arrays = BatchArrays.unpack(row.student_ids, row.lab_ids, row.assignment, row.satisfaction)
+    summary = json.loads(row.summary) if row.summary else {}
+    if not is_diff_batch(summary):
+        return arrays
+    return load_batch_arrays(summary["base_batch_id"]).overlay(arrays)
+
+
+def load_batch_assignment(batch_id):
+    """バッチの配属結果を {student_id: lab_id} で返す（存在しなければNotFound）"""
+    return load_batch_arrays(batch_id).to_dict()
+
+
+def save_diff_batch(batch_id, snapshot, assignment, satisfaction, students, removed, proposals,
+                    version=ENGINE_VERSION, extra_summary=None):
+    """差分バッチを保存する。行を持つのは students（学生index）と削除された学生（removed: student_id）だけ
+
+    assignment・satisfaction は起点に重ねた後の全学生の配属・納得度（snapshot の学生順）で、集計に使う。
+    学生の配属先・履歴の更新も students の分だけ行う。
+    """
+    lab_ids = snapshot.lab_ids
+    assignment = np.asarray(assignment, dtype=np.int32)
+    rows = []
     for s in students:
-        db.session.add(s)
+        lab = int(assignment[s])
+        rows.append({
+            "student_id": snapshot.student_ids[s],
+            "assigned_lab": lab_ids[lab] if lab >= 0 else None,
+            "satisfaction": int(satisfaction[s]),
+        })
+    n = snapshot.num_students
+    assigned = int((assignment >= 0).sum())
+    summary = {
+        "students": n,
+        "assigned": assigned,
+        "unassigned": n - assigned,
+        "average_satisfaction": round(float(satisfaction.sum()) / n, 2) if n else 0,
+        "proposals": int(proposals),
+        "engine": ENGINE_VERSION,
+        "diff": True,
+    }
+    summary.update(extra_summary or {})
+    db.session.execute(insert(MatchingBatch).values(
+        batch_id=batch_id, executed_at=datetime.datetime.now(), version=version,
+        summary=json.dumps(summary, ensure_ascii=False), num_students=len(rows) + len(removed),
+        **pack_batch([row["student_id"] for row in rows] + list(removed), lab_ids,
+                     [int(assignment[s]) for s in students] + [REMOVED] * len(removed),
+                     [row["satisfaction"] for row in rows] + [0] * len(removed))))
+    if rows:
+        db.session.execute(update(Student), rows)
+        db.session.execute(insert(MatchingResult), [dict(row, batch_id=batch_id) for row in rows])
+    return summary
+
+
+# 増分再マッチングAPI
+# 公開済みバッチを起点に、希望を変更した学生・定員を変更した研究室の影響だけを再計算する。
+# 入力は起点バッチの凍結済みスナップショットに、指定した学生・研究室の現在の値だけを反映したもの
+@app.route('/api/v1/admin/matching/incremental', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def run_incremental_matching():
+    data = request.get_json(silent=True) or {}
+    base_batch_id = data.get("base_batch_id") or latest_batch_id()
+    if not base_batch_id:
+        raise ValidationError("起点となるマッチング結果が存在しません")
+    student_ids = data.get("student_ids") or []
+    capacities = data.get("capacities") or {}
+    if not isinstance(student_ids, list) or not isinstance(capacities, dict) or \
+            not all(isinstance(sid, str) for sid in student_ids):
+        raise ValidationError("student_idsはリスト、capacitiesは {lab_id: 定員} で指定してください")
+    student_ids = sorted(set(student_ids))
+    base_arrays = load_batch_arrays(base_batch_id)
+    # 増分再マッチングはDeferred Acceptanceの安定マッチングを起点とする場合のみ全件再実行と一致する
+    # 入力は起点バッチ（記録が無ければ遡った最初のバッチ）の凍結済みスナップショット
+    summary = load_batch_summary(base_batch_id)
+    snapshot_id = summary.get("snapshot_id")
+    while summary.get("mode") == "supplementary":
+        summary = load_batch_summary(summary["base_batch_id"])
+        snapshot_id = summary.get("snapshot_id") if snapshot_id is None else snapshot_id
+    if summary.get("engine", ENGINE_VERSION) != ENGINE_VERSION:
+        raise ValidationError("増分再マッチングはgale_shapleyで作成したバッチにのみ適用できます")
+    if snapshot_id is None:
+        raise ValidationError("起点バッチに入力スナップショットが記録されていません（/matching/run で全件実行してください）")
+
+    start = time.perf_counter()
+    base_frozen, base_snapshot = load_input_snapshot(snapshot_id)
+    lab_index = base_snapshot.lab_index
+    capacity = {}
+    for lab_id, cap in capacities.items():
+        if not isinstance(cap, int) or isinstance(cap, bool) or cap < 1:
+            raise ValidationError("capacityは1以上の整数で入力してください")
+        if lab_id not in lab_index:
+            raise ValidationError(f"研究室 {lab_id} は起点バッチの入力に存在しません")
+        capacity[lab_index[lab_id]] = cap
+
+    # 指定した学生の現在の入力だけを読む。起点の入力にあって現在は無い学生は削除として扱う
+    live, special = load_student_inputs(db.session, student_ids)
+    in_base = base_snapshot.indexes_of(student_ids)
+    unknown = [sid for sid in student_ids if sid not in live and sid not in in_base]
+    if unknown:
+        raise ValidationError(f"存在しない学生が指定されています: {', '.join(unknown)}")
+    changes = {sid: live.get(sid) for sid in student_ids}
+    snapshot, remap = patch_snapshot(base_snapshot, changes, special, capacity)
+
+    # 起点バッチの配属を変更後の学生順に写す（新規の学生は未配属）
+    base = base_arrays.align(base_snapshot.student_ids, base_snapshot.lab_ids)
+    kept = remap >= 0
+    assignment = np.full(snapshot.num_students, -1, dtype=np.int32)
+    assignment[remap[kept]] = base.assignment[kept]
+    satisfaction = np.zeros(snapshot.num_students, dtype=np.int32)
+    satisfaction[remap[kept]] = base.satisfaction[kept]
+    removed = [sid for sid in student_ids if changes[sid] is None]
+    vacated, vacated_special = vacated_seats(base_snapshot, base.assignment, [in_base[sid] for sid in removed])
+    # 新規の学生は student_ids の順に末尾へ追加されている
+    added = sum(1 for sid in student_ids if changes[sid] is not None and sid not in in_base)
+    changed = [int(remap[in_base[sid]]) for sid in student_ids if changes[sid] is not None and sid in in_base]
+    changed += range(snapshot.num_students - added, snapshot.num_students)
+    old_capacity = {lab: base_snapshot.capacity[lab] for lab in capacity}
+    outcome = rematch_incremental(snapshot, assignment.tolist(), changed, old_capacity, vacated, vacated_special)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    touched = outcome.extra["touched"]
+    prefs = snapshot.pref_view
+    for s in touched:
+        satisfaction[s] = satisfaction_score(outcome.ranks[s], len(prefs[s]))
+    labs = set(capacity) | set(vacated) | set(vacated_special)
+    labs |= {int(assignment[s]) for s in touched if assignment[s] >= 0}
+    verification = verify_changes(snapshot, outcome.assignment, touched, labs).summary()
+    verification["scope"] = "changes"
+
+    # 変更後の入力を凍結し、差分バッチとして保存する（行は touched と削除された学生の分だけ）
+    input_hash = delta_hash(base_frozen.input_hash or f"snapshot:{base_frozen.snapshot_id}", {
+        "students": changes,
+        "special": special,
+        "capacities": {lab_id: capacities[lab_id] for lab_id in sorted(capacities)},
+    })
+    frozen = MatchingInputSnapshot(frozen_at=datetime.datetime.now(), label="incremental", input_hash=input_hash,
+                                   **pack_snapshot(snapshot))
+    db.session.add(frozen)
+    db.session.flush()
+    batch_id = new_batch_id()
+    summary = save_diff_batch(batch_id, snapshot, outcome.assignment, satisfaction, touched, removed,
+                              outcome.proposals, version=input_hash[:32], extra_summary={
+                                  "input_hash": input_hash,
+                                  "snapshot_id": frozen.snapshot_id,
+                                  "mode": "incremental",
+                                  "base_batch_id": base_batch_id,
+                                  "changed_students": len(student_ids),
+                                  "changed_labs": len(capacity),
+                                  "touched_students": len(touched),
+                                  "full_rerun": outcome.extra["full_rerun"],
+                                  "elapsed_ms": elapsed_ms,
+                                  "verification": verification,
+                              })
+    if capacities:
+        db.session.execute(update(Laboratory), [{"lab_id": lab_id, "capacity": cap}
+                                                for lab_id, cap in capacities.items()])
     db.session.commit()
+    moved = sum(1 for s in touched if outcome.assignment[s] != assignment[s])
+    return jsonify({
+        "message": "増分再マッチングを実行しました",
+        "batch_id": batch_id,
+        "base_batch_id": base_batch_id,
+        "moved_students": moved,
+        "summary": summary,
+    }), 201
+
+
+# 補充ラウンドAPI
+# 起点バッチ（省略時は最新バッチ）の配属を確定として、凍結済みの入力で未配属の学生だけを
+# 残り定員に対してマッチングする。結果は未配属だった学生の行だけを持つ差分バッチとして保存し、
+# 起点バッチに重ねて参照する
+@app.route('/api/v1/admin/matching/supplementary', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def run_supplementary_matching():
+    data = request.get_json(silent=True) or {}
+    base_batch_id = data.get("base_batch_id") or latest_batch_id()
+    if not base_batch_id:
+        raise ValidationError("起点となるマッチング結果が存在しません")
+    snapshot_id = data.get("snapshot_id")
+    if snapshot_id is not None and (not isinstance(snapshot_id, int) or isinstance(snapshot_id, bool)):
+        raise ValidationError("snapshot_idは整数で指定してください")
+    base_arrays = load_batch_arrays(base_batch_id)
+    start = time.perf_counter()
+    # 入力は凍結済みのスナップショット（指定が無ければこの時点の入力を凍結する）
+    if snapshot_id is not None:
+        frozen, snapshot = load_input_snapshot(snapshot_id)
+    else:
+        frozen, snapshot, _ = freeze_matching_input()
+    base = base_arrays.align(snapshot.student_ids, snapshot.lab_ids)
+    vacancy, students = vacancy_snapshot(snapshot, base.assignment)
+    vacancies = sum(vacancy.capacity)
+    if not vacancy.num_students:
+        return jsonify({"message": "未配属の学生はいません", "batch_id": None, "base_batch_id": base_batch_id,
+                        "snapshot_id": frozen.snapshot_id, "vacancies": vacancies})
+    outcome = deferred_acceptance(vacancy.prefs, vacancy.gpa, vacancy.capacity, vacancy.special)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+    filled = sum(1 for lab in outcome.assignment if lab >= 0)
+    # 補充ラウンドの検証は残り定員に対するもの
+    verification = verify_assignment(vacancy, outcome.assignment).summary()
+
+    # 起点の配属に重ねた全体（入力に無くなった学生は削除として扱う）
+    assignment = base.assignment.copy()
+    assignment[students] = outcome.assignment
+    satisfaction = base.satisfaction.copy()
+    satisfaction[students] = [satisfaction_score(rank, len(p)) for rank, p in zip(outcome.ranks, vacancy.prefs)]
+    removed = []
+    if base_arrays.student_ids != snapshot.student_ids:
+        current = set(snapshot.student_ids)
+        removed = [sid for sid in base_arrays.student_ids if sid not in current]
+    batch_id = new_batch_id()
+    summary = save_diff_batch(batch_id, snapshot, assignment, satisfaction, students.tolist(), removed,
+                              outcome.proposals, extra_summary={
+                                  "mode": "supplementary",
+                                  "base_batch_id": base_batch_id,
+                                  "snapshot_id": frozen.snapshot_id,
+                                  "round_students": vacancy.num_students,
+                                  "vacancies": vacancies,
+                                  "remaining_seats": vacancies - filled,
+                                  "elapsed_ms": elapsed_ms,
+                                  "verification": verification,
+                              })
+    db.session.commit()
+    return jsonify({
+        "message": "補充ラウンドを実行しました",
+        "batch_id": batch_id,
+        "base_batch_id": base_batch_id,
+        "summary": summary,
+    }), 201
+
+
+def verify_batch(batch_id=None, limit=DEFAULT_REPORT_LIMIT, snapshot_id=None, live=False):
+    """保存済みバッチを入力スナップショットに対して検証する
+
+    snapshot_id 省略時はバッチの実行に使った凍結済みの入力（summary.snapshot_id）で検証する。
+    live 指定時と、入力の記録が無いバッチは現在の入力を読んで検証する。
+    """
+    batch_id = batch_id or latest_batch_id()
+    if not batch_id:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("マッチング結果が見つかりません")
+    arrays = load_batch_arrays(batch_id)
+    summary = load_batch_summary(batch_id)
+    if snapshot_id is None and not live:
+        snapshot_id = summary.get("snapshot_id")
+    snapshot = load_input_snapshot(snapshot_id)[1] if snapshot_id is not None else load_snapshot(db.session)
+    report = verify_assignment(snapshot, arrays.align(snapshot.student_ids, snapshot.lab_ids).assignment.tolist())
+    result = {"batch_id": batch_id, "snapshot_id": snapshot_id}
+    result.update(report.to_dict(snapshot, limit=limit))
+    # 保存時と異なる入力で検証した場合、検出結果はその後の変更を含む（差分バッチは入力を比較できずnull）
+    input_hash = summary.get("input_hash")
+    if snapshot_id is not None and snapshot_id == summary.get("snapshot_id"):
+        result["input_matches"] = True
+    elif input_hash and not is_diff_batch(summary):
+        result["input_matches"] = snapshot_hash(snapshot, summary.get("engine", ENGINE_VERSION)) == input_hash
+    else:
+        result["input_matches"] = None
+    in_batch = set(arrays.student_ids)
+    result["students_not_in_batch"] = sum(1 for sid in snapshot.student_ids if sid not in in_batch)
+    return result
+
+
+# マッチング結果検証API
+# ブロッキングペア・定員超過・希望外配属を全件検出する（一覧はlimit件まで）
+@app.route('/api/v1/admin/matching/verify', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def verify_matching():
+    limit = min(int(request.args.get('limit', DEFAULT_REPORT_LIMIT)), 10000)
+    return jsonify(verify_batch(request.args.get('batch_id'), limit=limit,
+                                snapshot_id=request.args.get('snapshot_id', type=int),
+                                live=request.args.get('live') in ('1', 'true')))
+
+
+# バッチ間差分API
+# from, to（省略時は最新）のバッチを配列で比較する。format=ndjson で1行ずつストリーミング
+@app.route('/api/v1/admin/matching/diff', methods=['GET'])
+@jwt_required()
+@role_required(['admin'])
+def diff_matching_batches():
+    from_id = request.args.get('from')
+    if not from_id:
+        raise ValidationError("fromに比較元のbatch_idを指定してください")
+    to_id = request.args.get('to') or latest_batch_id()
+    if not to_id:
+        from werkzeug.exceptions import NotFound
+        raise NotFound("マッチング結果が見つかりません")
+    start = time.perf_counter()
+    diff = diff_batches(load_batch_arrays(from_id), load_batch_arrays(to_id))
+    header = {"from": from_id, "to": to_id}
+    header.update(diff.summary())
+    header["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    if request.args.get('format') == 'ndjson':
+        def lines():
+            yield json.dumps(dict(header, type="summary"), ensure_ascii=False) + "\n"
+            for lab in diff.labs():
+                yield json.dumps(dict(lab, type="lab"), ensure_ascii=False) + "\n"
+            for move in diff.iter_moves():
+                yield json.dumps(dict(move, type="move"), ensure_ascii=False) + "\n"
+        return Response(lines(), mimetype='application/x-ndjson')
+    header["labs"] = diff.labs()
+    header["moves"] = list(diff.iter_moves())
+    return jsonify(header)
+
+
+# What-ifシナリオ実行API（DBの配属・履歴は更新しない）
+MAX_SCENARIOS = 200
+
+@app.route('/api/v1/admin/matching/scenarios', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+def run_matching_scenarios():
+    data = request.json or {}
+    raw = data.get("scenarios")
+    if not isinstance(raw, list) or not raw:
+        raise ValidationError("scenariosは1件以上のリストで指定してください")
+    if len(raw) > MAX_SCENARIOS:
+        raise ValidationError(f"scenariosは{MAX_SCENARIOS}件以内で指定してください")
+    workers = data.get("workers")
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        raise ValidationError("workersは1以上の整数で指定してください")
+    snapshot = load_snapshot(db.session)
+    scenarios = parse_scenarios(raw, snapshot)
+    start = datetime.datetime.now()
+    results = run_scenarios(snapshot, scenarios, workers=workers)
+    return jsonify({
+        "students": snapshot.num_students,
+        "labs": snapshot.num_labs,
+        "elapsed_ms": round((datetime.datetime.now() - start).total_seconds() * 1000, 3),
+        "scenarios": results,
+    })
+
+
+def parse_scenarios(raw, snapshot):
+    if not isinstance(raw, list):
+        raise ValidationError("シナリオはリストで指定してください")
+    scenarios = []
+    for item in raw:
+        try:
+            scenario = Scenario.from_dict(item)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        unknown = [lab_id for lab_id in scenario.capacity if lab_id not in snapshot.lab_index]
+        if unknown:
+            raise ValidationError(f"存在しない研究室が指定されています: {', '.join(unknown)}")
+        unknown = [x for x in scenario.disable_special
+                   if x not in snapshot.lab_index and x not in snapshot.student_index]
+        if unknown:
+            raise ValidationError(f"disable_specialに存在しない研究室・学生が指定されています: {', '.join(unknown)}")
+        scenarios.append(scenario)
+    return scenarios
+
+
+# --- マッチングCLI（flask matching ...） ---
+matching_cli = AppGroup('matching', help='マッチング関連コマンド')
+app.cli.add_command(matching_cli)
+
+
+@matching_cli.command('scenarios')
+@click.argument('scenario_file', type=click.File('r', encoding='utf-8'))
+@click.option('--workers', type=int, default=None, help='並列実行するプロセス数')
+def scenarios_command(scenario_file, workers):
+    """シナリオ定義（JSONのリスト）を読み込みWhat-ifシミュレーションを実行する"""
+    snapshot = load_snapshot(db.session)
+    try:
+        scenarios = parse_scenarios(json.load(scenario_file), snapshot)
+    except ValidationError as e:
+        raise click.ClickException(str(e))
+    results = run_scenarios(snapshot, scenarios, workers=workers)
+    click.echo(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+PROFILE_OPTION = click.option('--profile', 'profile_path', type=click.Path(dir_okay=False), default=None,
+                              help='cProfileの統計（pstats形式）の出力先。上位の関数は標準エラーに表示する')
+
+
+@contextmanager
+def cli_profile(profile_path, limit=25):
+    if not profile_path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(limit)
+
+
+@matching_cli.command('run')
+@click.option('--strategy', 'strategies', multiple=True,
+              help='配属方式（複数指定で同じ入力に対して比較実行。省略時は既定方式）')
+@click.option('--workers', type=int, default=None, help='複数方式を並列実行するプロセス数（1で同一プロセス）')
+@click.option('--snapshot', 'snapshot_id', type=int, default=None,
+              help='入力スナップショットID（省略時は現在の入力を凍結する。--dry-run では凍結しない）')
+@click.option('--time-budget', type=float, default=None, help='時間制限（秒、対応する方式のみ）')
+@click.option('--trace', is_flag=True, help='事象トレースを記録する（対応する方式のみ）')
+@click.option('--dry-run', is_flag=True, help='配属・検証・保存まで実行し、DBへの書き込みはロールバックする')
+@click.option('--apply', 'apply_name', default=None,
+              help='保存して学生の配属に反映する方式（複数方式の実行時は必須。他の方式は --dry-run と同じ扱い）')
+@PROFILE_OPTION
+def run_command(strategies, workers, snapshot_id, time_budget, trace, dry_run, apply_name, profile_path):
+    """HTTP・ジョブ実行を介さずにマッチングを同期実行し、方式ごとのフェーズ別所要時間と集計を出力する
+
+    学生の配属（assigned_lab）に反映するのは1方式だけ。複数方式を指定する場合は --dry-run か --apply が必要。
+    --profile 指定時は計測対象を揃えるため全方式を同一プロセスで実行する。
+    """
+    from werkzeug.exceptions import NotFound
+    try:
+        names = list(dict.fromkeys(get_strategy(name).name for name in strategies or [apply_name or DEFAULT_STRATEGY]))
+        applied = get_strategy(apply_name).name if apply_name else None
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if applied is not None and applied not in names:
+        raise click.ClickException(f"--apply の方式が --strategy に含まれていません: {applied}")
+    if len(names) > 1 and not dry_run and applied is None:
+        raise click.ClickException("複数の方式を実行する場合は --dry-run か、反映する方式を --apply で指定してください")
+    if dry_run:
+        applied = None
+    elif applied is None:
+        applied = names[0]
+    unsupported = [name for name in names if trace and 'trace' not in get_strategy(name).options]
+    if unsupported:
+        raise click.ClickException(f"事象トレースに対応していない方式です: {', '.join(unsupported)}")
+    if profile_path:
+        workers = 1
+    with cli_profile(profile_path):
+        start = time.perf_counter()
+        try:
+            if snapshot_id is not None:
+                frozen, snapshot = load_input_snapshot(snapshot_id)
+            elif dry_run:
+                frozen, snapshot = None, load_snapshot(db.session)
+            else:
+                frozen, snapshot, _ = freeze_matching_input()
+        except NotFound as e:
+            raise click.ClickException(e.description)
+        if not snapshot.num_students or not snapshot.num_labs:
+            raise click.ClickException("学生データまたは研究室データが存在しません")
+        snapshot_id = frozen.snapshot_id if frozen is not None else None
+        load_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        match_start = time.perf_counter()
+        outcomes = run_strategies(snapshot, names, workers=workers, time_budget=time_budget, trace=trace)
+        match_ms = round((time.perf_counter() - match_start) * 1000, 3)
+        runs = []
+        for outcome, stats in outcomes:
+            ctx = JobContext(new_batch_id(), MATCHING_PHASES)
+            ctx.timings.update(load=load_ms, match=stats["elapsed_ms"])
+            input_hash = snapshot_hash(snapshot, get_strategy(stats["strategy"]).version)
+            saved = not dry_run and stats["strategy"] == applied
+            summary = complete_matching_run(ctx, snapshot, outcome, stats, input_hash, snapshot_id=snapshot_id,
+                                            dry_run=not saved)
+            runs.append({
+                "strategy": stats["strategy"],
+                "batch_id": ctx.job_id if saved else None,
+                "input_hash": input_hash,
+                "timings": ctx.timings,
+                "summary": summary,
+            })
+    click.echo(json.dumps({
+        "dry_run": dry_run,
+        "applied": applied,
+        "snapshot_id": snapshot_id,
+        "students": snapshot.num_students,
+        "labs": snapshot.num_labs,
+        "match_wall_ms": match_ms,
+        "runs": runs,
+    }, ensure_ascii=False, indent=2))
+
+
+@matching_cli.command('verify')
+@click.option('--batch-id', default=None, help='検証するバッチ（省略時は最新）')
+@click.option('--snapshot', 'snapshot_id', type=int, default=None,
+              help='検証に使う入力スナップショットID（省略時はバッチの実行に使った入力）')
+@click.option('--live', is_flag=True, help='現在の入力に対して検証する')
+@click.option('--limit', type=int, default=DEFAULT_REPORT_LIMIT, help='一覧に出力する件数')
+@PROFILE_OPTION
+def verify_command(batch_id, snapshot_id, live, limit, profile_path):
+    """保存済みバッチのブロッキングペア・定員超過・希望外配属を検出する（問題があれば終了コード1）"""
+    from werkzeug.exceptions import NotFound
+    try:
+        with cli_profile(profile_path):
+            result = verify_batch(batch_id, limit=limit, snapshot_id=snapshot_id, live=live)
+    except NotFound as e:
+        raise click.ClickException(e.description)
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result["ok"]:
+        raise click.exceptions.Exit(1)
+
+
+@matching_cli.command('export')
+@click.option('--batch-id', default=None, help='出力するバッチ（省略時は最新）')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', help='出力形式')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='出力先（省略時は標準出力）')
+@PROFILE_OPTION
+def export_command(batch_id, fmt, output, profile_path):
+    """バッチの配属結果（student_id, assigned_lab, satisfaction）を学生順に出力する"""
+    from werkzeug.exceptions import NotFound
+    batch_id = batch_id or latest_batch_id()
+    if not batch_id:
+        raise click.ClickException("マッチング結果が見つかりません")
+    with cli_profile(profile_path):
+        try:
+            arrays = load_batch_arrays(batch_id)
+        except NotFound as e:
+            raise click.ClickException(e.description)
+        labs = arrays.lab_ids
+        rows = ((sid, labs[lab] if lab >= 0 else None, sat)
+                for sid, lab, sat in zip(arrays.student_ids, arrays.assignment.tolist(),
+                                         arrays.satisfaction.tolist()))
+        if fmt == 'csv':
+            writer = csv.writer(output, lineterminator='\n')
+            writer.writerow(["student_id", "assigned_lab", "satisfaction"])
+            writer.writerows((sid, lab or '', sat) for sid, lab, sat in rows)
+        else:
+            for sid, lab, sat in rows:
+                output.write(json.dumps({"student_id": sid, "assigned_lab": lab, "satisfaction": sat},
+                                        ensure_ascii=False) + '\n')
 
-    return jsonify({"message": "マッチングを実行しました", "result_id": "20251211-001"})
 
 # マッチング結果取得API
+# batch_id省略時は最新バッチ。student_idのキーセットページング（after, limit）
 @app.route('/api/v1/matching/results', methods=['GET'])
 def get_matching_results():
-    # ダミー結果（本来はマッチング結果テーブルから取得）
+    batch_id = request.args.get('batch_id')
+    after = request.args.get('after', '')
+    limit = min(int(request.args.get('limit', 100)), 1000)
+    query = db.session.query(MatchingBatch.batch_id, MatchingBatch.executed_at, MatchingBatch.summary)
+    if batch_id:
+        batch = query.filter_by(batch_id=batch_id).first()
+        if batch is None:
+            from werkzeug.exceptions import NotFound
+            raise NotFound("マッチング結果が見つかりません")
+    else:
+        batch = query.order_by(MatchingBatch.id.desc()).first()
+        if batch is None:
+            return jsonify({"batch_id": None, "executed_at": None, "results": [], "next_after": None})
+        batch_id = batch.batch_id
+    if is_diff_batch(json.loads(batch.summary) if batch.summary else {}):
+        # 差分バッチは起点バッチに重ねた全体からページを作り、氏名・研究室名はそのページの分だけ引く
+        page = load_batch_arrays(batch_id).page(after, limit + 1)
+        names = dict(db.session.query(Student.student_id, Student.name)
+                     .filter(Student.student_id.in_([sid for sid, _ in page])))
+        lab_names = dict(db.session.query(Laboratory.lab_id, Laboratory.lab_name)
+                         .filter(Laboratory.lab_id.in_({lab_id for _, lab_id in page if lab_id})))
+        rows = [(sid, names.get(sid), lab_id, lab_names.get(lab_id)) for sid, lab_id in page]
+    else:
+        rows = db.session.query(
+            MatchingResult.student_id, Student.name, MatchingResult.assigned_lab, Laboratory.lab_name
+        ).outerjoin(Student, Student.student_id == MatchingResult.student_id) \
+            .outerjoin(Laboratory, Laboratory.lab_id == MatchingResult.assigned_lab) \
+            .filter(MatchingResult.batch_id == batch_id, MatchingResult.student_id > after) \
+            .order_by(MatchingResult.student_id).limit(limit + 1).all()
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
     results = [
-        {"student_id": s["student_id"], "name": s["name"], "assigned_lab": s["assigned_lab"], "lab_name": next((l["lab_name"] for l in labs if l["lab_id"] == s["assigned_lab"]), None)}
-        for s in students
+        {"student_id": sid, "name": name, "assigned_lab": lab_id, "lab_name": lab_name}
+        for sid, name, lab_id, lab_name in rows[:limit]
     ]
-    return jsonify(results)
+    return jsonify({
+        "batch_id": batch_id,
+        "executed_at": batch.executed_at.isoformat(),
+        "results": results,
+        "next_after": next_after,
+    })
 
 
 # --- インポートAPI ---
 
 # 学生データCSVインポートAPI（管理者用・本実装）
 import csv
-from io import TextIOWrapper
+from io import BytesIO, TextIOWrapper
 from flask_jwt_extended import jwt_required
 
 @app.route('/api/v1/admin/students/import', methods=['POST'])
 @jwt_required()
 @role_required(['admin'])
+@idempotent
 def import_students():
     if 'file' not in request.files:
         raise ValidationError('fileパラメータ（CSVファイル）が必要です')
@@ -642,17 +1894,47 @@ def import_students():
     stream = TextIOWrapper(file.stream, encoding='utf-8')
     reader = csv.DictReader(stream)
     required_cols = {'student_id', 'name', 'email', 'gpa'}
-    if set(reader.fieldnames) != required_cols:
+    if set(reader.fieldnames or ()) != required_cols:
         raise ValidationError(f'CSVのカラムは {required_cols} のみ許可されています')
+    start = time.perf_counter()
+    chunk_size = app.config['STUDENT_IMPORT_CHUNK']
+    rows = enumerate(reader, start=2)  # 2行目=データ1行目
     imported = 0
+    processed = 0
+    chunks = 0
     errors = []
-    for idx, row in enumerate(reader, start=2):  # 2行目=データ1行目
+    # アップロードをチャンク単位で読み、チャンクごとに重複確認1回・一括INSERT・コミットする
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        imported += import_student_chunk(chunk, errors)
+        processed += len(chunk)
+        chunks += 1
+    elapsed = time.perf_counter() - start
+    return jsonify({
+        "imported": imported,
+        "errors": errors,
+        "rows": processed,
+        "chunks": chunks,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "rows_per_sec": round(processed / elapsed, 1) if elapsed > 0 else None,
+    })
+
+
+def import_student_chunk(chunk, errors):
+    """CSVの行 [(行番号, row)] を検証して一括登録し、登録件数を返す（エラーは errors に追記）"""
+    sids = {row.get('student_id', '').strip() for _, row in chunk} - {''}
+    # 既存の学生は1回のIN検索で調べる（前のチャンクで登録した行もコミット済みのためここで検出される）
+    existing = {sid for sid, in db.session.query(Student.student_id).filter(Student.student_id.in_(sids))}
+    new_rows = []
+    for idx, row in chunk:
         sid = row.get('student_id', '').strip()
         name = row.get('name', '').strip()
         email = row.get('email', '').strip()
         gpa_str = row.get('gpa', '').strip()
-        # 重複チェック（student_idのみ先に）
-        if sid and Student.query.filter_by(student_id=sid).first():
+        # 重複チェック（student_idのみ先に。同じファイル内の重複も含む）
+        if sid in existing:
             errors.append({"row": idx, "error": "student_idが既に存在します"})
             continue
         # 必須チェック
@@ -665,12 +1947,94 @@ def import_students():
         except ValueError:
             errors.append({"row": idx, "error": "gpaは数値で入力してください"})
             continue
-        # 登録
-        student = Student(student_id=sid, name=name, email=email, gpa=gpa)
-        db.session.add(student)
-        imported += 1
+        existing.add(sid)
+        new_rows.append({"student_id": sid, "name": name, "email": email, "gpa": gpa})
+    if new_rows:
+        db.session.execute(insert(Student), new_rows)
+    db.session.commit()
+    return len(new_rows)
+
+
+# 希望一括インポートAPI
+# CSV / NDJSON（student_id, lab_id, rank）を multipart の file、または text/csv・application/x-ndjson の本文で受け取る。
+# mode=replace（既定）はファイルに含まれる学生の希望をファイルの内容で置き換え（エラー行のある学生は置き換えない）、
+# mode=upsert は (student_id, lab_id) 単位で追加・rank更新する（ファイルに無い希望は残す）
+PREFERENCE_IMPORT_MODES = ('replace', 'upsert')
+
+
+def preference_import_rows():
+    if 'file' in request.files:
+        file = request.files['file']
+        name = file.filename or ''
+        stream = TextIOWrapper(file.stream, encoding='utf-8')
+        if name.endswith('.csv'):
+            return iter_csv_rows(stream)
+        if name.endswith(('.ndjson', '.jsonl')):
+            return iter_ndjson_rows(stream)
+        raise ValidationError('CSV（.csv）またはNDJSON（.ndjson, .jsonl）ファイルのみ対応しています')
+    # 本文はIdempotency-Keyの指紋計算で読み込み済みの場合があるためキャッシュから読む
+    if request.mimetype == 'text/csv':
+        return iter_csv_rows(TextIOWrapper(BytesIO(request.get_data(cache=True)), encoding='utf-8'))
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return iter_ndjson_rows(TextIOWrapper(BytesIO(request.get_data(cache=True)), encoding='utf-8'))
+    raise ValidationError('fileパラメータ（CSV/NDJSONファイル）、またはtext/csv・application/x-ndjsonの本文が必要です')
+
+
+@app.route('/api/v1/admin/preferences/import', methods=['POST'])
+@jwt_required()
+@role_required(['admin'])
+@idempotent
+def import_preferences():
+    mode = request.args.get('mode', 'replace')
+    if mode not in PREFERENCE_IMPORT_MODES:
+        raise ValidationError(f"modeは {', '.join(PREFERENCE_IMPORT_MODES)} のいずれかで指定してください")
+    start = time.perf_counter()
+    rows = preference_import_rows()
+    # 存在確認用のID集合は1回だけ読む
+    student_ids = {sid for sid, in db.session.query(Student.student_id)}
+    lab_ids = {lab_id for lab_id, in db.session.query(Laboratory.lab_id)}
+    try:
+        result = validate_rows(rows, student_ids, lab_ids)
+    except PreferenceImportError as e:
+        raise ValidationError(str(e))
+    except UnicodeDecodeError:
+        raise ValidationError('ファイルはUTF-8で作成してください')
+
+    deleted = 0
+    updates = []
+    skipped = []
+    if mode == 'replace':
+        # エラー行のある学生は既存の希望を残し、一部の行だけで置き換えない
+        skipped = result.drop_invalid_students()
+        inserts = result.insert_rows()
+        for part in chunked(result.prefs, IN_CLAUSE_CHUNK):
+            deleted += db.session.execute(delete(Preference).where(Preference.student_id.in_(part))).rowcount
+    else:
+        existing = {}
+        for part in chunked(result.prefs, IN_CLAUSE_CHUNK):
+            for pref_id, sid, lab_id, rank in (db.session.query(Preference.id, Preference.student_id,
+                                                                Preference.lab_id, Preference.rank)
+                                               .filter(Preference.student_id.in_(part))):
+                existing.setdefault(sid, {})[lab_id] = (pref_id, rank)
+        updates, inserts = result.plan_upsert(existing)
+    if updates:
+        db.session.execute(update(Preference), updates)
+    if inserts:
+        db.session.execute(insert(Preference), inserts)
     db.session.commit()
-    return jsonify({"imported": imported, "errors": errors})
+    elapsed = time.perf_counter() - start
+    return jsonify({
+        "mode": mode,
+        "rows": result.rows,
+        "students": len(result.prefs),
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": deleted,
+        "skipped_students": skipped,
+        "errors": result.errors,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "rows_per_sec": round(result.rows / elapsed, 1) if elapsed > 0 else None,
+    })
 
 
 # --- バックアップAPI ---
@@ -0,0 +1,89 @@
+# Idempotency-Key による重複リクエストの排除
+# 保存済みの応答を TTL 付きの件数上限つきメモリキャッシュに持ち、実行中のキーは Event で待ち合わせる。
+# 同じキーの2件目以降は、1件目が実行中なら完了を待ってその応答を返し、新たに実行しない。
+# 永続化（DBテーブル）は呼び出し側が load / save で行う。
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_TTL = 24 * 60 * 60  # 秒
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_WAIT = 60.0  # 実行中の同一キーを待つ上限（秒）
+
+
+class IdempotencyConflict(Exception):
+    """同じキーが別の内容のリクエストに使われた"""
+
+
+class IdempotencyInProgress(IdempotencyConflict):
+    """同じキーのリクエストが実行中のまま待ち合わせが時間切れになった"""
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 wait_timeout: float = DEFAULT_WAIT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._records: 'OrderedDict[str, Tuple[float, dict]]' = OrderedDict()  # キー → (期限, 応答)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[dict]:
+        entry = self._records.get(key)
+        if entry is None:
+            return None
+        expires, record = entry
+        if expires < time.time():
+            del self._records[key]
+            return None
+        self._records.move_to_end(key)
+        return record
+
+    def begin(self, key: str, fingerprint: str, load: Optional[Callable[[str], Optional[dict]]] = None
+              ) -> Optional[dict]:
+        """保存済みの応答があれば返す。無ければキーを実行中として確保し None を返す（finish/abort で解放）
+
+        他のスレッドが同じキーを実行中なら、その完了まで待つ。
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                record = self._get(key)
+                event = None if record is not None else self._inflight.get(key)
+                if record is None and event is None:
+                    self._inflight[key] = threading.Event()
+            if record is None and event is None and load is not None:
+                # メモリに無いキーは永続化先（他プロセス・再起動前の応答）を確認する
+                record = load(key)
+                if record is not None:
+                    self._remember(key, record, record.get("expires_at"))
+                    self.abort(key)
+            if record is not None:
+                if record["fingerprint"] != fingerprint:
+                    raise IdempotencyConflict("Idempotency-Keyが別の内容のリクエストで使用されています")
+                return record
+            if event is None:
+                return None
+            if not event.wait(max(deadline - time.monotonic(), 0)):
+                raise IdempotencyInProgress("同じIdempotency-Keyのリクエストが処理中です")
+
+    def finish(self, key: str, record: dict):
+        self._remember(key, record)
+        self.abort(key)
+
+    def abort(self, key: str):
+        """応答を保存せずにキーを解放する（待っているリクエストは自分で実行し直す）"""
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _remember(self, key: str, record: dict, expires: Optional[float] = None):
+        with self._lock:
+            self._records[key] = (expires or time.time() + self.ttl, record)
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
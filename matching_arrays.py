@@ -0,0 +1,125 @@
+# NumPy配列ベースのマッチングコア
+# 学生・研究室を連番の整数に符号化し、希望を -1 埋めの int32 行列、
+# 逆引きの希望順位行列、GPA・定員をフラット配列として保持する。
+# Deferred Acceptance をラウンド単位でベクトル化して実行し、
+# matching_engine.deferred_acceptance と同一の配属結果・納得度を返す。
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from matching_engine import MatchingCancelled, MatchingOutcome, assign_special_seats
+
+
+class MatchingArrays:
+    def __init__(self, student_ids: List[str], lab_ids: List[str], pref: np.ndarray, pref_len: np.ndarray,
+                 inv_rank: np.ndarray, gpa: np.ndarray, capacity: np.ndarray, special: Dict[int, List[int]]):
+        self.student_ids = student_ids
+        self.lab_ids = lab_ids
+        self.pref = pref  # (学生数, 最大希望数) int32、空きは-1
+        self.pref_len = pref_len  # (学生数,) int32
+        self.inv_rank = inv_rank  # (学生数, 研究室数) 希望順位（1始まり、希望外は0）
+        self.gpa = gpa  # (学生数,) float64
+        self.capacity = capacity  # (研究室数,) int32
+        self.special = special
+
+    @property
+    def num_students(self) -> int:
+        return len(self.pref_len)
+
+    @property
+    def num_labs(self) -> int:
+        return len(self.capacity)
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> 'MatchingArrays':
+        ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32) if len(snapshot.pref_ptr) else np.zeros(1, np.int32)
+        labs = np.frombuffer(snapshot.pref_lab, dtype=np.int32) if len(snapshot.pref_lab) else np.zeros(0, np.int32)
+        return cls.from_csr(snapshot.student_ids, snapshot.lab_ids, ptr, labs,
+                            np.asarray(snapshot.gpa, dtype=np.float64),
+                            np.asarray(snapshot.capacity, dtype=np.int32), snapshot.special)
+
+    @classmethod
+    def from_csr(cls, student_ids, lab_ids, ptr, labs, gpa, capacity, special) -> 'MatchingArrays':
+        n = len(ptr) - 1
+        m = len(capacity)
+        pref_len = np.diff(ptr).astype(np.int32)
+        width = int(pref_len.max()) if n else 0
+        pref = np.full((n, width), -1, dtype=np.int32)
+        rows = np.repeat(np.arange(n, dtype=np.int32), pref_len)
+        cols = np.arange(len(labs), dtype=np.int32) - np.repeat(ptr[:-1], pref_len).astype(np.int32)
+        pref[rows, cols] = labs
+        rank_dtype = np.int16 if m < np.iinfo(np.int16).max else np.int32
+        inv_rank = np.zeros((n, m), dtype=rank_dtype)
+        inv_rank[rows, labs] = cols + 1
+        return cls(student_ids, lab_ids, pref, pref_len, inv_rank, gpa, capacity, special)
+
+
+def satisfaction_array(ranks: np.ndarray, pref_len: np.ndarray) -> np.ndarray:
+    """納得度 int(100 * (1 - (rank-1)/len)) をベクトルで算出（未配属・希望外は0）"""
+    valid = (ranks > 0) & (pref_len > 0)
+    sat = np.zeros(len(ranks), dtype=np.int32)
+    sat[valid] = (100 * (1 - (ranks[valid] - 1) / pref_len[valid])).astype(np.int32)
+    return sat
+
+
+def deferred_acceptance_np(arrays: MatchingArrays,
+                           should_stop: Optional[Callable[[], bool]] = None) -> MatchingOutcome:
+    n, m = arrays.num_students, arrays.num_labs
+    seats = [int(c) for c in arrays.capacity]
+    # 特別希望枠の競合は希望順位で解決する（切り詰められた希望数より後ろは希望外扱い）
+    rank = (lambda s, lab: int(arrays.inv_rank[s, lab]) if arrays.inv_rank[s, lab] <= arrays.pref_len[s] else 0)
+    assignment = np.asarray(assign_special_seats(arrays.special, n, seats, rank), dtype=np.int32)
+    fixed = assignment >= 0
+    seats = np.asarray(seats, dtype=np.int64)
+    pref, pref_len = arrays.pref, arrays.pref_len
+    next_ptr = np.zeros(n, dtype=np.int32)
+
+    # 優先度キー: (研究室, GPA降順の密な順位, 希望順位, 学生index) を1つのint64に詰める
+    _, gpa_key = np.unique(-arrays.gpa, return_inverse=True)
+    gpa_key = gpa_key.astype(np.int64).ravel()
+    num_gpa = int(gpa_key.max()) + 1 if n else 1
+    width = pref.shape[1] + 1
+    packed = m * num_gpa * width * n < 2 ** 62
+
+    proposers = np.flatnonzero(~fixed & (pref_len > 0))
+    proposals = 0
+    rejections = 0
+    while len(proposers):
+        if should_stop is not None and should_stop():
+            raise MatchingCancelled()
+        labs = pref[proposers, next_ptr[proposers]]
+        next_ptr[proposers] += 1
+        proposals += len(proposers)
+        # 提案を受けた研究室の現在の仮配属者と新規提案者をまとめて選抜する
+        touched = np.zeros(m, dtype=bool)
+        touched[labs] = True
+        held = assignment >= 0
+        held &= ~fixed
+        held[held] = touched[assignment[held]]
+        holders = np.flatnonzero(held)
+        cand = np.concatenate((holders, proposers))
+        cand_lab = np.concatenate((assignment[holders], labs)).astype(np.int64)
+        cand_rank = next_ptr[cand].astype(np.int64)
+        if packed:
+            key = ((cand_lab * num_gpa + gpa_key[cand]) * width + cand_rank) * n + cand
+            key.sort()
+            cand = key % n
+            cand_lab = key // (num_gpa * width * n)
+        else:
+            order = np.lexsort((cand, cand_rank, gpa_key[cand], cand_lab))
+            cand = cand[order]
+            cand_lab = cand_lab[order]
+        # 研究室グループ内での順位 < 残り定員 なら採用
+        starts = np.searchsorted(cand_lab, cand_lab, side='left')
+        accept = (np.arange(len(cand)) - starts) < seats[cand_lab]
+        assignment[cand[accept]] = cand_lab[accept]
+        rejected = cand[~accept]
+        assignment[rejected] = -1
+        rejections += len(rejected)
+        proposers = rejected[next_ptr[rejected] < pref_len[rejected]]
+
+    ranks = np.zeros(n, dtype=np.int32)
+    assigned = assignment >= 0
+    ranks[assigned] = arrays.inv_rank[assigned, assignment[assigned]]
+    return MatchingOutcome(assignment, ranks, proposals, rejections)
@@ -0,0 +1,117 @@
+# マッチング実行結果のメモ化
+# 入力スナップショット（学生・GPA・希望・定員・特別希望枠）とエンジンバージョンから
+# 正規化したコンテンツハッシュを求め、同一入力の再実行では保存済みバッチを返す。
+# キャッシュはメモリ上のLRUとディスク上のJSONファイルの2段で、いずれも件数上限で古いものから破棄する。
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def snapshot_hash(snapshot, engine_version: str) -> str:
+    """スナップショットの正規化ハッシュ（sha256の16進文字列）"""
+    h = hashlib.sha256()
+
+    def feed(*parts):
+        for part in parts:
+            h.update(str(part).encode('utf-8'))
+            h.update(b'\x1f')
+        h.update(b'\x1e')
+
+    feed('engine', engine_version)
+    feed('labs', snapshot.num_labs)
+    for lab_id, cap in zip(snapshot.lab_ids, snapshot.capacity):
+        feed(lab_id, cap)
+    feed('students', snapshot.num_students)
+    lab_ids = snapshot.lab_ids
+    for s, sid in enumerate(snapshot.student_ids):
+        feed(sid, repr(float(snapshot.gpa[s])), *(lab_ids[lab] for lab in snapshot.prefs[s]))
+    feed('special')
+    for lab in sorted(snapshot.special):
+        # 特別希望枠は登録順に処理されるため順序も含める
+        feed(lab_ids[lab], *(snapshot.student_ids[s] for s in snapshot.special[lab]))
+    return h.hexdigest()
+
+
+def delta_hash(base_hash: str, delta: dict) -> str:
+    """凍結済みの入力（base_hash）に差分 delta を反映した入力の識別ハッシュ（増分再マッチング用）
+
+    全件を読み直さずに求めるため snapshot_hash とは一致しない。同じ起点・同じ差分なら同じ値になる。
+    """
+    h = hashlib.sha256()
+    h.update(base_hash.encode('utf-8'))
+    h.update(b'\x1e')
+    h.update(json.dumps(delta, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+class BatchCache:
+    def __init__(self, directory: Optional[str] = None, max_memory: int = 32, max_disk: int = 256):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._memory: 'OrderedDict[str, dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            record = self._memory.get(key)
+            if record is not None:
+                self._memory.move_to_end(key)
+                return record
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, record)
+        return record
+
+    def put(self, key: str, record: dict):
+        self._remember(key, record)
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(key) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+        self._evict_disk()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key: str, record: dict):
+        with self._lock:
+            self._memory[key] = record
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.json')]
+        except OSError:
+            return
+        if len(entries) <= self.max_disk:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,95 @@
+# バッチ間の差分
+# 2つのバッチ（BatchArrays）を研究室表・学生順序表で揃えた配列として比較し、
+# 配属先が変わった学生・研究室ごとの流入/流出・納得度分布の変化を求める。
+# 学生順序表が同じ（通常の再実行）なら並べ替えなしにそのまま比較する。
+
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from matching_storage import BatchArrays
+
+# 納得度分布の区間: 0-9, 10-19, …, 90-99, 100
+SATISFACTION_BUCKETS = [f"{k * 10}-{k * 10 + 9}" for k in range(10)] + ["100"]
+
+
+def _histogram(satisfaction: np.ndarray) -> np.ndarray:
+    return np.bincount(np.clip(satisfaction // 10, 0, 10), minlength=len(SATISFACTION_BUCKETS))
+
+
+class BatchDiff:
+    def __init__(self, lab_ids: List[str], student_ids: np.ndarray, before: np.ndarray, after: np.ndarray,
+                 sat_before: np.ndarray, sat_after: np.ndarray, hist_before: np.ndarray, hist_after: np.ndarray,
+                 only_in_from: int, only_in_to: int):
+        self.lab_ids = lab_ids
+        self.student_ids = student_ids  # 両方のバッチに含まれる学生のうち、配属先が変わった学生
+        self.before = before  # 共通の研究室表でのindex（未配属は-1）
+        self.after = after
+        self.sat_before = sat_before
+        self.sat_after = sat_after
+        self.hist_before = hist_before
+        self.hist_after = hist_after
+        self.only_in_from = only_in_from
+        self.only_in_to = only_in_to
+
+    def _lab(self, j: int) -> Optional[str]:
+        return self.lab_ids[j] if j >= 0 else None
+
+    def summary(self) -> dict:
+        return {
+            "moved": len(self.student_ids),
+            "only_in_from": self.only_in_from,
+            "only_in_to": self.only_in_to,
+            "satisfaction": {
+                "buckets": SATISFACTION_BUCKETS,
+                "from": self.hist_before.tolist(),
+                "to": self.hist_after.tolist(),
+                "delta": (self.hist_after - self.hist_before).tolist(),
+            },
+        }
+
+    def labs(self) -> List[dict]:
+        """研究室ごとの流入・流出（未配属との間の移動を含む）。変化のあった研究室のみ"""
+        m = len(self.lab_ids)
+        inflow = np.bincount(self.after[self.after >= 0], minlength=m)
+        outflow = np.bincount(self.before[self.before >= 0], minlength=m)
+        return [{"lab_id": self.lab_ids[j], "inflow": int(inflow[j]), "outflow": int(outflow[j]),
+                 "net": int(inflow[j] - outflow[j])}
+                for j in np.flatnonzero(inflow + outflow).tolist()]
+
+    def iter_moves(self) -> Iterator[dict]:
+        for sid, a, b, sa, sb in zip(self.student_ids.tolist(), self.before.tolist(), self.after.tolist(),
+                                     self.sat_before.tolist(), self.sat_after.tolist()):
+            yield {"student_id": sid, "from_lab": self._lab(a), "to_lab": self._lab(b),
+                   "from_satisfaction": sa, "to_satisfaction": sb, "satisfaction_delta": sb - sa}
+
+
+def diff_batches(old: BatchArrays, new: BatchArrays) -> BatchDiff:
+    # 研究室表を揃える（new側の研究室indexを old 側の表に写す）
+    lab_ids = list(old.lab_ids)
+    lab_index = {lab_id: j for j, lab_id in enumerate(lab_ids)}
+    for lab_id in new.lab_ids:
+        if lab_id not in lab_index:
+            lab_index[lab_id] = len(lab_ids)
+            lab_ids.append(lab_id)
+    remap = np.asarray([lab_index[lab_id] for lab_id in new.lab_ids] + [-1], dtype=np.int32)
+    new_assignment = remap[new.assignment]
+
+    # 学生順序表を揃える
+    if old.student_ids == new.student_ids:
+        ids = np.asarray(old.student_ids, dtype=object)
+        i = j = slice(None)
+        only_old = only_new = 0
+    else:
+        old_ids = np.asarray(old.student_ids, dtype=str)
+        new_ids = np.asarray(new.student_ids, dtype=str)
+        common, i, j = np.intersect1d(old_ids, new_ids, assume_unique=True, return_indices=True)
+        ids = common.astype(object)
+        only_old = len(old_ids) - len(common)
+        only_new = len(new_ids) - len(common)
+    before = old.assignment[i]
+    after = new_assignment[j]
+    changed = np.flatnonzero(before != after)
+    return BatchDiff(lab_ids, ids[changed], before[changed], after[changed],
+                     old.satisfaction[i][changed], new.satisfaction[j][changed],
+                     _histogram(old.satisfaction), _histogram(new.satisfaction), only_old, only_new)
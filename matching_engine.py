@@ -0,0 +1,216 @@
+# 学生提案型 Deferred Acceptance（Gale-Shapley法）マッチングエンジン
+# app.run_matching / lab_matching_demo / lab_matching_db_sample から共通で利用する
+#
+# 入力は整数インデックスで表現する:
+#   prefs[s]    : 学生sの希望研究室インデックス（希望順）
+#   gpa[s]      : 学生sのGPA
+#   capacity[l] : 研究室lの定員
+#   special     : {研究室インデックス: [学生インデックス, ...]}（特別希望枠）
+#
+# 各研究室は (GPA, -希望順位, -学生index) をキーとする定員サイズの最小ヒープを持ち、
+# 先頭（最も弱い仮配属者）との比較だけで入れ替えを判断する。
+# 学生の希望ポインタは単調に進むため提案回数は希望総数以下となり、
+# 計算量は O(希望総数 · log 定員) で必ず停止する。
+
+import heapq
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from matching_trace import MatchingTrace
+
+ENGINE_VERSION = 'da-heap-1'
+
+# キャンセル確認の間隔（提案回数）
+CANCEL_CHECK_INTERVAL = 4096
+
+
+class MatchingCancelled(Exception):
+    pass
+
+
+class MatchingOutcome:
+    def __init__(self, assignment: List[int], ranks: List[int], proposals: int, rejections: int,
+                 extra: Optional[dict] = None, trace: Optional[MatchingTrace] = None):
+        self.assignment = assignment  # 学生index → 研究室index（未配属は-1）
+        self.ranks = ranks  # 配属先の希望順位（1始まり、未配属・希望外は0）
+        self.proposals = proposals
+        self.rejections = rejections
+        self.extra = extra or {}  # 方式固有の計測値・フラグ
+        self.trace = trace  # 事象トレース（記録した場合のみ）
+
+
+def satisfaction_score(rank: int, num_prefs: int) -> int:
+    """希望順位から納得度（%）を算出する。未配属・希望外は0"""
+    if rank <= 0 or num_prefs <= 0:
+        return 0
+    return int(100 * (1 - (rank - 1) / num_prefs))
+
+
+def rank_index(p: Sequence[int]) -> Dict[int, int]:
+    """希望リストから {研究室index: 希望順位（1始まり）} を作る（重複は先の順位）"""
+    ranks: Dict[int, int] = {}
+    for k, lab in enumerate(p, start=1):
+        ranks.setdefault(lab, k)
+    return ranks
+
+
+def prefs_rank(prefs: Sequence[Sequence[int]]) -> Callable[[int, int], int]:
+    """学生s・研究室labの希望順位（1始まり、希望外は0）を返す関数
+
+    学生ごとの順位表（rank_index）は初回の参照時に1回だけ作り、以後は辞書で引く。
+    """
+    index: Dict[int, Dict[int, int]] = {}
+
+    def rank(s: int, lab: int) -> int:
+        ranks = index.get(s)
+        if ranks is None:
+            ranks = index[s] = rank_index(prefs[s])
+        return ranks.get(lab, 0)
+    return rank
+
+
+def assign_special_seats(special: Optional[Dict[int, Sequence[int]]], num_students: int,
+                         seats: List[int], rank: Optional[Callable[[int, int], int]] = None) -> List[int]:
+    """特別希望枠の事前配属。seatsは残り定員として減算される
+
+    複数の研究室の特別希望枠に登録された学生は、希望順位の高い研究室から順に申し込む
+    （希望外は最後、同順位は研究室index順。rank省略時は研究室index順）。各研究室は登録順に
+    定員まで受け入れ、より先に登録された学生が来れば最後に登録された学生を押し出す。
+    結果は登録の処理順に依存せず決まる。
+    """
+    assignment = [-1] * num_students
+    if not special:
+        return assignment
+    # 学生 → 申込先の研究室、(研究室, 学生) → 登録順
+    claims: Dict[int, List[int]] = {}
+    position: Dict[Tuple[int, int], int] = {}
+    for lab in special:
+        for pos, s in enumerate(special[lab]):
+            if (lab, s) not in position:
+                position[(lab, s)] = pos
+                claims.setdefault(s, []).append(lab)
+    unranked = float('inf')
+    for s, labs in claims.items():
+        if rank is None:
+            labs.sort()
+        else:
+            labs.sort(key=lambda lab: (rank(s, lab) or unranked, lab))
+    # 研究室ごとに (-登録順, 学生) の最小ヒープ（先頭が最後に登録された学生）
+    held: Dict[int, List[Tuple[int, int]]] = {}
+    next_claim = dict.fromkeys(claims, 0)
+    free = sorted(claims, reverse=True)
+    while free:
+        s = free.pop()
+        labs = claims[s]
+        k = next_claim[s]
+        while k < len(labs):
+            lab = labs[k]
+            k += 1
+            h = held.setdefault(lab, [])
+            key = (-position[(lab, s)], s)
+            if len(h) < seats[lab]:
+                heapq.heappush(h, key)
+                assignment[s] = lab
+                break
+            if h and key > h[0]:
+                loser = heapq.heapreplace(h, key)[1]
+                assignment[s] = lab
+                assignment[loser] = -1
+                free.append(loser)
+                break
+        next_claim[s] = k
+    for lab, h in held.items():
+        seats[lab] -= len(h)
+    return assignment
+
+
+def deferred_acceptance(prefs: Sequence[Sequence[int]], gpa: Sequence[float], capacity: Sequence[int],
+                        special: Optional[Dict[int, Sequence[int]]] = None,
+                        should_stop: Optional[Callable[[], bool]] = None,
+                        trace: Optional[MatchingTrace] = None) -> MatchingOutcome:
+    """trace を渡すと押し出しと提案数を記録する（拒否はそこから復元する。MatchingOutcome.trace）"""
+    num_students = len(prefs)
+    seats = list(capacity)
+    assignment = assign_special_seats(special, num_students, seats, prefs_rank(prefs))
+    tracing = trace is not None
+    if tracing:
+        # ループ内では押し出しのときだけ確保済みの配列へ直接書く（matching_trace）
+        trace.start(prefs, assignment)
+        displaced, displaced_rank, displaced_by, t = trace.displaced, trace.rank, trace.by, 0
+    next_choice = [0] * num_students
+    heaps: List[List[Tuple[float, int, int]]] = [[] for _ in seats]
+    free = [s for s in range(num_students - 1, -1, -1) if assignment[s] < 0]
+    proposals = 0
+    rejections = 0
+    heappush = heapq.heappush
+    heapreplace = heapq.heapreplace
+
+    while free:
+        s = free.pop()
+        p = prefs[s]
+        k = next_choice[s]
+        g = gpa[s]
+        while k < len(p):
+            lab = p[k]
+            k += 1
+            proposals += 1
+            if should_stop is not None and not proposals % CANCEL_CHECK_INTERVAL and should_stop():
+                raise MatchingCancelled()
+            cap = seats[lab]
+            h = heaps[lab]
+            key = (g, -k, -s)
+            if len(h) < cap:
+                heappush(h, key)
+                assignment[s] = lab
+                break
+            if cap > 0 and key > h[0]:
+                # 最も弱い仮配属者を押し出す
+                weakest = heapreplace(h, key)
+                loser = -weakest[2]
+                assignment[s] = lab
+                assignment[loser] = -1
+                free.append(loser)
+                rejections += 1
+                if tracing:
+                    displaced[t] = loser
+                    displaced_rank[t] = -weakest[1]
+                    displaced_by[t] = s
+                    t += 1
+                break
+            rejections += 1
+        next_choice[s] = k
+    if tracing:
+        trace.finish(t, next_choice, assignment, seats)
+
+    ranks = [0] * num_students
+    for s in range(num_students):
+        lab = assignment[s]
+        if lab >= 0:
+            p = prefs[s]
+            # 特別枠配属者は希望リストを辿っていないため位置を探す
+            k = next_choice[s]
+            if k > 0 and p[k - 1] == lab:
+                ranks[s] = k
+            elif lab in p:
+                ranks[s] = list(p).index(lab) + 1
+    return MatchingOutcome(assignment, ranks, proposals, rejections, trace=trace)
+
+
+def match_by_ids(student_ids: Sequence[str], gpas: Sequence[Optional[float]],
+                 student_prefs: Dict[str, Sequence[str]], lab_ids: Sequence[str],
+                 capacities: Sequence[int], special: Optional[Dict[str, Sequence[str]]] = None
+                 ) -> Dict[str, Tuple[Optional[str], int]]:
+    """ID（文字列）ベースの入力をエンジンに渡し、{student_id: (lab_id, 納得度)} を返す"""
+    lab_index = {lab_id: i for i, lab_id in enumerate(lab_ids)}
+    student_index = {sid: i for i, sid in enumerate(student_ids)}
+    prefs = [[lab_index[l] for l in student_prefs.get(sid, []) if l in lab_index] for sid in student_ids]
+    gpa = [g if g is not None else 0.0 for g in gpas]
+    special_idx = {}
+    for lab_id, sids in (special or {}).items():
+        if lab_id in lab_index:
+            special_idx[lab_index[lab_id]] = [student_index[sid] for sid in sids if sid in student_index]
+    outcome = deferred_acceptance(prefs, gpa, capacities, special_idx)
+    result = {}
+    for s, sid in enumerate(student_ids):
+        lab = outcome.assignment[s]
+        result[sid] = (lab_ids[lab] if lab >= 0 else None, satisfaction_score(outcome.ranks[s], len(prefs[s])))
+    return result
@@ -0,0 +1,252 @@
+# 増分再マッチング
+# 公開済みバッチ（安定マッチング）を起点に、一部の学生の希望変更や研究室の定員変更の
+# 影響を受ける連鎖だけを再生して、全件再実行と同じ結果を得る。
+#
+#  1. 希望を変更した学生をいったん市場から外し、空いた席と定員増加分の席を
+#     「空席連鎖」で埋める。空席ができた研究室は、その研究室を現在の配属先より
+#     上位に希望している学生のうち優先度（GPA, 希望順位）が最も高い学生を迎え入れ、
+#     その学生が抜けた研究室で同じ処理を続ける（学生側が良くなる方向の更新）。
+#  2. 定員減少分を最も弱い配属者から差し戻し、希望を変更した学生とあわせて
+#     通常のDeferred Acceptanceを続きから実行する（学生側が悪くなる方向の更新）。
+# 費用は連鎖で辿った提案・空席の数に比例する。希望は連鎖で辿った学生の分だけ展開し、
+# 研究室ごとの配属者・希望者は配列から研究室単位で抽出する（全学生の走査はNumPy側のみ）。
+
+import heapq
+from collections.abc import Sequence as SequenceABC
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from matching_engine import MatchingOutcome, assign_special_seats, deferred_acceptance
+
+
+class IncrementalState:
+    def __init__(self, snapshot, assignment: Sequence[int], fixed: set):
+        self.snapshot = snapshot
+        self.fixed = fixed  # 特別希望枠で固定された学生
+        self.prefs = snapshot.pref_view
+        self.rank = snapshot.pref_rank
+        self.gpa = snapshot.gpa
+        self.assignment = list(assignment)
+        self._base = np.asarray(self.assignment, dtype=np.int32)  # 起点の配属（配属者の抽出用）
+        self._ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32)
+        self._lab = np.frombuffer(snapshot.pref_lab, dtype=np.int32)
+        self._pointer: Dict[int, int] = {}
+        self._heaps: Dict[int, list] = {}
+        self._applicants: Dict[int, List[tuple]] = {}
+        self.touched = set()  # 配属を動かした学生
+        self.proposals = 0
+        self.rejections = 0
+
+    # --- 学生の状態 ---
+    def pointer(self, s: int) -> int:
+        """次に提案する希望の位置（= 現在の配属先の希望順位）。未配属なら希望を使い切っている"""
+        k = self._pointer.get(s)
+        if k is None:
+            lab = self.assignment[s]
+            k = self.rank(s, lab) if lab >= 0 else len(self.prefs[s])
+            self._pointer[s] = k
+        return k
+
+    def key(self, s: int, lab: int, rank: int):
+        return (self.gpa[s], -rank, -s)
+
+    # --- 研究室の状態（触れた研究室だけヒープを作る） ---
+    def members(self, lab: int) -> List[int]:
+        # 研究室への移動はヒープを作ってから行うため、作る時点の配属者は起点の配属者のうち残っている学生
+        return [s for s in np.flatnonzero(self._base == lab).tolist() if self.assignment[s] == lab]
+
+    def heap(self, lab: int) -> list:
+        h = self._heaps.get(lab)
+        if h is None:
+            h = [self.key(s, lab, self.pointer(s)) for s in self.members(lab) if s not in self.fixed]
+            heapq.heapify(h)
+            self._heaps[lab] = h
+        return h
+
+    def remove(self, s: int):
+        lab = self.assignment[s]
+        h = self.heap(lab)
+        h.remove(self.key(s, lab, self.pointer(s)))
+        heapq.heapify(h)
+        self.assignment[s] = -1
+        self._pointer[s] = len(self.prefs[s])
+        self.touched.add(s)
+
+    def admit(self, s: int, lab: int):
+        self.assignment[s] = lab
+        heapq.heappush(self.heap(lab), self.key(s, lab, self.pointer(s)))
+        self.touched.add(s)
+
+    # --- 研究室ごとの希望者一覧（優先度の高い順、必要な研究室だけ作る） ---
+    def applicants(self, lab: int) -> List[tuple]:
+        """[(学生index, 希望順位), ...]"""
+        result = self._applicants.get(lab)
+        if result is None:
+            pos = np.flatnonzero(self._lab == lab)
+            students = np.searchsorted(self._ptr, pos, side='right') - 1
+            ranks = pos - self._ptr[students] + 1
+            gpa = np.frombuffer(self.gpa, dtype=np.float64)[students]
+            # 優先度キー (GPA, -希望順位, -学生index) の降順
+            order = np.lexsort((students, ranks, -gpa))
+            result = self._applicants[lab] = list(zip(students[order].tolist(), ranks[order].tolist()))
+        return result
+
+    # --- 空席連鎖 ---
+    def fill_vacancy(self, lab: int, seats: List[int], excluded: set):
+        while lab >= 0 and len(self.heap(lab)) < seats[lab]:
+            moved, moved_rank = -1, 0
+            for t, rank in self.applicants(lab):
+                if t in excluded or t in self.fixed:
+                    continue
+                self.proposals += 1
+                if rank < self.pointer(t) or self.assignment[t] < 0:
+                    moved, moved_rank = t, rank
+                    break
+            if moved < 0:
+                return
+            previous = self.assignment[moved]
+            if previous >= 0:
+                self.remove(moved)
+            self._pointer[moved] = moved_rank
+            self.admit(moved, lab)
+            lab = previous
+
+    # --- 通常のDeferred Acceptanceの続き ---
+    def propose(self, free: List[int], seats: List[int]):
+        while free:
+            s = free.pop()
+            p = self.prefs[s]
+            k = self.pointer(s)
+            while k < len(p):
+                lab = p[k]
+                k += 1
+                self.proposals += 1
+                self._pointer[s] = k
+                h = self.heap(lab)
+                key = self.key(s, lab, k)
+                if len(h) < seats[lab]:
+                    heapq.heappush(h, key)
+                    self.assignment[s] = lab
+                    self.touched.add(s)
+                    break
+                if seats[lab] > 0 and key > h[0]:
+                    loser = -heapq.heapreplace(h, key)[2]
+                    self.assignment[s] = lab
+                    self.assignment[loser] = -1
+                    self.touched.update((s, loser))
+                    free.append(loser)
+                    self.rejections += 1
+                    break
+                self.rejections += 1
+            self._pointer[s] = k
+
+
+class IncrementalRanks(SequenceABC):
+    """増分再マッチング後の配属先の希望順位（参照した学生の分だけ求める）"""
+
+    def __init__(self, state: IncrementalState):
+        self.state = state
+
+    def __len__(self) -> int:
+        return len(self.state.assignment)
+
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [self[i] for i in range(*s.indices(len(self)))]
+        state = self.state
+        lab = state.assignment[s]
+        if lab < 0:
+            return 0
+        if s not in state.fixed:
+            return state.pointer(s)
+        return state.rank(s, lab)
+
+
+def vacated_seats(base_snapshot, base_assignment: Sequence[int], removed: Iterable[int]
+                  ) -> Tuple[List[int], List[int]]:
+    """削除された学生（起点の入力の学生index）が抜けた研究室indexを (通常の席, 特別希望枠の席) に分けて返す"""
+    removed = list(removed)
+    if not removed:
+        return [], []
+    fixed = assign_special_seats(base_snapshot.special, base_snapshot.num_students, list(base_snapshot.capacity),
+                                 base_snapshot.pref_rank)
+    vacated: List[int] = []
+    vacated_special: List[int] = []
+    for s in removed:
+        if fixed[s] >= 0:
+            vacated_special.append(fixed[s])
+        elif base_assignment[s] >= 0:
+            vacated.append(int(base_assignment[s]))
+    return vacated, vacated_special
+
+
+def rematch_incremental(snapshot, assignment: Sequence[int], changed_students: Iterable[int] = (),
+                        old_capacity: Optional[Dict[int, int]] = None,
+                        vacated: Iterable[int] = (), vacated_special: Iterable[int] = ()) -> MatchingOutcome:
+    """前回の安定マッチング assignment を起点に増分再マッチングを行う
+
+    snapshot は変更後の入力、changed_students は希望を変更した（または新規の）学生index、
+    old_capacity は定員を変更した研究室の {研究室index: 変更前の定員}、
+    vacated・vacated_special は削除された学生が抜けた研究室index（1人につき1件。vacated_seats）。
+    結果の ranks は参照時に求める。extra["touched"] は変更学生と配属が動いた学生の学生index。
+    """
+    old_capacity = old_capacity or {}
+    changed = sorted(set(changed_students))
+    vacated_special = list(vacated_special)
+    seats = list(snapshot.capacity)
+    rank = snapshot.pref_rank
+    fixed_assignment = assign_special_seats(snapshot.special, snapshot.num_students, seats, rank)
+    old_seats = list(snapshot.capacity)
+    for lab, old in old_capacity.items():
+        old_seats[lab] = old
+    fixed = {s for members in snapshot.special.values() for s in members if fixed_assignment[s] >= 0}
+    # 特別希望枠の配属者の削除は、その席が次の登録者に移るため空席連鎖では扱えない
+    if vacated_special or any(s in fixed for s in changed) or \
+            assign_special_seats(snapshot.special, snapshot.num_students, old_seats, rank) != fixed_assignment:
+        # 特別希望枠の割当が変わる変更は全件再実行する
+        outcome = deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity, snapshot.special)
+        moved = np.flatnonzero(np.asarray(outcome.assignment, dtype=np.int32) != np.asarray(assignment, dtype=np.int32))
+        outcome.extra["touched"] = sorted(set(moved.tolist()) | set(changed))
+        outcome.extra["full_rerun"] = True
+        return outcome
+
+    state = IncrementalState(snapshot, assignment, fixed)
+    special_count = {}
+    for s in fixed:
+        special_count[fixed_assignment[s]] = special_count.get(fixed_assignment[s], 0) + 1
+
+    # 1. 変更学生を外し、空席・定員増加分を空席連鎖で埋める
+    vacancies = list(vacated)
+    excluded = set(changed)
+    state.touched.update(changed)
+    for s in changed:
+        # 変更前の希望順位は不明なため、ヒープを作る前に配属から外しておく
+        if state.assignment[s] >= 0:
+            vacancies.append(state.assignment[s])
+            state.assignment[s] = -1
+        state._pointer[s] = 0
+    interim = list(seats)
+    for lab, old in old_capacity.items():
+        old_seats = max(old - special_count.get(lab, 0), 0)
+        if old_seats < seats[lab]:
+            vacancies.extend([lab] * (seats[lab] - old_seats))
+        else:
+            interim[lab] = old_seats
+    for lab in vacancies:
+        state.fill_vacancy(lab, interim, excluded)
+
+    # 2. 定員減少分を差し戻し、変更学生とあわせて提案を続ける
+    free = list(reversed(changed))
+    for lab, old in old_capacity.items():
+        h = state.heap(lab)
+        while len(h) > seats[lab]:
+            loser = -heapq.heappop(h)[2]
+            state.assignment[loser] = -1
+            state.touched.add(loser)
+            state.rejections += 1
+            free.append(loser)
+    state.propose(free, seats)
+
+    return MatchingOutcome(state.assignment, IncrementalRanks(state), state.proposals, state.rejections,
+                           extra={"touched": sorted(state.touched), "full_rerun": False})
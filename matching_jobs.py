@@ -0,0 +1,131 @@
+# マッチングジョブのバックグラウンド実行
+# プロセス内のワーカープールでジョブを実行し、フェーズごとの進捗・所要時間を記録する。
+# キャンセルは協調的に行い、エンジン側は should_stop() を定期的に確認して中断する。
+
+import datetime
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+from matching_engine import MatchingCancelled
+
+# ジョブ状態
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def new_batch_id() -> str:
+    """実行単位ID（例: 20251211-093000-1a2b3c）"""
+    return f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+class JobContext:
+    def __init__(self, job_id: str, phases: List[str], report: Optional[Callable[['JobContext'], None]] = None):
+        self.job_id = job_id
+        self.phases = phases
+        self.status = QUEUED
+        self.phase: Optional[str] = None
+        self.progress = 0.0
+        self.timings: Dict[str, float] = {}  # フェーズ名 → 所要時間（ミリ秒）
+        self.error: Optional[str] = None
+        self.started_at: Optional[datetime.datetime] = None
+        self.finished_at: Optional[datetime.datetime] = None
+        self._report = report
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise MatchingCancelled(self.job_id)
+
+    def report(self):
+        if self._report is not None:
+            self._report(self)
+
+    @contextmanager
+    def phase_timer(self, name: str):
+        """フェーズの開始・終了を記録する（開始前にキャンセルを確認）"""
+        self.check_cancelled()
+        self.phase = name
+        self.report()
+        start = time.perf_counter()
+        yield
+        self.timings[name] = round((time.perf_counter() - start) * 1000, 3)
+        if name in self.phases:
+            self.progress = round((self.phases.index(name) + 1) / len(self.phases), 3)
+        self.report()
+
+
+class MatchingJobRunner:
+    def __init__(self, max_workers: int = 2, context: Optional[Callable] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='matching')
+        self._context = context or nullcontext  # ワーカースレッドで有効にするコンテキスト（app.app_context等）
+        self._jobs: Dict[str, JobContext] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str, fn: Callable[[JobContext], None], phases: List[str],
+               report: Optional[Callable[[JobContext], None]] = None) -> JobContext:
+        ctx = JobContext(job_id, phases, report)
+        with self._lock:
+            self._jobs[job_id] = ctx
+            self._futures[job_id] = self._executor.submit(self._run, ctx, fn)
+        return ctx
+
+    def get(self, job_id: str) -> Optional[JobContext]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        ctx = self._jobs.get(job_id)
+        if ctx is None or ctx.status in FINISHED_STATUSES:
+            return False
+        ctx.cancel()
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[JobContext]:
+        with self._lock:
+            ctx = self._jobs.get(job_id)
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return ctx
+
+    def _run(self, ctx: JobContext, fn: Callable[[JobContext], None]):
+        with self._context():
+            try:
+                if ctx.cancelled():
+                    ctx.status = CANCELLED
+                    return
+                ctx.status = RUNNING
+                ctx.started_at = datetime.datetime.now()
+                ctx.report()
+                fn(ctx)
+                ctx.status = SUCCEEDED
+                ctx.progress = 1.0
+            except MatchingCancelled:
+                ctx.status = CANCELLED
+            except Exception as e:
+                ctx.status = FAILED
+                ctx.error = str(e)
+            finally:
+                ctx.finished_at = datetime.datetime.now()
+                try:
+                    ctx.report()
+                except Exception:
+                    pass
+                with self._lock:
+                    # 終了済みジョブの状態はDB側で保持する
+                    self._jobs.pop(ctx.job_id, None)
+                    self._futures.pop(ctx.job_id, None)
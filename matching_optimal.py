@@ -0,0 +1,210 @@
+# 総納得度を最大化する最適配属（最小費用流）
+# 学生→研究室の希望辺だけを持つ疎なグラフ上で、逐次最短路法（Successive Shortest Path）により
+# Σ納得度 を最大化し、同点なら配属人数を最大化する。外部ソルバーは使わない。
+# 辺の費用はスナップショットの希望（CSR: pref_ptr / pref_lab）と同じ並びの配列に持ち、
+# メモリは希望総数と研究室数の2乗に比例する（学生数×研究室数の行列は作らない）。
+#
+# 学生ノードは研究室のポテンシャルだけで消去できる（学生sが研究室A→Bへ移る合成辺の
+# 被約費用は c(s,B) - c(s,A) + π_A - π_B）ため、最短路計算は研究室数 m の密行列上の
+# Dijkstra（O(m²)）で済み、学生数には比例しない。1回の最短路計算の後は被約費用0の辺だけを
+# 辿る増加路を見つからなくなるまで続けて流す（primal-dual）。
+#
+# time_budget を超えた場合はその時点の流れ（その人数での最適配属）に、残りの学生を
+# 希望順の貪欲法で空き定員へ配属した暫定解を返す（extra["optimal"] が False）。
+
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from matching_arrays import satisfaction_array
+from matching_engine import MatchingCancelled, MatchingOutcome, assign_special_seats, satisfaction_score
+
+INF = np.int64(1) << 60  # 距離・ポテンシャル用の無限大
+NO_EDGE = 1 << 30  # 研究室間の合成辺が無いことを表す値（費用の差より十分大きい）
+
+
+def max_satisfaction_assignment(snapshot, time_budget: Optional[float] = None,
+                                should_stop: Optional[Callable[[], bool]] = None) -> MatchingOutcome:
+    start = time.perf_counter()
+    deadline = start + time_budget if time_budget is not None else None
+    n, m = snapshot.num_students, snapshot.num_labs
+    prefs = snapshot.prefs
+    seats = list(snapshot.capacity)
+    assignment = assign_special_seats(snapshot.special, n, seats, snapshot.pref_rank)
+    fixed = np.asarray(assignment, dtype=np.int64) >= 0
+    cap = np.asarray(seats, dtype=np.int64)
+
+    # 希望辺（CSRの並び）: 学生 pref_owner[e] → 研究室 pref_lab[e]、費用 edge_cost[e]
+    # 費用 = -(納得度 · (n+1) + 1)。納得度の総和を最優先し、同点なら配属人数の多い方を選ぶ
+    pref_ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32).astype(np.int64)
+    pref_lab = np.frombuffer(snapshot.pref_lab, dtype=np.int32).astype(np.int64)
+    lengths = np.diff(pref_ptr)
+    pref_owner = np.repeat(np.arange(n, dtype=np.int64), lengths)
+    edge_rank = np.arange(len(pref_lab), dtype=np.int64) - pref_ptr[pref_owner] + 1
+    edge_cost = -(satisfaction_array(edge_rank, lengths[pref_owner]).astype(np.int64) * (n + 1) + 1)
+    free_edges = ~fixed[pref_owner]
+    rows, cols, vals = pref_owner[free_edges], pref_lab[free_edges], edge_cost[free_edges]
+    current_cost = np.zeros(n, dtype=np.int64)  # 学生の現在の配属先の辺の費用
+
+    def edges_of(idx):
+        """学生 idx の希望辺の位置と、各辺が idx の何番目の学生のものか"""
+        counts = lengths[idx]
+        offsets = np.repeat(pref_ptr[idx] - (np.cumsum(counts) - counts), counts)
+        return offsets + np.arange(int(counts.sum()), dtype=np.int64), np.repeat(np.arange(len(idx)), counts)
+
+    def place(s, lab):
+        assignment[s] = lab
+        current_cost[s] = edge_cost[pref_ptr[s] + snapshot.pref_rank(s, lab) - 1]
+
+    # 研究室ごとの未配属の希望者（費用の昇順）。先頭から配属済みの学生を読み飛ばして使う
+    order = np.lexsort((rows, vals, cols))
+    applicants = np.split(rows[order], np.searchsorted(cols[order], np.arange(1, m)))
+    applicant_cost = np.split(vals[order], np.searchsorted(cols[order], np.arange(1, m)))
+    head = [0] * m
+    best_free = np.full(m, INF, dtype=np.int64)
+
+    def refresh_best_free(labs):
+        for lab in labs:
+            students = applicants[lab]
+            k = head[lab]
+            while k < len(students) and assignment[students[k]] >= 0:
+                k += 1
+            head[lab] = k
+            best_free[lab] = applicant_cost[lab][k] if k < len(students) else INF
+
+    # 研究室間の合成辺: move[A, B] = min_{s∈A} c(s,B) - c(s,A)（NO_EDGE以上は辺なし）
+    members: List[List[int]] = [[] for _ in range(m)]
+    held = np.zeros(m, dtype=np.int64)
+    move = np.full((m, m), NO_EDGE, dtype=np.int64)
+
+    def refresh_moves(lab):
+        move[lab] = NO_EDGE
+        if not members[lab]:
+            return
+        idx = np.asarray(members[lab], dtype=np.int64)
+        edges, owner = edges_of(idx)
+        np.minimum.at(move[lab], pref_lab[edges], edge_cost[edges] - current_cost[idx][owner])
+        move[lab, lab] = NO_EDGE
+
+    def mover(a, b) -> int:
+        idx = np.asarray(members[a], dtype=np.int64)
+        edges, owner = edges_of(idx)
+        hit = pref_lab[edges] == b
+        gain = edge_cost[edges][hit] - current_cost[idx][owner[hit]]
+        return members[a][int(owner[hit][int(gain.argmin())])]
+
+    # 初期ポテンシャル（流量0では全ての辺の被約費用が非負になるよう取る）
+    refresh_best_free(range(m))
+    pi = np.where(best_free < INF, best_free, 0).astype(np.int64)
+    pi_sink = int(pi.min()) if m else 0
+
+    def dijkstra() -> Optional[int]:
+        """被約費用で最短距離を求めてポテンシャルを更新し、シンクまでの実費用を返す"""
+        nonlocal pi_sink
+        dist = np.where(best_free < INF, best_free - pi, INF)
+        done = np.zeros(m, dtype=bool)
+        dist_sink = INF
+        for _ in range(m):
+            masked = np.where(done, INF, dist)
+            u = int(masked.argmin())
+            du = masked[u]
+            if du >= INF or du >= dist_sink:
+                break
+            done[u] = True
+            if held[u] < cap[u]:
+                dist_sink = min(dist_sink, du + pi[u] - pi_sink)
+            row = move[u]
+            valid = (row < NO_EDGE) & ~done
+            candidate = du + row[valid] + pi[u] - pi[valid]
+            target = dist[valid]
+            dist[valid] = np.minimum(target, candidate)
+        if dist_sink >= INF:
+            return None
+        pi[:] += np.minimum(dist, dist_sink)
+        pi_sink += int(dist_sink)
+        return pi_sink
+
+    def find_path() -> Optional[List[int]]:
+        """被約費用0の辺だけで source → 研究室… → sink の経路を幅優先で探す"""
+        frontier = (best_free < INF) & (best_free == pi)
+        sink = (held < cap) & (pi == pi_sink)
+        admissible = None
+        visited = frontier.copy()
+        parent = np.full(m, -1, dtype=np.int64)
+        while frontier.any():
+            hit = np.flatnonzero(frontier & sink)
+            if len(hit):
+                path = [int(hit[0])]
+                while parent[path[-1]] >= 0:
+                    path.append(int(parent[path[-1]]))
+                return path[::-1]
+            if admissible is None:
+                admissible = (move < NO_EDGE) & (move + pi[:, None] - pi[None, :] == 0)
+            labs = np.flatnonzero(frontier)
+            reach = admissible[labs]
+            frontier = reach.any(axis=0) & ~visited
+            nxt = np.flatnonzero(frontier)
+            parent[nxt] = labs[reach[:, nxt].argmax(axis=0)]
+            visited |= frontier
+        return None
+
+    augmentations = 0
+    moves = 0
+    optimal = True
+    while True:
+        if should_stop is not None and should_stop():
+            raise MatchingCancelled()
+        if deadline is not None and time.perf_counter() > deadline:
+            optimal = False
+            break
+        path_cost = dijkstra()
+        if path_cost is None or path_cost >= 0:
+            break
+        while True:
+            path = find_path()
+            if path is None:
+                break
+            # 先頭の研究室へ未配属の学生を入れ、以降は合成辺の学生を順に移す
+            first = path[0]
+            s = int(applicants[first][head[first]])
+            place(s, first)
+            members[first].append(s)
+            held[first] += 1
+            for a, b in zip(path, path[1:]):
+                t = mover(a, b)
+                members[a].remove(t)
+                members[b].append(t)
+                held[a] -= 1
+                held[b] += 1
+                place(t, b)
+                moves += 1
+            for lab in path:
+                refresh_moves(lab)
+            refresh_best_free(prefs[s])
+            augmentations += 1
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+    if not optimal:
+        # 暫定解: 残りの学生を希望順に空き定員へ配属する
+        remaining = cap - held
+        for s, p in enumerate(prefs):
+            if assignment[s] < 0:
+                for lab in p:
+                    if remaining[lab] > 0:
+                        remaining[lab] -= 1
+                        assignment[s] = lab
+                        break
+
+    ranks = [0] * n
+    total = 0
+    for s, lab in enumerate(assignment):
+        if lab >= 0 and lab in prefs[s]:
+            ranks[s] = prefs[s].index(lab) + 1
+            total += satisfaction_score(ranks[s], len(prefs[s]))
+    return MatchingOutcome(assignment, ranks, augmentations, moves, extra={
+        "optimal": optimal,
+        "total_satisfaction": total,
+        "solve_ms": round((time.perf_counter() - start) * 1000, 3),
+    })
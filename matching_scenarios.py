@@ -0,0 +1,132 @@
+# What-ifシナリオシミュレータ
+# 1つのMatchingSnapshotに対して定員変更・希望数の上限・特別希望枠の有無などの
+# 上書きを適用したシナリオを並列に実行し、納得度分布・未配属数・研究室ごとの充足率を返す。
+# 入力はスナップショットのみでDBのテーブルには触れない。
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from matching_arrays import MatchingArrays, deferred_acceptance_np, satisfaction_array
+
+# 納得度ヒストグラムの区間（0-9, 10-19, ..., 90-99, 100）
+SATISFACTION_BINS = list(range(0, 101, 10)) + [101]
+
+
+class Scenario:
+    def __init__(self, name: str, capacity: Optional[Dict[str, int]] = None,
+                 max_preferences: Optional[int] = None, special_seats: bool = True,
+                 disable_special: Optional[List[str]] = None):
+        self.name = name
+        self.capacity = capacity or {}  # lab_id → 定員の上書き
+        self.max_preferences = max_preferences  # 希望数の上限（Noneは無制限）
+        self.special_seats = special_seats  # Falseで特別希望枠を全て無効化
+        self.disable_special = disable_special or []  # 特別希望枠を無効化する研究室・学生のID
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Scenario':
+        if not isinstance(data, dict) or not data.get('name'):
+            raise ValueError("シナリオにはnameが必須です")
+        capacity = data.get('capacity') or {}
+        if not isinstance(capacity, dict) or any(not isinstance(c, int) or c < 0 for c in capacity.values()):
+            raise ValueError("capacityは {lab_id: 0以上の整数} で指定してください")
+        max_preferences = data.get('max_preferences')
+        if max_preferences is not None and (not isinstance(max_preferences, int) or max_preferences < 0):
+            raise ValueError("max_preferencesは0以上の整数で指定してください")
+        special_seats = data.get('special_seats', True)
+        if not isinstance(special_seats, bool):
+            raise ValueError("special_seatsはtrue/falseで指定してください")
+        disable_special = data.get('disable_special', [])
+        if not isinstance(disable_special, list) or any(not isinstance(x, str) or not x for x in disable_special):
+            raise ValueError("disable_specialは研究室IDまたは学生IDのリストで指定してください")
+        return cls(data['name'], capacity, max_preferences, special_seats, disable_special)
+
+
+def apply_scenario(arrays: MatchingArrays, scenario: Scenario) -> MatchingArrays:
+    """上書きを適用した配列を作る（大きな行列は共有し、小さな配列のみ複製）"""
+    lab_index = {lab_id: i for i, lab_id in enumerate(arrays.lab_ids)}
+    capacity = arrays.capacity.copy()
+    for lab_id, cap in scenario.capacity.items():
+        if lab_id not in lab_index:
+            raise ValueError(f"研究室 {lab_id} は存在しません")
+        capacity[lab_index[lab_id]] = cap
+    pref_len = arrays.pref_len
+    if scenario.max_preferences is not None:
+        pref_len = np.minimum(pref_len, scenario.max_preferences).astype(np.int32)
+    special = {}
+    if scenario.special_seats:
+        # 研究室IDはその研究室の特別希望枠すべて、学生IDはその学生の特別希望枠を無効化する
+        disabled = {lab_index[x] for x in scenario.disable_special if x in lab_index}
+        students = [x for x in scenario.disable_special if x not in lab_index]
+        excluded = set()
+        if students:
+            student_index = {sid: i for i, sid in enumerate(arrays.student_ids)}
+            unknown = [sid for sid in students if sid not in student_index]
+            if unknown:
+                raise ValueError(f"存在しない研究室・学生が指定されています: {', '.join(unknown)}")
+            excluded = {student_index[sid] for sid in students}
+        special = {lab: [s for s in sids if s not in excluded]
+                   for lab, sids in arrays.special.items() if lab not in disabled}
+    return MatchingArrays(arrays.student_ids, arrays.lab_ids, arrays.pref, pref_len, arrays.inv_rank,
+                          arrays.gpa, capacity, special)
+
+
+def evaluate_scenario(arrays: MatchingArrays, scenario: Scenario) -> dict:
+    start = time.perf_counter()
+    variant = apply_scenario(arrays, scenario)
+    outcome = deferred_acceptance_np(variant)
+    ranks = outcome.ranks
+    # 希望数の上限で切り捨てられた順位の研究室（特別枠）は希望外扱い
+    ranks[ranks > variant.pref_len] = 0
+    satisfaction = satisfaction_array(ranks, variant.pref_len)
+    assigned = outcome.assignment >= 0
+    counts = np.bincount(outcome.assignment[assigned], minlength=variant.num_labs)
+    histogram, _ = np.histogram(satisfaction, bins=SATISFACTION_BINS)
+    fill_rate = {
+        lab_id: round(float(counts[i]) / int(variant.capacity[i]), 4) if variant.capacity[i] else None
+        for i, lab_id in enumerate(variant.lab_ids)
+    }
+    return {
+        "name": scenario.name,
+        "assigned": int(assigned.sum()),
+        "unassigned": int((~assigned).sum()),
+        "satisfaction": {
+            "mean": round(float(satisfaction.mean()), 2) if len(satisfaction) else 0,
+            "median": float(np.median(satisfaction)) if len(satisfaction) else 0,
+            "histogram": {f"{lo}-{min(hi - 1, 100)}": int(c)
+                          for lo, hi, c in zip(SATISFACTION_BINS, SATISFACTION_BINS[1:], histogram)},
+            "first_choice": int((ranks == 1).sum()),
+        },
+        "fill_rate": fill_rate,
+        "proposals": int(outcome.proposals),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+# --- ワーカープロセス側 ---
+_worker_arrays: Optional[MatchingArrays] = None
+
+
+def _init_worker(snapshot):
+    global _worker_arrays
+    _worker_arrays = MatchingArrays.from_snapshot(snapshot)
+
+
+def _run_in_worker(scenario: Scenario) -> dict:
+    return evaluate_scenario(_worker_arrays, scenario)
+
+
+def run_scenarios(snapshot, scenarios: List[Scenario], workers: Optional[int] = None) -> List[dict]:
+    """シナリオ群を実行し、入力順に結果を返す。workers<=1 または1件のみなら同一プロセスで実行"""
+    if workers is None:
+        workers = min(len(scenarios), multiprocessing.cpu_count())
+    if workers <= 1 or len(scenarios) <= 1:
+        arrays = MatchingArrays.from_snapshot(snapshot)
+        return [evaluate_scenario(arrays, scenario) for scenario in scenarios]
+    # スナップショットは各ワーカーに1回だけ渡し、配列化もワーカーごとに1回で済ませる
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(snapshot,)) as executor:
+        return list(executor.map(_run_in_worker, scenarios))
@@ -0,0 +1,375 @@
+# マッチング入力のスナップショット
+# 学生・研究室・希望・特別希望枠を固定回数の集合クエリで読み込み、
+# ORMオブジェクトではなく整数インデックスの配列・辞書として保持する
+#
+# 締切時点の入力は pack_snapshot で matching_input_snapshots の1行（配列を詰めたBLOB）に凍結し、
+# マッチングはその行を unpack_snapshot で復元して実行する。
+# 増分再マッチングは凍結済みの入力に変更のあった学生・研究室だけを patch_snapshot で反映する。
+
+import zlib
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from matching_engine import prefs_rank
+from matching_storage import pack_ids, unpack_ids
+
+
+class PrefsView:
+    """CSRの希望を学生ごとのリストとして参照する（参照した学生の分だけ展開してキャッシュする）"""
+
+    def __init__(self, pref_ptr: array, pref_lab: array):
+        self._ptr = pref_ptr
+        self._lab = pref_lab
+        self._cache: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ptr) - 1
+
+    def __getitem__(self, s: int) -> List[int]:
+        p = self._cache.get(s)
+        if p is None:
+            p = self._cache[s] = self._lab[self._ptr[s]:self._ptr[s + 1]].tolist()
+        return p
+
+
+class MatchingSnapshot:
+    def __init__(self, student_ids: List[str], gpa: array, lab_ids: List[str], capacity: array,
+                 pref_ptr: array, pref_lab: array, special: Dict[int, List[int]]):
+        self.student_ids = student_ids  # 学生index → student_id
+        self.gpa = gpa  # 学生index → GPA（未登録は0.0）
+        self.lab_ids = lab_ids  # 研究室index → lab_id
+        self.capacity = capacity  # 研究室index → 定員
+        # 希望はCSR形式: 学生sの希望は pref_lab[pref_ptr[s]:pref_ptr[s+1]]（希望順）
+        self.pref_ptr = pref_ptr
+        self.pref_lab = pref_lab
+        self.special = special  # 研究室index → [学生index, ...]
+        self._prefs: Optional[List[List[int]]] = None
+        self._pref_view: Optional[PrefsView] = None
+        self._pref_rank: Optional[Callable[[int, int], int]] = None
+        self._student_index: Optional[Dict[str, int]] = None
+        self._lab_index: Optional[Dict[str, int]] = None
+
+    def __getstate__(self):
+        # 展開済みの希望・順位表（関数）は渡さず、受け取った側で必要になってから作る
+        state = dict(self.__dict__)
+        state.update(_prefs=None, _pref_view=None, _pref_rank=None)
+        return state
+
+    @property
+    def num_students(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def num_labs(self) -> int:
+        return len(self.lab_ids)
+
+    @property
+    def prefs(self) -> List[List[int]]:
+        """学生ごとの希望リスト（エンジン入力用、初回アクセス時に展開）"""
+        if self._prefs is None:
+            ptr, labs = self.pref_ptr, self.pref_lab
+            self._prefs = [labs[ptr[s]:ptr[s + 1]].tolist() for s in range(self.num_students)]
+        return self._prefs
+
+    @property
+    def pref_view(self):
+        """学生ごとの希望（一部の学生だけを参照する処理用。展開済みなら prefs を返す）"""
+        if self._prefs is not None:
+            return self._prefs
+        if self._pref_view is None:
+            self._pref_view = PrefsView(self.pref_ptr, self.pref_lab)
+        return self._pref_view
+
+    @property
+    def pref_rank(self) -> Callable[[int, int], int]:
+        """希望順位 rank(s, lab)（1始まり、希望外は0）。学生ごとの順位表はスナップショットごとに1回だけ作る"""
+        if self._pref_rank is None:
+            self._pref_rank = prefs_rank(self.pref_view)
+        return self._pref_rank
+
+    @property
+    def student_index(self) -> Dict[str, int]:
+        if self._student_index is None:
+            self._student_index = {sid: i for i, sid in enumerate(self.student_ids)}
+        return self._student_index
+
+    @property
+    def lab_index(self) -> Dict[str, int]:
+        if self._lab_index is None:
+            self._lab_index = {lab_id: i for i, lab_id in enumerate(self.lab_ids)}
+        return self._lab_index
+
+    def indexes_of(self, student_ids: Iterable[str]) -> Dict[str, int]:
+        """指定した学生の {student_id: 学生index}（入力に無い学生は含まない）
+
+        少数の学生は student_index を作らずに探す。
+        """
+        student_ids = list(student_ids)
+        if self._student_index is not None or len(student_ids) > 16:
+            index = self.student_index
+            return {sid: index[sid] for sid in student_ids if sid in index}
+        found = {}
+        for sid in student_ids:
+            try:
+                found[sid] = self.student_ids.index(sid)
+            except ValueError:
+                pass
+        return found
+
+
+# 変更のあった学生の入力: (GPA, 希望のlab_id（希望順）)。削除された学生は None
+StudentInput = Optional[Tuple[float, List[str]]]
+
+
+def load_snapshot(session) -> MatchingSnapshot:
+    """students / laboratories / preferences / lab_special_students を各1クエリで読み込む"""
+    return _load(
+        session,
+        "SELECT student_id, gpa FROM students ORDER BY student_id",
+        "SELECT lab_id, capacity FROM laboratories ORDER BY lab_id",
+        "SELECT student_id, lab_id FROM preferences ORDER BY student_id, rank, lab_id",
+        "SELECT lab_id, student_id FROM lab_special_students ORDER BY id",
+    )
+
+
+def vacancy_snapshot(snapshot: MatchingSnapshot, assignment: np.ndarray) -> Tuple[MatchingSnapshot, np.ndarray]:
+    """補充ラウンド用: assignment（学生index → 研究室index）で未配属の学生と、各研究室の残り定員
+    （定員 - 配属数）だけの入力を作る。(入力, 元の学生index の配列) を返す
+
+    希望・特別希望枠は未配属の学生の分だけを配列から抜き出し、配属済みの学生は展開しない。
+    """
+    students = np.flatnonzero(assignment < 0)
+    counts = np.bincount(assignment[assignment >= 0], minlength=snapshot.num_labs)
+    capacity = np.maximum(np.frombuffer(snapshot.capacity, dtype=np.int32) - counts, 0)
+    ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32)
+    labs = np.frombuffer(snapshot.pref_lab, dtype=np.int32)
+    lengths = ptr[students + 1] - ptr[students]
+    new_ptr = np.zeros(len(students) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=new_ptr[1:])
+    entries = np.repeat(ptr[students] - new_ptr[:-1], lengths) + np.arange(new_ptr[-1], dtype=np.int32)
+    position = {s: k for k, s in enumerate(students.tolist())}
+    special: Dict[int, List[int]] = {}
+    for lab, members in snapshot.special.items():
+        kept = [position[s] for s in members if s in position]
+        if kept:
+            special[lab] = kept
+    student_ids = snapshot.student_ids
+    vacancy = MatchingSnapshot([student_ids[s] for s in students.tolist()],
+                               _to_array(np.frombuffer(snapshot.gpa, dtype=np.float64)[students], 'd'),
+                               list(snapshot.lab_ids), _to_array(capacity, 'i'), _to_array(new_ptr, 'i'),
+                               _to_array(labs[entries], 'i'), special)
+    return vacancy, students
+
+
+def load_student_inputs(session, student_ids: List[str]) -> Tuple[Dict[str, StudentInput], Dict[str, List[str]]]:
+    """指定した学生だけの入力を読む（増分再マッチング用）
+
+    ({student_id: (GPA, 希望のlab_id)}, {student_id: 特別希望枠のlab_id（登録順）}) を返す。
+    存在しない学生はどちらにも含まれない。
+    """
+    if not student_ids:
+        return {}, {}
+    ids = bindparam('ids', expanding=True)
+    students: Dict[str, StudentInput] = {}
+    for sid, g in session.execute(text("SELECT student_id, gpa FROM students WHERE student_id IN :ids")
+                                  .bindparams(ids), {"ids": student_ids}):
+        students[sid] = (g if g is not None else 0.0, [])
+    for sid, lab_id in session.execute(text("SELECT student_id, lab_id FROM preferences WHERE student_id IN :ids "
+                                            "ORDER BY student_id, rank, lab_id").bindparams(ids), {"ids": student_ids}):
+        if sid in students:
+            students[sid][1].append(lab_id)
+    special: Dict[str, List[str]] = {sid: [] for sid in students}
+    for lab_id, sid in session.execute(text("SELECT lab_id, student_id FROM lab_special_students "
+                                            "WHERE student_id IN :ids ORDER BY id").bindparams(ids),
+                                       {"ids": student_ids}):
+        if sid in special:
+            special[sid].append(lab_id)
+    return students, special
+
+
+def patch_snapshot(snapshot: MatchingSnapshot, students: Dict[str, StudentInput],
+                   special: Optional[Dict[str, List[str]]] = None,
+                   capacity: Optional[Dict[int, int]] = None) -> Tuple[MatchingSnapshot, np.ndarray]:
+    """凍結済みの入力に一部の学生・研究室の変更だけを反映した新しいスナップショットを返す
+
+    students は変更のあった学生（None は削除）、special は特別希望枠の登録を置き換える学生、
+    capacity は {研究室index: 新しい定員}。既存の学生の順序は保ち、新規の学生は末尾に追加する。
+    変更の無い学生の希望は展開せず、配列の詰め直しだけで作る。入力に無い研究室の希望は無視する。
+    戻り値は (新しいスナップショット, 旧index → 新index の配列（削除された学生は-1）)。
+    """
+    special = special or {}
+    n = snapshot.num_students
+    lab_index = snapshot.lab_index
+    found = snapshot.indexes_of(set(students) | set(special))
+    deleted = [found[sid] for sid, value in students.items() if value is None and sid in found]
+    replaced = {found[sid]: sid for sid, value in students.items() if value is not None and sid in found}
+    added = [sid for sid, value in students.items() if value is not None and sid not in found]
+
+    ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32)
+    labs = np.frombuffer(snapshot.pref_lab, dtype=np.int32)
+    keep = np.ones(n, dtype=bool)
+    keep[deleted] = False
+    kept = int(keep.sum())
+    remap = np.full(n, -1, dtype=np.int32)
+    remap[keep] = np.arange(kept, dtype=np.int32)
+
+    def pref_index(sid):
+        return [lab_index[lab_id] for lab_id in students[sid][1] if lab_id in lab_index]
+
+    new_prefs = {i: pref_index(sid) for i, sid in replaced.items()}
+    lengths = np.diff(ptr)
+    new_lengths = lengths.copy()
+    for i, p in new_prefs.items():
+        new_lengths[i] = len(p)
+    added_prefs = [pref_index(sid) for sid in added]
+    new_lengths = np.concatenate([new_lengths[keep], np.asarray([len(p) for p in added_prefs], dtype=np.int32)])
+    new_ptr = np.zeros(len(new_lengths) + 1, dtype=np.int32)
+    np.cumsum(new_lengths, out=new_ptr[1:])
+    new_labs = np.empty(int(new_ptr[-1]), dtype=np.int32)
+    # 変更の無い学生の希望はまとめて写す
+    unchanged = keep.copy()
+    unchanged[list(new_prefs)] = False
+    owner = np.repeat(np.arange(n, dtype=np.int32), lengths)
+    src = np.flatnonzero(unchanged[owner])
+    new_labs[new_ptr[remap[owner[src]]] + (src - ptr[owner[src]])] = labs[src]
+    for i, p in new_prefs.items():
+        start = new_ptr[remap[i]]
+        new_labs[start:start + len(p)] = p
+    for k, p in enumerate(added_prefs):
+        start = new_ptr[kept + k]
+        new_labs[start:start + len(p)] = p
+
+    gpa = np.frombuffer(snapshot.gpa, dtype=np.float64).copy()
+    for i, sid in replaced.items():
+        gpa[i] = students[sid][0]
+    gpa = np.concatenate([gpa[keep], np.asarray([students[sid][0] for sid in added], dtype=np.float64)])
+    student_ids = list(snapshot.student_ids) if not deleted else \
+        [sid for sid, k in zip(snapshot.student_ids, keep.tolist()) if k]
+    student_ids += added
+    new_index = {sid: int(remap[i]) for sid, i in found.items() if remap[i] >= 0}
+    new_index.update((sid, kept + k) for k, sid in enumerate(added))
+
+    # 特別希望枠: 置き換える学生の登録は、引き続き登録されている研究室だけ元の順序で残し、新しい登録は末尾に加える
+    claims = {sid: {lab_index[lab_id] for lab_id in lab_ids if lab_id in lab_index} for sid, lab_ids in special.items()}
+    new_special: Dict[int, List[int]] = {}
+    for lab, members in snapshot.special.items():
+        out = []
+        for s in members:
+            t = int(remap[s])
+            sid = snapshot.student_ids[s]
+            if t >= 0 and (sid not in claims or lab in claims[sid]):
+                out.append(t)
+        if out:
+            new_special[lab] = out
+    for sid, lab_ids in special.items():
+        t = new_index.get(sid)
+        if t is None:
+            continue
+        for lab_id in lab_ids:
+            lab = lab_index.get(lab_id)
+            if lab is not None and t not in new_special.get(lab, ()):
+                new_special.setdefault(lab, []).append(t)
+
+    new_capacity = array('i', snapshot.capacity)
+    for lab, cap in (capacity or {}).items():
+        new_capacity[lab] = cap
+    patched = MatchingSnapshot(student_ids, _to_array(gpa, 'd'), list(snapshot.lab_ids), new_capacity,
+                               _to_array(new_ptr, 'i'), _to_array(new_labs, 'i'), new_special)
+    patched._lab_index = lab_index
+    return patched, remap
+
+
+def _to_array(values: np.ndarray, typecode: str) -> array:
+    result = array(typecode)
+    result.frombytes(values.astype(np.int32 if typecode == 'i' else np.float64).tobytes())
+    return result
+
+
+def _load(session, students_sql: str, labs_sql: str, prefs_sql: str, special_sql: str) -> MatchingSnapshot:
+    student_ids = []
+    gpa = array('d')
+    for sid, g in session.execute(text(students_sql)):
+        student_ids.append(sid)
+        gpa.append(g if g is not None else 0.0)
+    lab_ids = []
+    capacity = array('i')
+    for lab_id, cap in session.execute(text(labs_sql)):
+        lab_ids.append(lab_id)
+        capacity.append(cap)
+    student_index = {sid: i for i, sid in enumerate(student_ids)}
+    lab_index = {lab_id: i for i, lab_id in enumerate(lab_ids)}
+
+    # 希望は (student_id, rank) 順に読み、そのままCSRに詰める
+    counts = array('i', bytes(4 * len(student_ids)))
+    pref_lab = array('i')
+    last = -1
+    for sid, lab_id in session.execute(text(prefs_sql)):
+        s = student_index.get(sid)
+        lab = lab_index.get(lab_id)
+        if s is None or lab is None:
+            continue
+        if s < last:
+            raise ValueError("preferencesの並び順が不正です")
+        last = s
+        counts[s] += 1
+        pref_lab.append(lab)
+    pref_ptr = array('i', [0])
+    total = 0
+    for c in counts:
+        total += c
+        pref_ptr.append(total)
+
+    special: Dict[int, List[int]] = {}
+    for lab_id, sid in session.execute(text(special_sql)):
+        s = student_index.get(sid)
+        lab = lab_index.get(lab_id)
+        if s is None or lab is None:
+            continue
+        special.setdefault(lab, []).append(s)
+
+    snapshot = MatchingSnapshot(student_ids, gpa, lab_ids, capacity, pref_ptr, pref_lab, special)
+    snapshot._student_index = student_index
+    snapshot._lab_index = lab_index
+    return snapshot
+
+
+def _pack_array(values, dtype: str) -> bytes:
+    return zlib.compress(np.asarray(values, dtype=dtype).tobytes())
+
+
+def _unpack_array(blob: bytes, dtype: str, typecode: str) -> array:
+    values = array(typecode)
+    values.frombytes(np.frombuffer(zlib.decompress(blob), dtype=dtype).astype(typecode).tobytes())
+    return values
+
+
+def pack_snapshot(snapshot: MatchingSnapshot) -> dict:
+    """matching_input_snapshots の列（件数と、IDの表・配列を詰めたBLOB）を作る"""
+    special = [(lab, s) for lab in snapshot.special for s in snapshot.special[lab]]
+    return {
+        "num_students": snapshot.num_students,
+        "num_labs": snapshot.num_labs,
+        "num_preferences": len(snapshot.pref_lab),
+        "student_ids": pack_ids(snapshot.student_ids),
+        "gpa": _pack_array(snapshot.gpa, '<f8'),
+        "lab_ids": pack_ids(snapshot.lab_ids),
+        "capacity": _pack_array(snapshot.capacity, '<i4'),
+        "pref_ptr": _pack_array(snapshot.pref_ptr, '<i4'),
+        "pref_lab": _pack_array(snapshot.pref_lab, '<i4'),
+        "special": _pack_array(np.asarray(special, dtype=np.int32).reshape(-1, 2), '<i4'),
+    }
+
+
+def unpack_snapshot(row) -> MatchingSnapshot:
+    """pack_snapshot で凍結した行（属性アクセスできる行）から復元する"""
+    special: Dict[int, List[int]] = {}
+    pairs = _unpack_array(row.special, '<i4', 'i')
+    for k in range(0, len(pairs), 2):
+        special.setdefault(pairs[k], []).append(pairs[k + 1])
+    return MatchingSnapshot(unpack_ids(row.student_ids), _unpack_array(row.gpa, '<f8', 'd'),
+                            unpack_ids(row.lab_ids), _unpack_array(row.capacity, '<i4', 'i'),
+                            _unpack_array(row.pref_ptr, '<i4', 'i'), _unpack_array(row.pref_lab, '<i4', 'i'),
+                            special)
@@ -0,0 +1,136 @@
+# バッチ配属結果の圧縮表現
+# matching_batches の1行に、学生順序表・研究室表（IDの改行区切りをzlib圧縮）と、
+# 学生順の配属先研究室index（int16、未配属は-1）・納得度（int8、0〜100）を詰めた配列を持つ。
+# バッチ全体の読み込み・比較はこの1行を読んで展開するだけで済む。
+#
+# 増分再マッチング・補充ラウンドのバッチは変更のあった学生の行だけを持つ差分バッチで、
+# 起点バッチに重ねて（overlay）全体を得る。削除された学生は REMOVED の行で表す。
+
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+ASSIGNMENT_DTYPE = np.dtype('<i2')
+SATISFACTION_DTYPE = np.dtype('<i1')
+MAX_LABS = np.iinfo(ASSIGNMENT_DTYPE).max
+REMOVED = -2  # 差分バッチで、起点バッチから削除された学生
+
+
+def pack_ids(ids: Sequence[str]) -> bytes:
+    return zlib.compress('\n'.join(ids).encode('utf-8'))
+
+
+def unpack_ids(blob: bytes) -> List[str]:
+    text = zlib.decompress(blob).decode('utf-8')
+    return text.split('\n') if text else []
+
+
+def pack_array(values, dtype: np.dtype) -> bytes:
+    return np.asarray(values, dtype=dtype).tobytes()
+
+
+def unpack_array(blob: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.frombuffer(blob, dtype=dtype)
+
+
+def pack_batch(student_ids: Sequence[str], lab_ids: Sequence[str], assignment: Sequence[int],
+               satisfaction: Sequence[int]) -> Dict[str, bytes]:
+    """matching_batches の列（student_ids, lab_ids, assignment, satisfaction）を作る"""
+    if len(lab_ids) > MAX_LABS:
+        raise ValueError(f"研究室数が多すぎます（最大 {MAX_LABS}）")
+    return {
+        "student_ids": pack_ids(student_ids),
+        "lab_ids": pack_ids(lab_ids),
+        "assignment": pack_array(assignment, ASSIGNMENT_DTYPE),
+        "satisfaction": pack_array(satisfaction, SATISFACTION_DTYPE),
+    }
+
+
+def unpack_assignment(student_ids: bytes, lab_ids: bytes, assignment: bytes) -> Dict[str, Optional[str]]:
+    """{student_id: lab_id（未配属はNone）} に展開する"""
+    labs = unpack_ids(lab_ids)
+    return {sid: labs[lab] if lab >= 0 else None
+            for sid, lab in zip(unpack_ids(student_ids), unpack_array(assignment, ASSIGNMENT_DTYPE).tolist())}
+
+
+class BatchArrays:
+    """展開したバッチ（学生順の研究室index・納得度の配列）"""
+
+    def __init__(self, student_ids: List[str], lab_ids: List[str], assignment: np.ndarray, satisfaction: np.ndarray):
+        self.student_ids = student_ids
+        self.lab_ids = lab_ids
+        self.assignment = assignment.astype(np.int32)
+        self.satisfaction = satisfaction.astype(np.int32)
+
+    @classmethod
+    def unpack(cls, student_ids: bytes, lab_ids: bytes, assignment: bytes, satisfaction: bytes) -> 'BatchArrays':
+        return cls(unpack_ids(student_ids), unpack_ids(lab_ids), unpack_array(assignment, ASSIGNMENT_DTYPE),
+                   unpack_array(satisfaction, SATISFACTION_DTYPE))
+
+    def overlay(self, other: 'BatchArrays') -> 'BatchArrays':
+        """other に含まれる学生の配属で上書きした新しいバッチを返す（差分バッチ用）
+
+        other に無い学生は末尾に追加し、REMOVED の学生は取り除く。
+        """
+        lab_ids = list(self.lab_ids)
+        lab_index = {lab_id: j for j, lab_id in enumerate(lab_ids)}
+        for lab_id in other.lab_ids:
+            if lab_id not in lab_index:
+                lab_index[lab_id] = len(lab_ids)
+                lab_ids.append(lab_id)
+        # 末尾の2要素で REMOVED(-2) と未配属(-1) をそのまま写す
+        remap = np.asarray([lab_index[lab_id] for lab_id in other.lab_ids] + [REMOVED, -1], dtype=np.int32)
+        student_ids = list(self.student_ids)
+        student_index = {sid: s for s, sid in enumerate(student_ids)}
+        positions = []
+        for sid in other.student_ids:
+            if sid not in student_index:
+                student_index[sid] = len(student_ids)
+                student_ids.append(sid)
+            positions.append(student_index[sid])
+        grow = len(student_ids) - len(self.student_ids)
+        assignment = np.concatenate([self.assignment, np.full(grow, -1, dtype=np.int32)])
+        satisfaction = np.concatenate([self.satisfaction, np.zeros(grow, dtype=np.int32)])
+        positions = np.asarray(positions, dtype=np.int64)
+        assignment[positions] = remap[other.assignment]
+        satisfaction[positions] = other.satisfaction
+        keep = assignment != REMOVED
+        if not keep.all():
+            student_ids = [sid for sid, k in zip(student_ids, keep.tolist()) if k]
+            assignment, satisfaction = assignment[keep], satisfaction[keep]
+        return BatchArrays(student_ids, lab_ids, assignment, satisfaction)
+
+    def align(self, student_ids: List[str], lab_ids: List[str]) -> 'BatchArrays':
+        """student_ids・lab_ids の順に並べ直したバッチを返す（無い学生は未配属、無い研究室への配属は未配属）
+
+        順序が同じ場合（同じ入力から作ったバッチ）は配列をそのまま使う。
+        """
+        assignment, satisfaction = self.assignment, self.satisfaction
+        if student_ids != self.student_ids:
+            index = {sid: s for s, sid in enumerate(self.student_ids)}
+            positions = np.asarray([index.get(sid, -1) for sid in student_ids], dtype=np.int64)
+            found = positions >= 0
+            assignment = np.where(found, np.append(assignment, -1)[positions], -1).astype(np.int32)
+            satisfaction = np.where(found, np.append(satisfaction, 0)[positions], 0).astype(np.int32)
+        if lab_ids != self.lab_ids:
+            lab_index = {lab_id: j for j, lab_id in enumerate(lab_ids)}
+            remap = np.asarray([lab_index.get(lab_id, -1) for lab_id in self.lab_ids] + [-1], dtype=np.int32)
+            assignment = remap[assignment]
+        return BatchArrays(list(student_ids), list(lab_ids), assignment, satisfaction)
+
+    def page(self, after: str, limit: int) -> List[tuple]:
+        """student_id が after より大きい学生を student_id 順に最大 limit 件、(student_id, lab_id) で返す"""
+        if not self.student_ids:
+            return []
+        ids = np.asarray(self.student_ids)
+        order = np.argsort(ids, kind='stable')
+        start = int(np.searchsorted(ids[order], after, side='right'))
+        labs = self.lab_ids
+        return [(self.student_ids[s], labs[lab] if lab >= 0 else None)
+                for s, lab in zip(order[start:start + limit].tolist(),
+                                  self.assignment[order[start:start + limit]].tolist())]
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        labs = self.lab_ids
+        return {sid: labs[lab] if lab >= 0 else None for sid, lab in zip(self.student_ids, self.assignment.tolist())}
@@ -0,0 +1,226 @@
+# 配属方式（ストラテジ）のレジストリ
+# 全ての方式は同じ整数インデックスの入力（MatchingSnapshot）を受け取り、
+# 同じ形式の出力（MatchingOutcome: 配属先index・希望順位・提案数・拒否数）を返す。
+# 特別希望枠はいずれの方式でも assign_special_seats で先に確定させる。
+#
+#   gale_shapley        : 学生提案型 Deferred Acceptance（ヒープ実装、既定。trace で事象トレースを記録）
+#   gale_shapley_np     : 同上のNumPyベクトル化実装（結果は gale_shapley と同一）
+#   serial_dictatorship : GPA順に学生が空きのある最上位の希望を選ぶ
+#   boston              : 第k希望ごとに即時確定する方式（Immediate Acceptance）
+#   lab_proposing       : 研究室提案型 Deferred Acceptance
+#   max_satisfaction    : 総納得度を最大化する最小費用流（matching_optimal、time_budget 指定可）
+
+import heapq
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from matching_arrays import MatchingArrays, deferred_acceptance_np
+from matching_engine import (CANCEL_CHECK_INTERVAL, ENGINE_VERSION, MatchingCancelled, MatchingOutcome,
+                             assign_special_seats, deferred_acceptance)
+from matching_optimal import max_satisfaction_assignment
+from matching_trace import MatchingTrace
+
+DEFAULT_STRATEGY = 'gale_shapley'
+
+
+class Strategy:
+    def __init__(self, name: str, run: Callable, version: str, description: str, options: Tuple[str, ...] = ()):
+        self.name = name
+        self.run = run  # (snapshot, should_stop, **options) -> MatchingOutcome
+        self.version = version  # 入力ハッシュ・結果のversionに使う
+        self.description = description
+        self.options = options  # 受け付けるオプション名
+
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def register_strategy(name: str, version: str, description: str, options: Tuple[str, ...] = ()):
+    def decorator(fn):
+        STRATEGIES[name] = Strategy(name, fn, version, description, options)
+        return fn
+    return decorator
+
+
+def get_strategy(name: Optional[str]) -> Strategy:
+    strategy = STRATEGIES.get(name or DEFAULT_STRATEGY)
+    if strategy is None:
+        raise ValueError(f"不明な配属方式です: {name}（{', '.join(STRATEGIES)}）")
+    return strategy
+
+
+def run_strategy(name: Optional[str], snapshot, should_stop: Optional[Callable[[], bool]] = None,
+                 **options) -> Tuple[MatchingOutcome, dict]:
+    """方式を実行し、結果と計測値 {strategy, proposals, rejections, elapsed_ms, 方式固有の値} を返す
+
+    options のうち方式が受け付けないもの（値がNoneのものを含む）は渡さない。
+    """
+    strategy = get_strategy(name)
+    options = {k: v for k, v in options.items() if k in strategy.options and v is not None}
+    start = time.perf_counter()
+    outcome = strategy.run(snapshot, should_stop, **options)
+    stats = {
+        "strategy": strategy.name,
+        "proposals": int(outcome.proposals),
+        "rejections": int(outcome.rejections),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    stats.update(outcome.extra)
+    return outcome, stats
+
+
+_worker_snapshot = None
+
+
+def _init_worker(snapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _run_in_worker(name: str, options: dict) -> Tuple[MatchingOutcome, dict]:
+    return run_strategy(name, _worker_snapshot, **options)
+
+
+def run_strategies(snapshot, names: List[str], workers: Optional[int] = None,
+                   **options) -> List[Tuple[MatchingOutcome, dict]]:
+    """複数の方式を同じ入力で実行し、指定順に (結果, 計測値) を返す。workers<=1 または1件のみなら同一プロセスで実行"""
+    if workers is None:
+        workers = min(len(names), multiprocessing.cpu_count())
+    if workers <= 1 or len(names) <= 1:
+        return [run_strategy(name, snapshot, **options) for name in names]
+    # スナップショットは各ワーカーに1回だけ渡す
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(snapshot,)) as executor:
+        return list(executor.map(_run_in_worker, names, [options] * len(names)))
+
+
+def _check(should_stop, count: int):
+    if should_stop is not None and not count % CANCEL_CHECK_INTERVAL and should_stop():
+        raise MatchingCancelled()
+
+
+def _ranks(prefs, assignment: List[int]) -> List[int]:
+    ranks = [0] * len(assignment)
+    for s, lab in enumerate(assignment):
+        if lab >= 0 and lab in prefs[s]:
+            ranks[s] = prefs[s].index(lab) + 1
+    return ranks
+
+
+@register_strategy('gale_shapley', ENGINE_VERSION, "学生提案型Deferred Acceptance（GPA優先）", options=('trace',))
+def gale_shapley(snapshot, should_stop=None, trace=False) -> MatchingOutcome:
+    return deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity, snapshot.special,
+                               should_stop=should_stop, trace=MatchingTrace() if trace else None)
+
+
+@register_strategy('gale_shapley_np', ENGINE_VERSION, "学生提案型Deferred Acceptance（NumPy実装）")
+def gale_shapley_np(snapshot, should_stop=None) -> MatchingOutcome:
+    outcome = deferred_acceptance_np(MatchingArrays.from_snapshot(snapshot), should_stop=should_stop)
+    return MatchingOutcome(outcome.assignment.tolist(), outcome.ranks.tolist(),
+                           int(outcome.proposals), int(outcome.rejections))
+
+
+@register_strategy('serial_dictatorship', 'serial-dictatorship-1', "GPA順に空きのある最上位の希望へ配属")
+def serial_dictatorship(snapshot, should_stop=None) -> MatchingOutcome:
+    prefs = snapshot.prefs
+    gpa = snapshot.gpa
+    seats = list(snapshot.capacity)
+    assignment = assign_special_seats(snapshot.special, snapshot.num_students, seats, snapshot.pref_rank)
+    ranks = _ranks(prefs, assignment)
+    order = sorted((s for s in range(snapshot.num_students) if assignment[s] < 0), key=lambda s: (-gpa[s], s))
+    proposals = 0
+    rejections = 0
+    for s in order:
+        for k, lab in enumerate(prefs[s], start=1):
+            proposals += 1
+            _check(should_stop, proposals)
+            if seats[lab] > 0:
+                seats[lab] -= 1
+                assignment[s] = lab
+                ranks[s] = k
+                break
+            rejections += 1
+    return MatchingOutcome(assignment, ranks, proposals, rejections)
+
+
+@register_strategy('boston', 'boston-1', "第k希望ごとにGPA順で即時確定（Boston方式）")
+def boston(snapshot, should_stop=None) -> MatchingOutcome:
+    prefs = snapshot.prefs
+    gpa = snapshot.gpa
+    seats = list(snapshot.capacity)
+    assignment = assign_special_seats(snapshot.special, snapshot.num_students, seats, snapshot.pref_rank)
+    ranks = _ranks(prefs, assignment)
+    free = [s for s in range(snapshot.num_students) if assignment[s] < 0 and prefs[s]]
+    proposals = 0
+    rejections = 0
+    k = 0
+    while free:
+        # 第k+1希望への応募を研究室ごとにGPA順で確定する
+        applicants: Dict[int, List[int]] = {}
+        for s in free:
+            applicants.setdefault(prefs[s][k], []).append(s)
+        proposals += len(free)
+        if should_stop is not None and should_stop():
+            raise MatchingCancelled()
+        for lab, students in applicants.items():
+            students.sort(key=lambda s: (-gpa[s], s))
+            for s in students[:seats[lab]]:
+                assignment[s] = lab
+                ranks[s] = k + 1
+            rejections += max(len(students) - seats[lab], 0)
+            seats[lab] = max(seats[lab] - len(students), 0)
+        k += 1
+        free = [s for s in free if assignment[s] < 0 and k < len(prefs[s])]
+    return MatchingOutcome(assignment, ranks, proposals, rejections)
+
+
+@register_strategy('lab_proposing', 'lab-proposing-1', "研究室提案型Deferred Acceptance")
+def lab_proposing(snapshot, should_stop=None) -> MatchingOutcome:
+    prefs = snapshot.prefs
+    gpa = snapshot.gpa
+    seats = list(snapshot.capacity)
+    assignment = assign_special_seats(snapshot.special, snapshot.num_students, seats, snapshot.pref_rank)
+    fixed = [lab >= 0 for lab in assignment]
+    # 学生側の希望順位表と、研究室側の候補者リスト（学生提案型と同じ優先度: GPA, 希望順位, 学生index）
+    rank_of: List[Dict[int, int]] = [{lab: k for k, lab in enumerate(p, start=1)} for p in prefs]
+    candidates: List[List[int]] = [[] for _ in seats]
+    for s, p in enumerate(prefs):
+        if not fixed[s]:
+            for lab in p:
+                candidates[lab].append(s)
+    for lab, students in enumerate(candidates):
+        students.sort(key=lambda s: (-gpa[s], rank_of[s][lab], s))
+    held = [0] * len(seats)
+    pointer = [0] * len(seats)
+    queue = [lab for lab in range(len(seats)) if seats[lab] > 0 and candidates[lab]]
+    heapq.heapify(queue)
+    proposals = 0
+    rejections = 0
+    while queue:
+        lab = heapq.heappop(queue)
+        students = candidates[lab]
+        while held[lab] < seats[lab] and pointer[lab] < len(students):
+            s = students[pointer[lab]]
+            pointer[lab] += 1
+            proposals += 1
+            _check(should_stop, proposals)
+            current = assignment[s]
+            if current >= 0 and rank_of[s][current] < rank_of[s][lab]:
+                rejections += 1
+                continue
+            if current >= 0:
+                # 学生がより上位の研究室を選んだため、元の研究室は空席を埋め直す
+                held[current] -= 1
+                rejections += 1
+                heapq.heappush(queue, current)
+            assignment[s] = lab
+            held[lab] += 1
+    ranks = [rank_of[s].get(lab, 0) if lab >= 0 else 0 for s, lab in enumerate(assignment)]
+    return MatchingOutcome(assignment, ranks, proposals, rejections)
+
+
+@register_strategy('max_satisfaction', 'min-cost-flow-1', "総納得度を最大化（最小費用流）", options=('time_budget',))
+def max_satisfaction(snapshot, should_stop=None, time_budget=None) -> MatchingOutcome:
+    return max_satisfaction_assignment(snapshot, time_budget=time_budget, should_stop=should_stop)
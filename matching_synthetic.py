@@ -0,0 +1,60 @@
+# 合成コホート生成
+# ベンチマーク・デモ用に、学生数・研究室数・希望数・人気の偏り（Zipf型）を指定して
+# MatchingSnapshot を生成する。20万人規模でもメモリを抑えるため希望は学生のチャンク単位で作る。
+
+from array import array
+from typing import Optional, Tuple
+
+import numpy as np
+
+from matching_snapshot import MatchingSnapshot
+
+CHUNK_STUDENTS = 8192
+
+
+def generate_cohort(num_students: int, num_labs: int, pref_length: Optional[int] = None, skew: float = 1.0,
+                    capacity_slack: float = 1.0, special_per_lab: Tuple[int, int] = (0, 2),
+                    seed: Optional[int] = 0) -> MatchingSnapshot:
+    """合成コホートを生成する
+
+    pref_length は各学生の希望数（None なら全研究室）、skew は研究室人気の Zipf 指数
+    （0 で一様、大きいほど上位の研究室に希望が集中）、capacity_slack は総定員 / 学生数、
+    special_per_lab は研究室ごとの特別希望枠の人数の範囲、seed=None なら毎回異なるコホートになる。
+    """
+    rng = np.random.default_rng(seed)
+    k = num_labs if pref_length is None else min(pref_length, num_labs)
+
+    # 人気順位 r の研究室の重みは 1 / r^skew（研究室の並びはシャッフルして id と人気を切り離す）
+    popularity = np.empty(num_labs, dtype=np.float64)
+    popularity[rng.permutation(num_labs)] = 1.0 / np.arange(1, num_labs + 1) ** skew
+    log_weight = np.log(popularity).astype(np.float32)
+
+    # 重み付き非復元抽出は Gumbel-top-k（log重み + Gumbelノイズの上位k件を降順に並べる）
+    pref_lab = array('i')
+    for lo in range(0, num_students if k else 0, CHUNK_STUDENTS):
+        rows = min(CHUNK_STUDENTS, num_students - lo)
+        keys = log_weight + rng.gumbel(size=(rows, num_labs)).astype(np.float32)
+        if k < num_labs:
+            top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(num_labs), (rows, 1))
+        order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1, kind='stable')
+        pref_lab.frombytes(np.take_along_axis(top, order, axis=1).astype(np.int32).tobytes())
+    pref_ptr = array('i', (np.arange(num_students + 1, dtype=np.int32) * k).tobytes())
+
+    gpa = array('d', np.round(np.clip(rng.normal(3.0, 0.5, num_students), 0.0, 4.0), 2).tobytes())
+    seats = int(np.ceil(num_students * capacity_slack))
+    capacity = array('i', [seats // num_labs + (j < seats % num_labs) for j in range(num_labs)])
+
+    special = {}
+    min_special, max_special = special_per_lab
+    if max_special > 0 and num_students:
+        for lab in range(num_labs):
+            count = int(rng.integers(min_special, max_special + 1))
+            if count:
+                special[lab] = rng.choice(num_students, size=min(count, num_students), replace=False).tolist()
+
+    width = max(2, len(str(num_students)))
+    student_ids = [f"S{str(i + 1).zfill(width)}" for i in range(num_students)]
+    lab_ids = [f"L{j + 1}" for j in range(num_labs)]
+    return MatchingSnapshot(student_ids, gpa, lab_ids, capacity, pref_ptr, pref_lab, special)
@@ -0,0 +1,108 @@
+# マッチングの事象トレース
+# 学生提案型DAの押し出しだけを、事前確保した型付き配列（array.array）へ記録する。
+# 実行ごとに有効/無効を切り替え、無効時はエンジンに何も渡さない。
+#
+# 学生の提案は希望順に進むため、希望リスト（CSR: 学生ごとの先頭位置 offsets と研究室index labs）、
+# 学生ごとの提案数、最終配属、押し出しの位置が分かれば、提案・仮受入・押し出し・拒否の経緯はすべて復元できる
+# （最後の提案より前で押し出されていない提案は拒否、空き定員0の研究室への拒否は NO_SEAT）。
+# 拒否はループ内で記録せず、押し出しのみ配列への代入2回で記録する:
+#   code  : 押し出された学生の希望位置 offsets[s] + (k-1)
+#   other : 押し出した学生
+# 保存時は希望リスト・提案数・配属・特別希望枠の配属・特別枠控除後の定員とともに npz 形式で圧縮する。
+
+import io
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+REJECT_REASON = "定員に達しており、仮配属者全員より優先度（GPA・希望順位）が低い"
+NO_SEAT_REASON = "空き定員が無い（特別希望枠で埋まっている）"
+DISPLACED_REASON = "優先度（GPA・希望順位）の高い学生の応募により押し出された"
+SPECIAL_REASON = "特別希望枠により優先配属"
+
+
+class MatchingTrace:
+    def __init__(self):
+        self.size = 0
+        self.displaced = array('i')  # 押し出された学生
+        self.rank = array('i')  # 押し出された希望順位
+        self.by = array('i')  # 押し出した学生
+        self.prefs: Sequence[Sequence[int]] = []
+        self.initial: Sequence[int] = []  # 特別希望枠の配属（ループ開始時の配属）
+        self.proposed: Sequence[int] = []  # 学生ごとの提案数
+        self.assignment: Sequence[int] = []
+        self.seats: Sequence[int] = []  # 特別枠控除後の定員
+
+    def start(self, prefs: Sequence[Sequence[int]], assignment: Sequence[int]):
+        """希望リストと特別枠配属を控え、事象数の上限（希望総数）まで配列を確保する"""
+        self.prefs = prefs
+        self.initial = list(assignment)
+        # 押し出しは希望位置ごとに高々1件
+        self.displaced = array('i', bytes(4 * sum(map(len, prefs))))
+        self.rank = array('i', self.displaced)
+        self.by = array('i', self.displaced)
+        self.size = 0
+
+    def finish(self, size: int, proposed: Sequence[int], assignment: Sequence[int], seats: Sequence[int]):
+        """ループ終了後の状態を控える（配列への変換は保存時に行う）"""
+        self.size = size
+        self.proposed = proposed
+        self.assignment = assignment
+        self.seats = seats
+
+    def to_npz(self) -> bytes:
+        offsets = np.zeros(len(self.prefs) + 1, dtype=np.int32)
+        np.cumsum([len(p) for p in self.prefs], out=offsets[1:])
+        labs = np.fromiter((lab for p in self.prefs for lab in p), dtype=np.int16, count=int(offsets[-1]))
+        displaced = np.frombuffer(self.displaced, dtype=np.int32, count=self.size)
+        rank = np.frombuffer(self.rank, dtype=np.int32, count=self.size)
+        initial = np.asarray(self.initial, dtype=np.int32)
+        special = np.flatnonzero(initial >= 0)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, offsets=offsets, labs=labs,
+                            code=offsets[displaced] + rank - 1,
+                            other=np.frombuffer(self.by, dtype=np.int32, count=self.size),
+                            proposed=np.asarray(self.proposed, dtype=np.int32),
+                            assignment=np.asarray(self.assignment, dtype=np.int32),
+                            seats=np.asarray(self.seats, dtype=np.int32),
+                            special=np.stack([special, initial[special]], axis=1).astype(np.int32))
+        return buffer.getvalue()
+
+
+def pack_trace(trace: MatchingTrace) -> bytes:
+    return trace.to_npz()
+
+
+def unpack_trace(blob: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def explain_student(trace: Dict[str, np.ndarray], s: int, lab_ids: Sequence[str],
+                    student_ids: Sequence[str]) -> List[Dict]:
+    """1人の学生の提案・仮受入・押し出し（押し出した学生）・拒否を希望順に復元する"""
+    special = trace['special']
+    hit = np.flatnonzero(special[:, 0] == s)
+    if len(hit):
+        return [{"event": "special", "lab_id": lab_ids[int(special[hit[0], 1])], "rank": None,
+                 "reason": SPECIAL_REASON}]
+    lo = int(trace['offsets'][s])
+    code = trace['code']
+    mask = (code >= lo) & (code < lo + int(trace['proposed'][s]))
+    displaced = dict(zip((code[mask] - lo).tolist(), trace['other'][mask].tolist()))
+    labs = trace['labs'][lo:lo + int(trace['proposed'][s])].tolist()
+    # 配属されていれば最後の提案が仮受入のまま確定している
+    last = len(labs) - 1 if int(trace['assignment'][s]) >= 0 else len(labs)
+    seats = trace['seats']
+    story: List[Dict[str, Optional[object]]] = []
+    for k, lab in enumerate(labs):
+        item = {"lab_id": lab_ids[lab], "rank": k + 1}
+        if k in displaced:
+            story.append(dict(item, event="accepted"))
+            story.append(dict(item, event="displaced", reason=DISPLACED_REASON, by=student_ids[displaced[k]]))
+        elif k == last:
+            story.append(dict(item, event="accepted"))
+        else:
+            story.append(dict(item, event="rejected", reason=REJECT_REASON if seats[lab] > 0 else NO_SEAT_REASON))
+    return story
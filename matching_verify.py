@@ -0,0 +1,188 @@
+# 配属結果の検証
+# スナップショット（入力）と配属結果から、ブロッキングペア・定員超過・希望外配属を
+# 希望総数に比例する時間で全件検出する。
+#
+#   ブロッキングペア: 学生sが現在の配属先より上位に希望する研究室lに、空席があるか、
+#                     sより優先度（GPA, 希望順位, 学生index）の低い配属者がいる組
+#   定員超過        : 配属人数が定員を超えている研究室
+#   希望外配属      : 希望リストに無い研究室への配属（特別希望枠による配属は除く）
+#
+# 研究室ごとの「最も弱い配属者の優先度キー」と学生ごとの配属先の希望順位を先に求め、
+# 各希望辺を1回ずつ調べる。特別希望枠で配属された学生は定員にのみ数え、ブロッキングの判定からは除く。
+#
+# 増分再マッチングの結果は verify_changes で、変更のあった学生・研究室に関わる希望辺だけを調べる。
+
+import time
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from matching_engine import assign_special_seats
+
+# 一覧で返す件数の既定上限（件数の集計は常に全件）
+DEFAULT_REPORT_LIMIT = 100
+
+
+class VerificationReport:
+    def __init__(self, blocking_pairs: List[tuple], capacity_violations: List[tuple],
+                 unranked_placements: List[tuple], elapsed_ms: float):
+        self.blocking_pairs = blocking_pairs  # (学生index, 研究室index)
+        self.capacity_violations = capacity_violations  # (研究室index, 定員, 配属人数)
+        self.unranked_placements = unranked_placements  # (学生index, 研究室index)
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self) -> bool:
+        return not (self.blocking_pairs or self.capacity_violations or self.unranked_placements)
+
+    def summary(self) -> dict:
+        return {
+            "ok": self.ok,
+            "blocking_pairs": len(self.blocking_pairs),
+            "capacity_violations": len(self.capacity_violations),
+            "unranked_placements": len(self.unranked_placements),
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+    def to_dict(self, snapshot, limit: Optional[int] = DEFAULT_REPORT_LIMIT) -> dict:
+        sids, lab_ids = snapshot.student_ids, snapshot.lab_ids
+        result = self.summary()
+        result["details"] = {
+            "blocking_pairs": [{"student_id": sids[s], "lab_id": lab_ids[lab]}
+                               for s, lab in self.blocking_pairs[:limit]],
+            "capacity_violations": [{"lab_id": lab_ids[lab], "capacity": cap, "assigned": count}
+                                    for lab, cap, count in self.capacity_violations[:limit]],
+            "unranked_placements": [{"student_id": sids[s], "lab_id": lab_ids[lab]}
+                                    for s, lab in self.unranked_placements[:limit]],
+        }
+        return result
+
+
+def verify_assignment(snapshot, assignment: Sequence[int]) -> VerificationReport:
+    """assignment（学生index → 研究室index、未配属は-1）を snapshot に対して検証する"""
+    start = time.perf_counter()
+    n, m = snapshot.num_students, snapshot.num_labs
+    prefs = snapshot.prefs
+    gpa = snapshot.gpa
+    capacity = snapshot.capacity
+    special_seats = list(capacity)
+    special = assign_special_seats(snapshot.special, n, special_seats, snapshot.pref_rank)
+
+    # 配属先の希望順位（希望外・未配属は len(prefs)+1 として扱う）と研究室ごとの配属人数
+    rank_of = [0] * n
+    counts = [0] * m
+    unranked = []
+    for s in range(n):
+        lab = assignment[s]
+        p = prefs[s]
+        rank_of[s] = len(p) + 1
+        if lab < 0:
+            continue
+        counts[lab] += 1
+        for k, l in enumerate(p, start=1):
+            if l == lab:
+                rank_of[s] = k
+                break
+        else:
+            if special[s] != lab:
+                unranked.append((s, lab))
+
+    # 研究室ごとの最も弱い配属者（特別枠を除く）の優先度キー
+    worst: List[Optional[tuple]] = [None] * m
+    for s in range(n):
+        lab = assignment[s]
+        if lab >= 0 and special[s] != lab:
+            key = (gpa[s], -rank_of[s], -s)
+            if worst[lab] is None or key < worst[lab]:
+                worst[lab] = key
+
+    blocking = []
+    for s in range(n):
+        if special[s] >= 0 and special[s] == assignment[s]:
+            continue
+        p = prefs[s]
+        for k in range(1, min(rank_of[s], len(p) + 1)):
+            lab = p[k - 1]
+            if counts[lab] < capacity[lab]:
+                blocking.append((s, lab))
+            elif worst[lab] is not None and (gpa[s], -k, -s) > worst[lab]:
+                blocking.append((s, lab))
+
+    violations = [(lab, capacity[lab], counts[lab]) for lab in range(m) if counts[lab] > capacity[lab]]
+    return VerificationReport(blocking, violations, unranked, round((time.perf_counter() - start) * 1000, 3))
+
+
+def verify_changes(snapshot, assignment: Sequence[int], students: Iterable[int],
+                   labs: Iterable[int]) -> VerificationReport:
+    """起点の配属が安定である前提で、変更のあった部分だけを検証する（増分再マッチング用）
+
+    students は希望・GPA・配属が変わった学生index、labs は配属者・定員が変わった研究室index。
+    新たなブロッキングペアは students の希望辺か labs への希望辺にしか現れないため、その辺だけを調べる。
+    希望を展開するのは students と各研究室の配属者だけで、希望者の抽出はNumPyで行う。
+    """
+    start = time.perf_counter()
+    n = snapshot.num_students
+    prefs = snapshot.pref_view
+    gpa, capacity = snapshot.gpa, snapshot.capacity
+    special = assign_special_seats(snapshot.special, n, list(capacity), snapshot.pref_rank)
+    assign = np.asarray(assignment, dtype=np.int32)
+    counts = np.bincount(assign[assign >= 0], minlength=snapshot.num_labs)
+    ptr = np.frombuffer(snapshot.pref_ptr, dtype=np.int32)
+    pref_lab = np.frombuffer(snapshot.pref_lab, dtype=np.int32)
+    gpa_np = np.frombuffer(gpa, dtype=np.float64)
+    fixed = np.asarray(special, dtype=np.int32)
+    fixed = (fixed >= 0) & (fixed == assign)
+    labs = set(labs)
+
+    rank = snapshot.pref_rank
+
+    def rank_of(s):
+        lab = assignment[s]
+        return (rank(s, lab) if lab >= 0 else 0) or len(prefs[s]) + 1
+
+    worst = {}
+
+    def worst_key(lab):
+        if lab not in worst:
+            keys = [(gpa[t], -rank_of(t), -t) for t in np.flatnonzero(assign == lab).tolist() if special[t] != lab]
+            worst[lab] = min(keys) if keys else None
+        return worst[lab]
+
+    blocking = set()
+    unranked = []
+    for s in sorted(set(students)):
+        lab = assignment[s]
+        p = prefs[s]
+        if lab >= 0:
+            labs.add(lab)
+            if not rank(s, lab) and special[s] != lab:
+                unranked.append((s, lab))
+        if fixed[s]:
+            continue
+        for k in range(1, min(rank_of(s), len(p) + 1)):
+            l = p[k - 1]
+            w = worst_key(l) if counts[l] >= capacity[l] else None
+            if counts[l] < capacity[l] or (w is not None and (gpa[s], -k, -s) > w):
+                blocking.add((s, l))
+
+    # 変更のあった研究室を、現在の配属先より上位に希望している学生
+    for lab in sorted(labs):
+        pos = np.flatnonzero(pref_lab == lab)
+        applicants = np.searchsorted(ptr, pos, side='right') - 1
+        ranks = pos - ptr[applicants] + 1
+        current = assign[applicants]
+        placed_above = np.zeros(len(pos), dtype=bool)
+        for k in range(1, int(ranks.max(initial=0))):
+            valid = ranks > k
+            placed_above |= valid & (pref_lab[np.where(valid, pos - k, 0)] == current)
+        candidate = ~placed_above & (current != lab) & ~fixed[applicants]
+        if counts[lab] >= capacity[lab]:
+            w = worst_key(lab)
+            if w is None:
+                continue
+            g = gpa_np[applicants]
+            candidate &= (g > w[0]) | ((g == w[0]) & ((-ranks > w[1]) | ((-ranks == w[1]) & (-applicants > w[2]))))
+        blocking.update(zip(applicants[candidate].tolist(), [lab] * int(candidate.sum())))
+
+    violations = [(lab, capacity[lab], int(counts[lab])) for lab in sorted(labs) if counts[lab] > capacity[lab]]
+    return VerificationReport(sorted(blocking), violations, unranked, round((time.perf_counter() - start) * 1000, 3))
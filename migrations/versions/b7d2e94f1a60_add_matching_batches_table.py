@@ -0,0 +1,89 @@
+"""add matching_batches table and slim matching_results
+
+Revision ID: b7d2e94f1a60
+Revises: 8c41e5a0b2d3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from itertools import groupby
+
+from alembic import op
+import sqlalchemy as sa
+
+from matching_storage import pack_batch
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e94f1a60'
+down_revision = '8c41e5a0b2d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    batches = op.create_table('matching_batches',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('batch_id', sa.String(length=64), nullable=False),
+    sa.Column('executed_at', sa.DateTime(), nullable=False),
+    sa.Column('version', sa.String(length=32), nullable=True),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('num_students', sa.Integer(), nullable=False),
+    sa.Column('student_ids', sa.LargeBinary(), nullable=False),
+    sa.Column('lab_ids', sa.LargeBinary(), nullable=False),
+    sa.Column('assignment', sa.LargeBinary(), nullable=False),
+    sa.Column('satisfaction', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('batch_id')
+    )
+
+    # 既存の学生単位の行からヘッダと配列を作る（実行順を保つため各バッチの最初の行のid順）
+    results = sa.table('matching_results',
+                       sa.column('id', sa.Integer), sa.column('batch_id', sa.String),
+                       sa.column('executed_at', sa.DateTime), sa.column('version', sa.String),
+                       sa.column('summary', sa.Text), sa.column('student_id', sa.String),
+                       sa.column('assigned_lab', sa.String), sa.column('satisfaction', sa.Integer))
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(results).order_by(results.c.batch_id, results.c.student_id)).fetchall()
+    headers = []
+    first_id = {}
+    for batch_id, group in groupby(rows, key=lambda r: r.batch_id):
+        group = list(group)
+        first_id[batch_id] = min(r.id for r in group)
+        lab_ids = sorted({r.assigned_lab for r in group if r.assigned_lab is not None})
+        index = {lab_id: j for j, lab_id in enumerate(lab_ids)}
+        headers.append(dict(
+            batch_id=batch_id, executed_at=group[0].executed_at, version=group[0].version,
+            summary=group[0].summary, num_students=len(group),
+            **pack_batch([r.student_id for r in group], lab_ids,
+                         [index[r.assigned_lab] if r.assigned_lab is not None else -1 for r in group],
+                         [r.satisfaction or 0 for r in group])))
+    headers.sort(key=lambda h: first_id[h["batch_id"]])
+    if headers:
+        op.bulk_insert(batches, headers)
+
+    with op.batch_alter_table('matching_results', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_matching_results_student_id'), ['student_id'], unique=False)
+        batch_op.create_foreign_key('fk_matching_results_batch_id', 'matching_batches', ['batch_id'], ['batch_id'])
+        batch_op.drop_column('summary')
+        batch_op.drop_column('version')
+        batch_op.drop_column('executed_at')
+
+
+def downgrade():
+    with op.batch_alter_table('matching_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('executed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        batch_op.drop_constraint('fk_matching_results_batch_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_matching_results_student_id'))
+
+    op.execute(
+        "UPDATE matching_results SET "
+        "executed_at = (SELECT b.executed_at FROM matching_batches b WHERE b.batch_id = matching_results.batch_id), "
+        "version = (SELECT b.version FROM matching_batches b WHERE b.batch_id = matching_results.batch_id), "
+        "summary = (SELECT b.summary FROM matching_batches b WHERE b.batch_id = matching_results.batch_id)"
+    )
+    with op.batch_alter_table('matching_results', schema=None) as batch_op:
+        batch_op.alter_column('executed_at', existing_type=sa.DateTime(), nullable=False)
+
+    op.drop_table('matching_batches')
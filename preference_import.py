@@ -0,0 +1,162 @@
+# 希望の一括インポート・差分更新
+# 事務で回収した希望表（CSV / NDJSON、1行 = student_id, lab_id, rank）を読み、
+# 学生・研究室の存在と学生ごとの rank・lab_id の重複を1パスで検証する。
+# 希望登録APIは既存の希望との差分（最小の INSERT / UPDATE / DELETE）だけを書き込む。
+# 入力はストリーム・ID集合・既存の行のみでDBには触れない（登録は呼び出し側が一括で行う）。
+
+import csv
+import json
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
+
+PREFERENCE_COLUMNS = {'student_id', 'lab_id', 'rank'}
+
+# (行番号, student_id, lab_id, rank（未検証の値）) または (行番号, エラー)
+Row = Tuple[int, Optional[str], Optional[str], object]
+
+
+class PreferenceImportError(ValueError):
+    """ファイル全体を読めない（カラム不正など）"""
+
+
+def iter_csv_rows(stream: IO[str]) -> Iterator[Row]:
+    reader = csv.DictReader(stream)
+    if set(reader.fieldnames or ()) != PREFERENCE_COLUMNS:
+        raise PreferenceImportError(f"CSVのカラムは {sorted(PREFERENCE_COLUMNS)} のみ許可されています")
+    for idx, row in enumerate(reader, start=2):  # 2行目=データ1行目
+        yield idx, (row.get('student_id') or '').strip(), (row.get('lab_id') or '').strip(), \
+            (row.get('rank') or '').strip()
+
+
+def iter_ndjson_rows(lines: Iterable[str]) -> Iterator[Row]:
+    for idx, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield idx, None, None, None
+            continue
+        if not isinstance(item, dict):
+            yield idx, None, None, None
+            continue
+        sid, lab_id = item.get('student_id'), item.get('lab_id')
+        yield idx, str(sid).strip() if sid is not None else '', str(lab_id).strip() if lab_id is not None else '', \
+            item.get('rank')
+
+
+def parse_rank(value) -> Optional[int]:
+    """1以上の整数（CSVの "3" を含む）を返す。それ以外は None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        # isdigit() は '²' 等の数字も真になるが int() で変換できないため ASCII に限る
+        if not (value.isascii() and value.isdigit()):
+            return None
+        value = int(value)
+    if not isinstance(value, int) or value < 1:
+        return None
+    return value
+
+
+class ValidatedPreferences:
+    def __init__(self):
+        self.prefs: Dict[str, Dict[str, int]] = {}  # student_id → {lab_id: rank}
+        self.row_of: Dict[Tuple[str, str], int] = {}  # (student_id, lab_id) → 行番号
+        self.errors: List[dict] = []
+        self.invalid_students: Set[str] = set()  # エラー行のある（存在する）学生
+        self.rows = 0
+
+    def insert_rows(self) -> List[dict]:
+        return [{"student_id": sid, "lab_id": lab_id, "rank": rank}
+                for sid, prefs in self.prefs.items() for lab_id, rank in prefs.items()]
+
+    def drop_invalid_students(self) -> List[str]:
+        """エラー行のある学生を取り除き、その student_id を返す（replace で希望の一部だけを置き換えない）"""
+        for sid in self.invalid_students:
+            self.prefs.pop(sid, None)
+        return sorted(self.invalid_students)
+
+    def plan_upsert(self, existing: Dict[str, Dict[str, Tuple[int, int]]]) -> Tuple[List[dict], List[dict]]:
+        """既存の希望 {student_id: {lab_id: (id, rank)}} に重ねる (UPDATE行 [{id, rank}], INSERT行) を返す
+
+        ファイルに無い既存の希望と rank が重なる行はエラーとして登録しない。
+        """
+        updates: List[dict] = []
+        inserts: List[dict] = []
+        for sid, prefs in self.prefs.items():
+            current = existing.get(sid, {})
+            kept_ranks = {rank for lab_id, (_, rank) in current.items() if lab_id not in prefs}
+            for lab_id, rank in prefs.items():
+                if rank in kept_ranks:
+                    self.errors.append({"row": self.row_of[(sid, lab_id)], "error": "rankが既存の希望と重複しています"})
+                elif lab_id in current:
+                    pref_id, old_rank = current[lab_id]
+                    if rank != old_rank:
+                        updates.append({"id": pref_id, "rank": rank})
+                else:
+                    inserts.append({"student_id": sid, "lab_id": lab_id, "rank": rank})
+        self.errors.sort(key=lambda e: e["row"])
+        return updates, inserts
+
+
+def validate_rows(rows: Iterable[Row], student_ids: Set[str], lab_ids: Set[str]) -> ValidatedPreferences:
+    """行を1パスで検証する。同じ学生の2件目以降の rank・lab_id の重複はその行をエラーとする
+
+    エラー行のある既存の学生は invalid_students に記録する（replace ではその学生を丸ごと読み飛ばす）。
+    """
+    result = ValidatedPreferences()
+    used_ranks: Dict[str, Set[int]] = {}
+
+    def fail(idx: int, sid: Optional[str], message: str):
+        result.errors.append({"row": idx, "error": message})
+        if sid in student_ids:
+            result.invalid_students.add(sid)
+
+    for idx, sid, lab_id, raw_rank in rows:
+        result.rows += 1
+        if sid is None:
+            fail(idx, sid, "JSONオブジェクトとして読み込めません")
+            continue
+        if not sid or not lab_id or raw_rank in (None, ''):
+            fail(idx, sid, "student_id, lab_id, rankは必須です")
+            continue
+        rank = parse_rank(raw_rank)
+        if rank is None:
+            fail(idx, sid, "rankは1以上の整数で入力してください")
+            continue
+        if sid not in student_ids:
+            fail(idx, sid, "student_idが存在しません")
+            continue
+        if lab_id not in lab_ids:
+            fail(idx, sid, "lab_idが存在しません")
+            continue
+        prefs = result.prefs.setdefault(sid, {})
+        ranks = used_ranks.setdefault(sid, set())
+        if lab_id in prefs:
+            fail(idx, sid, "同じ学生のlab_idが重複しています")
+            continue
+        if rank in ranks:
+            fail(idx, sid, "同じ学生のrankが重複しています")
+            continue
+        prefs[lab_id] = rank
+        ranks.add(rank)
+        result.row_of[(sid, lab_id)] = idx
+    return result
+
+
+def diff_preferences(current: Dict[str, Tuple[int, int]], desired: Dict[str, int]
+                     ) -> Tuple[List[int], List[dict], List[dict]]:
+    """既存の希望 {lab_id: (id, rank)} を desired {lab_id: rank} にするための最小の変更を返す
+
+    (DELETEする id, UPDATE行 [{id, rank}], INSERT行 [{lab_id, rank}])。変更が無ければすべて空。
+    """
+    deletes = [pref_id for lab_id, (pref_id, _) in current.items() if lab_id not in desired]
+    updates: List[dict] = []
+    inserts: List[dict] = []
+    for lab_id, rank in desired.items():
+        if lab_id not in current:
+            inserts.append({"lab_id": lab_id, "rank": rank})
+        elif current[lab_id][1] != rank:
+            updates.append({"id": current[lab_id][0], "rank": rank})
+    return deletes, updates, inserts
@@ -0,0 +1,226 @@
+# SQLite同時書き込みのベンチマーク
+# 一時ファイルのDBに学生・希望を用意し、希望登録（既存の希望を読んで差分を書き込む）を複数プロセスから
+# 同時に行いながら、読み取りプロセスが希望一覧を読み続ける。接続プロファイルごとに
+# 書き込みレイテンシ（p50/p95/p99）・スループット・"database is locked" の件数を計測してJSONで保存する。
+#
+#   baseline : 変更前の構成（ロールバックジャーナル・PRAGMA設定なし・読み取りも同じプール）
+#   tuned    : sqlite_profile の既定（WAL・synchronous=NORMAL・busy_timeout 等、読み取りは読み取り専用プール）
+#
+#   python sqlite_benchmark.py --writers 4 --readers 4 --seconds 5 --output sqlite_bench.json
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import sqlalchemy as sa
+
+from preference_import import diff_preferences
+from sqlite_profile import DEFAULT_PRAGMAS, create_read_engine, install_pragmas
+
+POOL_OPTIONS = {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30}
+PROFILES: Dict[str, dict] = {
+    "baseline": {"pragmas": {"journal_mode": "DELETE"}, "read_pool": False},
+    "tuned": {"pragmas": DEFAULT_PRAGMAS, "read_pool": True},
+}
+
+metadata = sa.MetaData()
+preferences = sa.Table(
+    'preferences', metadata,
+    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+    sa.Column('student_id', sa.String(16), nullable=False),
+    sa.Column('lab_id', sa.String(16), nullable=False),
+    sa.Column('rank', sa.Integer, nullable=False),
+    sa.UniqueConstraint('student_id', 'lab_id'),
+    sa.Index('ix_bench_preferences_student', 'student_id', 'rank'),
+)
+
+
+def random_prefs(rng: random.Random, lab_ids: Sequence[str], pref_length: int) -> Dict[str, int]:
+    return {lab_id: k + 1 for k, lab_id in enumerate(rng.sample(lab_ids, pref_length))}
+
+
+def seed_database(engine: sa.engine.Engine, students: int, labs: int, pref_length: int, seed: int):
+    rng = random.Random(seed)
+    lab_ids = [f"L{j:03d}" for j in range(labs)]
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(preferences.insert(), [
+            {"student_id": f"S{i:06d}", "lab_id": lab_id, "rank": rank}
+            for i in range(students) for lab_id, rank in random_prefs(rng, lab_ids, pref_length).items()])
+
+
+def write_preferences(engine: sa.engine.Engine, sid: str, desired: Dict[str, int]):
+    """希望登録APIと同じく、既存の希望を読んで差分だけを1トランザクションで書き込む"""
+    with engine.begin() as conn:
+        current = {lab_id: (pref_id, rank) for pref_id, lab_id, rank in conn.execute(
+            sa.select(preferences.c.id, preferences.c.lab_id, preferences.c.rank)
+            .where(preferences.c.student_id == sid))}
+        deletes, updates, inserts = diff_preferences(current, desired)
+        if deletes:
+            conn.execute(preferences.delete().where(preferences.c.id.in_(deletes)))
+        for row in updates:
+            conn.execute(preferences.update().where(preferences.c.id == row["id"]).values(rank=row["rank"]))
+        if inserts:
+            conn.execute(preferences.insert(), [dict(row, student_id=sid) for row in inserts])
+
+
+def read_preferences(engine: sa.engine.Engine, sid: str):
+    with engine.connect() as conn:
+        return conn.execute(sa.select(preferences.c.lab_id, preferences.c.rank)
+                            .where(preferences.c.student_id == sid).order_by(preferences.c.rank)).fetchall()
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def _connect(profile: dict, path: str, read: bool = False) -> sa.engine.Engine:
+    url = sa.engine.URL.create('sqlite', database=path)
+    if read and profile["read_pool"]:
+        return create_read_engine(url, profile["pragmas"], POOL_OPTIONS)
+    engine = sa.create_engine(url, **POOL_OPTIONS)
+    install_pragmas(engine, profile["pragmas"])
+    return engine
+
+
+def _writer_process(results, barrier, name: str, path: str, seconds: float, students: int, labs: int,
+                    pref_length: int, seed: int):
+    engine = _connect(PROFILES[name], path)
+    rng = random.Random(seed)
+    lab_ids = [f"L{j:03d}" for j in range(labs)]
+    latencies, locked, conflicts = [], 0, 0
+    barrier.wait()
+    stop_at = time.perf_counter() + seconds
+    while time.perf_counter() < stop_at:
+        sid = f"S{rng.randrange(students):06d}"
+        desired = random_prefs(rng, lab_ids, pref_length)
+        begin = time.perf_counter()
+        try:
+            write_preferences(engine, sid, desired)
+        except sa.exc.IntegrityError:
+            # 同じ学生への同時書き込み（読み取りと書き込みの間に他の書き込みが入った）
+            conflicts += 1
+            continue
+        except sa.exc.OperationalError:
+            locked += 1
+            continue
+        latencies.append((time.perf_counter() - begin) * 1000)
+    engine.dispose()
+    results.put(("write", {"latencies": latencies, "locked": locked, "conflicts": conflicts}))
+
+
+def _reader_process(results, barrier, name: str, path: str, seconds: float, students: int, seed: int):
+    engine = _connect(PROFILES[name], path, read=True)
+    rng = random.Random(seed)
+    reads, locked = 0, 0
+    barrier.wait()
+    stop_at = time.perf_counter() + seconds
+    while time.perf_counter() < stop_at:
+        try:
+            read_preferences(engine, f"S{rng.randrange(students):06d}")
+            reads += 1
+        except sa.exc.OperationalError:
+            locked += 1
+    engine.dispose()
+    results.put(("read", {"reads": reads, "locked": locked}))
+
+
+def run_profile(name: str, path: str, writers: int = 4, readers: int = 4, seconds: float = 3.0,
+                students: int = 2000, labs: int = 50, pref_length: int = 5, seed: int = 0) -> dict:
+    """書き込み・読み取りをそれぞれ別プロセス（複数ワーカー構成を模す）で同時に実行する"""
+    engine = _connect(PROFILES[name], path)
+    seed_database(engine, students, labs, pref_length, seed)
+    engine.dispose()
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(writers + readers)  # 全プロセスの接続準備が済んでから一斉に開始する
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_writer_process, args=(results, barrier, name, path, seconds, students, labs,
+                                                            pref_length, seed * 1000 + w)) for w in range(writers)]
+    processes += [ctx.Process(target=_reader_process, args=(results, barrier, name, path, seconds, students,
+                                                            seed * 1000 + writers + r)) for r in range(readers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    write_results = [r for role, r in collected if role == "write"]
+    read_results = [r for role, r in collected if role == "read"]
+
+    latencies = [v for r in write_results for v in r["latencies"]]
+    reads = sum(r["reads"] for r in read_results)
+    return {
+        "profile": name,
+        "writers": writers,
+        "readers": readers,
+        "writes": len(latencies),
+        "write_locked": sum(r["locked"] for r in write_results),
+        "write_conflicts": sum(r["conflicts"] for r in write_results),
+        "reads": reads,
+        "read_locked": sum(r["locked"] for r in read_results),
+        "writes_per_sec": round(len(latencies) / seconds, 1),
+        "reads_per_sec": round(reads / seconds, 1),
+        "write_p50_ms": percentile(latencies, 50),
+        "write_p95_ms": percentile(latencies, 95),
+        "write_p99_ms": percentile(latencies, 99),
+        "write_max_ms": round(max(latencies), 3) if latencies else None,
+    }
+
+
+def run_benchmark(profiles: Sequence[str] = tuple(PROFILES), directory: Optional[str] = None, **options) -> dict:
+    """プロファイルごとに新しい一時DBファイルで計測する"""
+    results = []
+    for name in profiles:
+        with tempfile.TemporaryDirectory(dir=directory) as tmp:
+            results.append(run_profile(name, os.path.join(tmp, 'bench.db'), **options))
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "options": options,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite同時書き込みのベンチマーク")
+    parser.add_argument('--profiles', default=','.join(PROFILES), help="計測する接続プロファイル（カンマ区切り）")
+    parser.add_argument('--writers', type=int, default=4, help="書き込みプロセス数")
+    parser.add_argument('--readers', type=int, default=4, help="読み取りプロセス数")
+    parser.add_argument('--seconds', type=float, default=5.0, help="プロファイルごとの計測時間（秒）")
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--labs', type=int, default=50)
+    parser.add_argument('--pref-length', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', help="一時DBを作るディレクトリ（本番と同じディスクで計測する場合に指定）")
+    parser.add_argument('--output', help="結果JSONの保存先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    profiles = [p for p in args.profiles.split(',') if p]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        parser.error(f"不明なプロファイル: {', '.join(unknown)}")
+    report = run_benchmark(profiles, directory=args.dir, writers=args.writers, readers=args.readers,
+                           seconds=args.seconds, students=args.students, labs=args.labs,
+                           pref_length=args.pref_length, seed=args.seed)
+    for r in report["results"]:
+        print(f"{r['profile']:>10}  {r['writes_per_sec']:>9.1f} writes/s  {r['reads_per_sec']:>9.1f} reads/s  "
+              f"p50 {r['write_p50_ms'] or 0:>8.2f} ms  p99 {r['write_p99_ms'] or 0:>8.2f} ms  "
+              f"locked {r['write_locked'] + r['read_locked']}", file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
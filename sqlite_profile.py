@@ -0,0 +1,105 @@
+# SQLiteの接続プロファイル
+# 書き込みの同時実行で "database is locked" が出ないよう、接続ごとに PRAGMA（WAL・busy_timeout 等）を設定する。
+# ファイルDBでは GET リクエストの読み取りを読み取り専用の別プール（mode=ro）に振り分け、
+# 書き込み用プールの接続を読み取りで占有しないようにする。WAL では読み取りは書き込みを待たない。
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+# 既定のPRAGMA（None の項目は設定しない）
+DEFAULT_PRAGMAS: Dict[str, object] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # WALではコミットごとのfsyncを省いても破損しない（電源断時は直近のコミットのみ失われうる）
+    "busy_timeout": 5000,  # ミリ秒。ロック待ちを即エラーにしない
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # 負値はKiB単位（64MiB）
+    "temp_store": "MEMORY",
+}
+# 読み取り専用接続では変更できない（DBファイル側の設定）ため除外するPRAGMA
+WRITE_ONLY_PRAGMAS = ("journal_mode",)
+READ_ENGINE_KEY = 'sqlite_read_engine'
+
+
+def is_file_sqlite(url) -> bool:
+    url = sa.engine.make_url(url)
+    return url.drivername in {"sqlite", "sqlite+pysqlite"} and url.database not in (None, "", ":memory:")
+
+
+def pool_options(config) -> dict:
+    """複数ワーカー・スレッドで共有する書き込み用プールの設定（SQLALCHEMY_ENGINE_OPTIONS）"""
+    return {
+        "pool_size": config['SQLITE_POOL_SIZE'],
+        "max_overflow": config['SQLITE_MAX_OVERFLOW'],
+        "pool_timeout": config['SQLITE_POOL_TIMEOUT'],
+    }
+
+
+def install_pragmas(engine: sa.engine.Engine, pragmas: Dict[str, object], read_only: bool = False):
+    """接続を作るたびに PRAGMA を設定する（SQLite以外のエンジンには何もしない）"""
+    if engine.dialect.name != 'sqlite':
+        return
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()
+                  if value is not None and not (read_only and name in WRITE_ONLY_PRAGMAS)]
+
+    @sa.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def read_only_url(url) -> sa.engine.URL:
+    """書き込み用と同じファイルを mode=ro で開くURL"""
+    url = sa.engine.make_url(url)
+    return url.set(database=f"file:{url.database}?mode=ro", query={"uri": "true"})
+
+
+def create_read_engine(url, pragmas: Dict[str, object], options: Optional[dict] = None) -> sa.engine.Engine:
+    engine = sa.create_engine(read_only_url(url), **(options or {}))
+    install_pragmas(engine, pragmas, read_only=True)
+    return engine
+
+
+@contextmanager
+def read_transaction(engine: sa.engine.Engine) -> Iterator[sa.engine.Connection]:
+    """1つの読み取りトランザクション（BEGIN DEFERRED）の接続を返し、終了時にロールバックする
+
+    pysqlite は SELECT だけではトランザクションを開始しないため明示的に BEGIN する。
+    書き込みロックは取らず、WAL では開始後の他の書き込みは見えない（複数の SELECT が同じ時点を読む）。
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+def read_engine() -> Optional[sa.engine.Engine]:
+    """現在のリクエストが読み取り専用プールを使うべきならそのエンジンを返す"""
+    if not has_request_context() or not g.get('read_only_db'):
+        return None
+    return current_app.extensions.get(READ_ENGINE_KEY)
+
+
+class RoutingSession(Session):
+    """GETリクエスト中の読み取りだけを読み取り専用プールへ振り分けるセッション
+
+    書き込み（flush・INSERT/UPDATE/DELETE文）は常に書き込み用のエンジンを使う。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and not self._flushing and not isinstance(clause, UpdateBase):
+            engine = read_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
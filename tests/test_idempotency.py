@@ -0,0 +1,162 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from app import app, db, idempotency_store, matching_runner, IdempotencyRecord, MatchingJob
+from idempotency import IdempotencyConflict, IdempotencyInProgress, IdempotencyStore
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_idempotency@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_idempotency@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client):
+    student = {"student_id": "20250001", "name": "学生1", "email": "s1@example.com", "gpa": 3.0}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボA", "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+
+
+def test_store_concurrent_duplicate_waits_for_first():
+    store = IdempotencyStore()
+    assert store.begin("k", "fp") is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(store.begin("k", "fp")))
+    waiter.start()
+    time.sleep(0.05)
+    assert results == []
+    store.finish("k", {"fingerprint": "fp", "status": 201})
+    waiter.join(timeout=5)
+    assert results == [{"fingerprint": "fp", "status": 201}]
+
+
+def test_store_abort_lets_waiter_retry_and_timeout():
+    store = IdempotencyStore(wait_timeout=0.05)
+    assert store.begin("k", "fp") is None
+    with pytest.raises(IdempotencyInProgress):
+        store.begin("k", "fp")
+    store.abort("k")
+    assert store.begin("k", "fp") is None
+
+
+def test_store_fingerprint_mismatch_ttl_and_bound():
+    store = IdempotencyStore(ttl=0.05, max_entries=2)
+    for key in ["a", "b", "c"]:
+        store.begin(key, "fp")
+        store.finish(key, {"fingerprint": "fp"})
+    with pytest.raises(IdempotencyConflict):
+        store.begin("c", "other")
+    # 件数上限を超えた最古のキーは追い出される
+    assert store.begin("a", "fp") is None
+    store.abort("a")
+    time.sleep(0.1)
+    assert store.begin("c", "fp") is None
+
+
+def test_preferences_replayed_with_same_key(client):
+    setup_cohort(client)
+    payload = json.dumps({"student_id": "20250001", "preferences": [{"lab_id": "LAB01", "rank": 1}]})
+    headers = {"Idempotency-Key": "pref-replay-1"}
+    first = client.post("/api/v1/preferences", data=payload, content_type="application/json", headers=headers)
+    second = client.post("/api/v1/preferences", data=payload, content_type="application/json", headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    with app.app_context():
+        assert db.session.query(IdempotencyRecord).count() == 1
+
+
+def test_same_key_with_different_body_is_rejected(client):
+    setup_cohort(client)
+    headers = {"Idempotency-Key": "pref-conflict-1"}
+    for rank, expected in [(1, 200), (2, 422)]:
+        payload = json.dumps({"student_id": "20250001", "preferences": [{"lab_id": "LAB01", "rank": rank}]})
+        res = client.post("/api/v1/preferences", data=payload, content_type="application/json", headers=headers)
+        assert res.status_code == expected
+    assert res.get_json()["error"] == "Unprocessable Entity"
+
+
+def test_in_progress_key_returns_json_409(client, monkeypatch):
+    def still_running(key, fingerprint, load=None):
+        raise IdempotencyInProgress("同じIdempotency-Keyのリクエストが処理中です")
+
+    monkeypatch.setattr(idempotency_store, "begin", still_running)
+    payload = json.dumps({"student_id": "20250001", "preferences": []})
+    res = client.post("/api/v1/preferences", data=payload, content_type="application/json",
+                      headers={"Idempotency-Key": "pref-busy-1"})
+    assert res.status_code == 409
+    assert res.get_json()["error"] == "Conflict"
+    assert "処理中" in res.get_json()["message"]
+
+
+def test_too_long_key_is_rejected(client):
+    payload = json.dumps({"student_id": "20250001", "preferences": []})
+    res = client.post("/api/v1/preferences", data=payload, content_type="application/json",
+                      headers={"Idempotency-Key": "x" * 256})
+    assert res.status_code == 400
+
+
+def test_replay_survives_memory_eviction(client):
+    setup_cohort(client)
+    payload = json.dumps({"student_id": "20250001", "preferences": [{"lab_id": "LAB01", "rank": 1}]})
+    headers = {"Idempotency-Key": "pref-db-1"}
+    first = client.post("/api/v1/preferences", data=payload, content_type="application/json", headers=headers)
+    idempotency_store._records.clear()
+    second = client.post("/api/v1/preferences", data=payload, content_type="application/json", headers=headers)
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert second.get_json() == first.get_json()
+
+
+def test_matching_run_with_same_key_starts_one_job(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "run-once-1"}
+    first = client.post("/api/v1/admin/matching/run", json={}, headers=headers)
+    second = client.post("/api/v1/admin/matching/run", json={}, headers=headers)
+    assert first.status_code == 202
+    assert second.status_code == 202
+    assert second.get_json()["job_id"] == first.get_json()["job_id"]
+    matching_runner.wait(first.get_json()["job_id"], timeout=10)
+    with app.app_context():
+        assert db.session.query(MatchingJob).count() == 1
+    # キーが違えば新しいジョブになる（キャッシュを通らないようトレース付きで実行）
+    third = client.post("/api/v1/admin/matching/run", json={"trace": True},
+                        headers={"Authorization": f"Bearer {token}", "Idempotency-Key": "run-once-2"})
+    assert third.get_json()["job_id"] != first.get_json()["job_id"]
+    matching_runner.wait(third.get_json()["job_id"], timeout=10)
+
+
+def test_multipart_fingerprint_covers_file_contents(client):
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "import-csv-1"}
+
+    def upload(csv_content):
+        data = {'file': (io.BytesIO(csv_content.encode('utf-8')), 'students.csv')}
+        return client.post('/api/v1/admin/students/import', data=data, headers=headers,
+                           content_type='multipart/form-data')
+
+    first = upload("student_id,name,email,gpa\n20259001,学生A,a@example.com,3.1\n")
+    assert first.status_code == 200 and first.get_json()["imported"] == 1
+    # 同じ内容の再送（boundary は送信ごとに変わる）は再実行せず最初の応答を返す
+    second = upload("student_id,name,email,gpa\n20259001,学生A,a@example.com,3.1\n")
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert second.get_json() == first.get_json()
+    # 長さが同じでも内容の違うファイルは別のリクエスト
+    third = upload("student_id,name,email,gpa\n20259002,学生B,b@example.com,3.2\n")
+    assert third.status_code == 422
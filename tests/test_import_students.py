@@ -53,3 +53,39 @@ def test_import_students_error(client):
     assert len(res_json["errors"]) == 2
     assert any("student_idが既に存在" in e["error"] for e in res_json["errors"])
     assert any("gpaは数値" in e["error"] or "全カラム必須" in e["error"] for e in res_json["errors"])
+
+def test_import_students_in_chunks(client):
+    from sqlalchemy import event
+    from app import app, db, Student
+    token = get_admin_token(client)
+    with app.app_context():
+        db.session.add(Student(student_id="20259999", name="既存", email="old@example.com", gpa=3.0))
+        db.session.commit()
+    lines = ["student_id,name,email,gpa"]
+    lines += [f"2025{i:04d},学生{i},s{i}@example.com,3.{i % 10}" for i in range(1, 8)]
+    # チャンク内の重複・前のチャンクとの重複・既存の学生
+    lines += ["20250007,重複,dup@example.com,3.0", "20250001,重複,dup@example.com,3.0",
+              "20259999,既存,old@example.com,3.0"]
+    data = {'file': (io.BytesIO("\n".join(lines).encode('utf-8')), 'students.csv')}
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    app.config['STUDENT_IMPORT_CHUNK'] = 4
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        response = client.post("/api/v1/admin/students/import", headers={"Authorization": f"Bearer {token}"},
+                               content_type='multipart/form-data', data=data)
+    finally:
+        app.config['STUDENT_IMPORT_CHUNK'] = 1000
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", listener)
+    res_json = response.get_json()
+    assert res_json["imported"] == 7
+    assert res_json["rows"] == 10 and res_json["chunks"] == 3
+    assert res_json["rows_per_sec"] > 0
+    assert [e["row"] for e in res_json["errors"]] == [9, 10, 11]
+    assert all("student_idが既に存在" in e["error"] for e in res_json["errors"])
+    # 重複確認はチャンクごとに1回
+    assert sum(1 for sql in statements if sql.startswith("SELECT students.student_id")) == 3
+    with app.app_context():
+        assert db.session.query(Student).count() == 8
@@ -0,0 +1,44 @@
+import random
+from array import array
+
+from matching_arrays import MatchingArrays, deferred_acceptance_np, satisfaction_array
+from matching_engine import deferred_acceptance, satisfaction_score
+from matching_snapshot import MatchingSnapshot
+
+
+def random_snapshot(seed, num_students=50, num_labs=6):
+    rng = random.Random(seed)
+    ptr, labs = array('i', [0]), array('i')
+    for _ in range(num_students):
+        p = list(range(num_labs))
+        rng.shuffle(p)
+        labs.extend(p[:rng.randint(0, num_labs)])
+        ptr.append(len(labs))
+    gpa = array('d', [round(rng.uniform(2.0, 4.0), 1) for _ in range(num_students)])
+    capacity = array('i', [rng.randint(0, 12) for _ in range(num_labs)])
+    special = {lab: rng.sample(range(num_students), rng.randint(0, 2)) for lab in range(num_labs)}
+    return MatchingSnapshot([f"S{i}" for i in range(num_students)], gpa, [f"L{j}" for j in range(num_labs)],
+                            capacity, ptr, labs, special)
+
+
+def test_encoding_builds_rank_and_inverse_rank_matrices():
+    snapshot = random_snapshot(0, num_students=5, num_labs=4)
+    arrays = MatchingArrays.from_snapshot(snapshot)
+    for s, p in enumerate(snapshot.prefs):
+        assert arrays.pref[s, :len(p)].tolist() == p
+        assert (arrays.pref[s, len(p):] == -1).all()
+        for rank, lab in enumerate(p, start=1):
+            assert arrays.inv_rank[s, lab] == rank
+        assert (arrays.inv_rank[s] > 0).sum() == len(p)
+
+
+def test_matches_heap_engine():
+    for seed in range(50):
+        snapshot = random_snapshot(seed)
+        expected = deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity, snapshot.special)
+        arrays = MatchingArrays.from_snapshot(snapshot)
+        outcome = deferred_acceptance_np(arrays)
+        assert outcome.assignment.tolist() == expected.assignment
+        assert outcome.ranks.tolist() == expected.ranks
+        satisfaction = [satisfaction_score(r, len(p)) for r, p in zip(expected.ranks, snapshot.prefs)]
+        assert satisfaction_array(outcome.ranks, arrays.pref_len).tolist() == satisfaction
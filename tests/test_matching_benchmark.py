@@ -0,0 +1,43 @@
+from collections import Counter
+
+from matching_benchmark import run_benchmark
+from matching_strategies import STRATEGIES
+from matching_synthetic import generate_cohort
+
+
+def test_generate_cohort_shape_and_determinism():
+    snapshot = generate_cohort(500, 20, pref_length=5, seed=3)
+    assert snapshot.num_students == 500 and snapshot.num_labs == 20
+    assert all(len(p) == 5 and len(set(p)) == 5 for p in snapshot.prefs)
+    assert sum(snapshot.capacity) == 500
+    assert all(0.0 <= g <= 4.0 for g in snapshot.gpa)
+    assert generate_cohort(500, 20, pref_length=5, seed=3).prefs == snapshot.prefs
+    # 全研究室を希望する場合は順列になる
+    assert all(sorted(p) == list(range(6)) for p in generate_cohort(50, 6, seed=1).prefs)
+
+
+def test_generate_cohort_skew_concentrates_first_choices():
+    uniform = Counter(p[0] for p in generate_cohort(4000, 20, pref_length=3, skew=0.0, seed=1).prefs)
+    skewed = Counter(p[0] for p in generate_cohort(4000, 20, pref_length=3, skew=1.5, seed=1).prefs)
+    assert skewed.most_common(1)[0][1] > 2 * uniform.most_common(1)[0][1]
+
+
+def test_run_benchmark_reports_every_engine():
+    report = run_benchmark([200, 400], num_labs=10, pref_length=4, repeat=1)
+    assert [(r["strategy"], r["students"]) for r in report["results"]] == \
+        [(e, n) for n in (200, 400) for e in STRATEGIES]
+    for r in report["results"]:
+        assert r["wall_ms"] > 0 and r["peak_memory_mb"] > 0 and r["proposals"] > 0
+    heap, vectorized = [r for r in report["results"] if r["strategy"].startswith("gale_shapley")][:2]
+    assert heap["assigned"] == vectorized["assigned"]
+    assert heap["average_satisfaction"] == vectorized["average_satisfaction"]
+
+
+def test_run_benchmark_measures_trace_overhead():
+    report = run_benchmark([300], num_labs=10, pref_length=4, strategies=['gale_shapley', 'boston'], repeat=1,
+                           trace=True)
+    assert [(r["strategy"], r.get("trace", False)) for r in report["results"]] == \
+        [('gale_shapley', False), ('gale_shapley', True), ('boston', False)]
+    plain, traced = report["results"][:2]
+    assert traced["assigned"] == plain["assigned"]
+    assert "trace_overhead_pct" in traced
@@ -0,0 +1,109 @@
+import json
+import os
+from array import array
+
+from app import matching_runner
+from matching_cache import BatchCache, snapshot_hash
+from matching_snapshot import MatchingSnapshot
+
+
+def make_snapshot(gpa=3.0, capacity=1, special=None):
+    return MatchingSnapshot(["S1", "S2"], array('d', [gpa, 2.0]), ["L1", "L2"], array('i', [capacity, 1]),
+                            array('i', [0, 2, 3]), array('i', [0, 1, 1]), special or {})
+
+
+def test_snapshot_hash_covers_every_input():
+    base = snapshot_hash(make_snapshot(), "v1")
+    assert base == snapshot_hash(make_snapshot(), "v1")
+    assert base != snapshot_hash(make_snapshot(), "v2")
+    assert base != snapshot_hash(make_snapshot(gpa=3.1), "v1")
+    assert base != snapshot_hash(make_snapshot(capacity=2), "v1")
+    assert base != snapshot_hash(make_snapshot(special={0: [1]}), "v1")
+
+
+def test_batch_cache_is_bounded(tmp_path):
+    cache = BatchCache(str(tmp_path), max_memory=2, max_disk=3)
+    for i in range(5):
+        cache.put(f"h{i}", {"batch_id": f"b{i}"})
+        os.utime(tmp_path / f"h{i}.json", (i, i))
+    assert len(list(tmp_path.glob("*.json"))) <= 3
+    assert cache.get("h4") == {"batch_id": "b4"}
+    # メモリから追い出されてもディスクから復元できる
+    assert cache.get("h2") == {"batch_id": "b2"}
+    assert cache.get("h0") is None
+    cache.discard("h2")
+    assert BatchCache(str(tmp_path)).get("h2") is None
+
+
+def get_admin_token(client):
+    admin_data = {"email": "admin_cache@example.com", "password": "adminpass", "role": "admin"}
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    res = client.post("/api/v1/auth/login", data=json.dumps({"email": "admin_cache@example.com", "password": "adminpass"}),
+                      content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_unchanged_input_returns_stored_batch(client):
+    student = {"student_id": "20256666", "name": "キャッシュ", "email": "cache@example.com", "gpa": 3.3}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボK", "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    first = client.post("/api/v1/admin/matching/run", headers=headers)
+    assert first.status_code == 202
+    matching_runner.wait(first.get_json()["job_id"], timeout=10)
+    second = client.post("/api/v1/admin/matching/run", headers=headers)
+    assert second.status_code == 200
+    assert second.get_json()["cached"] is True
+    assert second.get_json()["result_id"] == first.get_json()["result_id"]
+    history = client.get("/api/v1/students/20256666/matching_history").get_json()
+    assert len(history) == 1
+    assert json.loads(history[0]["summary"])["input_hash"] == first.get_json()["input_hash"]
+
+    # 希望を変更すると新しいバッチになる
+    prefs = {"student_id": "20256666", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    third = client.post("/api/v1/admin/matching/run", headers=headers)
+    assert third.status_code == 202
+    assert third.get_json()["input_hash"] != first.get_json()["input_hash"]
+    matching_runner.wait(third.get_json()["job_id"], timeout=10)
+
+
+def test_cached_batch_is_served_only_while_it_is_the_latest(client):
+    # gale_shapley: S1→LAB02, S2→LAB01 / boston: S2→LAB01, S3→LAB02
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025670{i}", "name": f"方式{i}", "email": f"switch{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボS1", "ラボS2"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i, labs in enumerate([["LAB01", "LAB02"], ["LAB01", "LAB02"], ["LAB02", "LAB01"]], start=1):
+        prefs = {"student_id": f"2025670{i}",
+                 "preferences": [{"lab_id": lab_id, "rank": k} for k, lab_id in enumerate(labs, start=1)]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+
+    def run(strategy):
+        res = client.post("/api/v1/admin/matching/run", data=json.dumps({"strategy": strategy}),
+                          content_type="application/json", headers=headers)
+        if res.status_code == 202:
+            matching_runner.wait(res.get_json()["job_id"], timeout=10)
+        return res.get_json()
+
+    def assigned():
+        return [client.get(f"/api/v1/students/2025670{i}/assignment").get_json()["assigned_lab"] for i in range(1, 4)]
+
+    first = run("gale_shapley")
+    assert assigned() == ["LAB02", "LAB01", None]
+    assert run("boston")["cached"] is False
+    assert assigned() == [None, "LAB01", "LAB02"]
+    # 入力は同じでも、間に別の方式のバッチがあれば保存済みバッチを返さず再実行して配属を戻す
+    third = run("gale_shapley")
+    assert third["cached"] is False and third["result_id"] != first["result_id"]
+    assert assigned() == ["LAB02", "LAB01", None]
+    assert client.get("/api/v1/matching/results").get_json()["batch_id"] == third["result_id"]
+    # 最新のままなら保存済みバッチを返す
+    fourth = run("gale_shapley")
+    assert fourth["cached"] is True and fourth["result_id"] == third["result_id"]
@@ -0,0 +1,137 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+import sqlalchemy as sa
+
+from app import app, db, Laboratory, MatchingBatch, MatchingInputSnapshot, Preference, Student
+
+
+def setup_cohort(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025400{i}", "name": f"学生{i}", "email": f"cli{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボA", "ラボB"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i in range(1, 4):
+        prefs = [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}]
+        client.post("/api/v1/preferences", data=json.dumps({"student_id": f"2025400{i}", "preferences": prefs}),
+                    content_type="application/json")
+
+
+def invoke(*args):
+    return app.test_cli_runner().invoke(args=["matching", *args])
+
+
+def test_run_saves_batch_then_verify_and_export(client):
+    setup_cohort(client)
+    result = invoke("run")
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.stdout)
+    assert data["dry_run"] is False and data["snapshot_id"] is not None
+    run = data["runs"][0]
+    assert run["strategy"] == "gale_shapley"
+    assert set(run["timings"]) == {"load", "match", "verify", "save"}
+    assert run["summary"]["verification"]["ok"] is True
+    with app.app_context():
+        assert db.session.query(MatchingBatch.batch_id).scalar() == run["batch_id"]
+        assert db.session.get(Student, "20254002").assigned_lab == "LAB01"
+
+    assert invoke("verify", "--snapshot", str(data["snapshot_id"])).exit_code == 0
+    export = invoke("export")
+    assert export.stdout.splitlines() == [
+        "student_id,assigned_lab,satisfaction",
+        "20254001,LAB02,50",
+        "20254002,LAB01,100",
+        "20254003,,0",
+    ]
+    lines = invoke("export", "--batch-id", run["batch_id"], "--format", "ndjson").stdout.splitlines()
+    assert json.loads(lines[2]) == {"student_id": "20254003", "assigned_lab": None, "satisfaction": 0}
+
+
+def test_dry_run_writes_nothing(client):
+    setup_cohort(client)
+    result = invoke("run", "--dry-run")
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.stdout)
+    assert data["snapshot_id"] is None and data["runs"][0]["batch_id"] is None
+    assert data["runs"][0]["summary"]["assigned"] == 2
+    with app.app_context():
+        assert db.session.query(MatchingBatch).count() == 0
+        assert db.session.query(MatchingInputSnapshot).count() == 0
+        assert db.session.get(Student, "20254002").assigned_lab is None
+    assert invoke("export").exit_code == 1
+
+
+def test_run_compares_strategies_with_profile(client, tmp_path):
+    setup_cohort(client)
+    profile = tmp_path / "run.prof"
+    result = invoke("run", "--strategy", "gale_shapley", "--strategy", "boston", "--workers", "2",
+                    "--dry-run", "--profile", str(profile))
+    assert result.exit_code == 0, result.output
+    assert [run["strategy"] for run in json.loads(result.stdout)["runs"]] == ["gale_shapley", "boston"]
+    assert pstats.Stats(str(profile)).total_calls > 0
+    assert "cumulative" in result.stderr
+
+
+def test_run_with_several_strategies_applies_only_one(client):
+    setup_cohort(client)
+    # 方式ごとに学生の配属を上書きしないよう、反映する方式の指定が無ければ何も実行しない
+    result = invoke("run", "--strategy", "gale_shapley", "--strategy", "boston", "--workers", "1")
+    assert result.exit_code == 1 and "--apply" in result.output
+    assert invoke("run", "--strategy", "gale_shapley", "--apply", "boston").exit_code == 1
+    with app.app_context():
+        assert db.session.query(MatchingInputSnapshot).count() == 0
+
+    result = invoke("run", "--strategy", "gale_shapley", "--strategy", "boston", "--workers", "1",
+                    "--apply", "boston")
+    assert result.exit_code == 0, result.output
+    data = json.loads(result.stdout)
+    assert data["applied"] == "boston"
+    runs = {run["strategy"]: run for run in data["runs"]}
+    assert runs["gale_shapley"]["batch_id"] is None and runs["boston"]["batch_id"] is not None
+    with app.app_context():
+        assert [b for (b,) in db.session.query(MatchingBatch.batch_id)] == [runs["boston"]["batch_id"]]
+        summary = json.loads(MatchingBatch.query.filter_by(batch_id=runs["boston"]["batch_id"]).one().summary)
+        assert summary["strategy"] == "boston"
+
+
+def test_run_rejects_bad_options(client):
+    setup_cohort(client)
+    assert invoke("run", "--strategy", "nope").exit_code == 1
+    assert invoke("run", "--strategy", "boston", "--trace").exit_code == 1
+    assert invoke("run", "--snapshot", "999").exit_code == 1
+
+
+def flask_cli(tmp_path, *args):
+    """実際の flask コマンド（--app app）を別プロセスで実行する。DBは一時ファイル"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, SOTSUKEN_DATABASE_URI=f"sqlite:///{tmp_path / 'cli.db'}")
+    return subprocess.run([sys.executable, "-m", "flask", "--app", "app", *args], cwd=root, env=env,
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_flask_entry_point_loads_app_and_commands(tmp_path):
+    result = flask_cli(tmp_path, "matching", "--help")
+    assert result.returncode == 0, result.stderr
+    for command in ["run", "verify", "export", "scenarios"]:
+        assert command in result.stdout
+    result = flask_cli(tmp_path, "db", "heads")
+    assert result.returncode == 0, result.stderr
+    assert "(head)" in result.stdout
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'cli.db'}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Laboratory.__table__).values(lab_id="LAB01", lab_name="ラボA", teacher_name="佐藤",
+                                                            capacity=1))
+        conn.execute(sa.insert(Student.__table__).values(student_id="20254101", name="学生", email="s@example.com",
+                                                         gpa=3.0))
+        conn.execute(sa.insert(Preference.__table__).values(student_id="20254101", lab_id="LAB01", rank=1))
+    engine.dispose()
+    result = flask_cli(tmp_path, "matching", "run", "--dry-run")
+    assert result.returncode == 0, result.stderr
+    data = json.loads(result.stdout)
+    assert data["dry_run"] is True and data["runs"][0]["summary"]["assigned"] == 1
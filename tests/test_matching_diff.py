@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+
+from app import matching_runner
+from matching_diff import diff_batches
+from matching_storage import BatchArrays
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_diff@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_diff@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def batch(student_ids, lab_ids, assignment, satisfaction):
+    return BatchArrays(student_ids, lab_ids, np.asarray(assignment), np.asarray(satisfaction))
+
+
+def test_diff_aligns_students_and_lab_tables():
+    old = batch(["S1", "S2", "S3", "S4"], ["L1", "L2"], [0, 1, -1, 0], [100, 50, 0, 100])
+    # 研究室表の順序が違い、S4が抜けてS5が加わったバッチ
+    new = batch(["S1", "S2", "S3", "S5"], ["L3", "L2", "L1"], [2, 2, 0, 1], [100, 50, 100, 100])
+    diff = diff_batches(old, new)
+    assert list(diff.iter_moves()) == [
+        {"student_id": "S2", "from_lab": "L2", "to_lab": "L1", "from_satisfaction": 50, "to_satisfaction": 50,
+         "satisfaction_delta": 0},
+        {"student_id": "S3", "from_lab": None, "to_lab": "L3", "from_satisfaction": 0, "to_satisfaction": 100,
+         "satisfaction_delta": 100},
+    ]
+    assert diff.labs() == [
+        {"lab_id": "L1", "inflow": 1, "outflow": 0, "net": 1},
+        {"lab_id": "L2", "inflow": 0, "outflow": 1, "net": -1},
+        {"lab_id": "L3", "inflow": 1, "outflow": 0, "net": 1},
+    ]
+    summary = diff.summary()
+    assert (summary["only_in_from"], summary["only_in_to"]) == (1, 1)
+    assert summary["satisfaction"]["delta"][0] == -1 and summary["satisfaction"]["delta"][-1] == 1
+
+
+def test_diff_of_identical_batches_is_empty():
+    old = batch(["S1", "S2"], ["L1"], [0, -1], [100, 0])
+    diff = diff_batches(old, old)
+    assert diff.summary()["moved"] == 0
+    assert diff.labs() == [] and list(diff.iter_moves()) == []
+
+
+def run_batch(client, headers):
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"force": True}),
+                      content_type="application/json", headers=headers)
+    job_id = res.get_json()["job_id"]
+    matching_runner.wait(job_id, timeout=10)
+    return job_id
+
+
+def test_diff_endpoint_reports_moves_and_streams(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025700{i}", "name": f"差分{i}", "email": f"d{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボD1", "teacher_name": "佐藤", "capacity": 2, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025700{i}", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    first = run_batch(client, headers)
+
+    # 研究室を追加し、押し出されていた学生3がそちらを第1希望にする
+    lab = {"lab_name": "ラボD2", "teacher_name": "鈴木", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = {"student_id": "20257003", "preferences": [{"lab_id": "LAB02", "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    second = run_batch(client, headers)
+
+    res = client.get(f"/api/v1/admin/matching/diff?from={first}", headers=headers)
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["to"] == second and body["moved"] == 1
+    assert body["moves"][0]["student_id"] == "20257003"
+    assert (body["moves"][0]["from_lab"], body["moves"][0]["to_lab"]) == (None, "LAB02")
+    assert body["labs"] == [{"lab_id": "LAB02", "inflow": 1, "outflow": 0, "net": 1}]
+
+    res = client.get(f"/api/v1/admin/matching/diff?from={first}&to={second}&format=ndjson", headers=headers)
+    assert res.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [line["type"] for line in lines] == ["summary", "lab", "move"]
+
+    assert client.get("/api/v1/admin/matching/diff", headers=headers).status_code == 400
+    assert client.get("/api/v1/admin/matching/diff?from=nope", headers=headers).status_code == 404
@@ -0,0 +1,100 @@
+import random
+
+from matching_engine import assign_special_seats, deferred_acceptance, match_by_ids, prefs_rank, satisfaction_score
+
+
+def random_instance(seed, num_students=40, num_labs=6):
+    rng = random.Random(seed)
+    prefs = []
+    for _ in range(num_students):
+        labs = list(range(num_labs))
+        rng.shuffle(labs)
+        prefs.append(labs[:rng.randint(0, num_labs)])
+    gpa = [round(rng.uniform(2.0, 4.0), 1) for _ in range(num_students)]
+    capacity = [rng.randint(0, 8) for _ in range(num_labs)]
+    return prefs, gpa, capacity
+
+
+def priority(gpa, prefs, s, lab):
+    return (gpa[s], -(prefs[s].index(lab) + 1), -s)
+
+
+def test_terminates_when_all_preferences_full():
+    # 定員1の研究室を3人が第1希望のみで希望（旧実装では無限ループ）
+    outcome = deferred_acceptance([[0], [0], [0]], [3.0, 3.5, 2.0], [1])
+    assert outcome.assignment == [-1, 0, -1]
+    assert outcome.ranks == [0, 1, 0]
+
+
+def test_gpa_priority_displaces_weaker_student():
+    prefs = [[0, 1], [0, 1], [0]]
+    outcome = deferred_acceptance(prefs, [2.0, 3.0, 4.0], [2, 1])
+    assert outcome.assignment == [1, 0, 0]
+    assert outcome.ranks == [2, 1, 1]
+    assert outcome.proposals <= sum(len(p) for p in prefs)
+
+
+def test_special_seats_are_charged_against_capacity():
+    outcome = deferred_acceptance([[0], [0], [1]], [4.0, 2.0, 3.0], [1, 1], special={0: [1]})
+    assert outcome.assignment == [-1, 0, 1]
+
+
+def test_special_seat_conflict_follows_preference_rank():
+    # S0は両方の特別希望枠に登録されているが、第1希望のL1で特別枠を使う
+    outcome = deferred_acceptance([[1, 0], [0]], [3.0, 3.5], [1, 1], special={0: [0], 1: [0]})
+    assert outcome.assignment == [1, 0]
+    assert outcome.ranks == [1, 1]
+
+
+def test_special_seat_conflict_displaces_later_registration():
+    # L1（定員1）は先に登録されたS1を優先し、押し出されたS0は次の特別枠L0へ
+    special = {1: [1, 0], 0: [0, 2]}
+    seats = [1, 1]
+    assignment = assign_special_seats(special, 3, seats, prefs_rank([[1, 0], [1], [0]]))
+    assert assignment == [0, 1, -1]
+    assert seats == [0, 0]
+    # 研究室の列挙順を変えても結果は同じ
+    seats = [1, 1]
+    reordered = {0: [0, 2], 1: [1, 0]}
+    assert assign_special_seats(reordered, 3, seats, prefs_rank([[1, 0], [1], [0]])) == [0, 1, -1]
+
+
+def test_result_is_stable_and_within_capacity():
+    for seed in range(30):
+        prefs, gpa, capacity = random_instance(seed)
+        outcome = deferred_acceptance(prefs, gpa, capacity)
+        members = {lab: [s for s, a in enumerate(outcome.assignment) if a == lab] for lab in range(len(capacity))}
+        for lab, assigned in members.items():
+            assert len(assigned) <= capacity[lab]
+        for s, p in enumerate(prefs):
+            current = outcome.assignment[s]
+            better = p if current < 0 else p[:p.index(current)]
+            for lab in better:
+                # より希望順位の高い研究室は満員かつ全員が自分より優先されていること
+                assert len(members[lab]) == capacity[lab]
+                assert all(priority(gpa, prefs, t, lab) > priority(gpa, prefs, s, lab) for t in members[lab])
+
+
+def test_match_by_ids_returns_lab_and_satisfaction():
+    result = match_by_ids(
+        ["S1", "S2"], [3.0, None],
+        {"S1": ["L2", "L1"], "S2": ["L2", "UNKNOWN"]},
+        ["L1", "L2"], [1, 1],
+    )
+    assert result["S1"] == ("L2", 100)
+    assert result["S2"] == (None, 0)
+    assert satisfaction_score(2, 3) == 66
+
+
+def test_prefs_rank_builds_each_students_table_once():
+    prefs = [[2, 0, 2], [1]]
+    lookups = []
+
+    class Recording(list):
+        def __getitem__(self, s):
+            lookups.append(s)
+            return list.__getitem__(self, s)
+
+    rank = prefs_rank(Recording(prefs))
+    assert [rank(0, 2), rank(0, 0), rank(0, 1), rank(1, 1), rank(1, 0)] == [1, 2, 0, 1, 0]
+    assert lookups == [0, 1]
@@ -0,0 +1,217 @@
+import json
+import random
+from array import array
+
+from app import app, db, load_batch_arrays, matching_runner, MatchingBatch, Student
+from matching_engine import deferred_acceptance
+from matching_incremental import rematch_incremental, vacated_seats
+from matching_snapshot import MatchingSnapshot, patch_snapshot
+from matching_storage import unpack_ids
+from matching_verify import verify_assignment, verify_changes
+
+
+def make_snapshot(prefs, gpa, capacity, special=None):
+    ptr, labs = array('i', [0]), array('i')
+    for p in prefs:
+        labs.extend(p)
+        ptr.append(len(labs))
+    return MatchingSnapshot([f"S{i:03d}" for i in range(len(prefs))], array('d', gpa),
+                            [f"L{j}" for j in range(len(capacity))], array('i', capacity), ptr, labs, special or {})
+
+
+def test_incremental_matches_full_rerun():
+    for seed in range(500):
+        rng = random.Random(seed)
+        n, m = rng.randint(1, 40), rng.randint(1, 6)
+        prefs = [rng.sample(range(m), rng.randint(0, m)) for _ in range(n)]
+        gpa = [round(rng.uniform(2, 4), 1) for _ in range(n)]
+        capacity = [rng.randint(0, 5) for _ in range(m)]
+        special = {rng.randrange(m): rng.sample(range(n), min(n, rng.randint(1, 3)))} if rng.random() < 0.3 else {}
+        base_snapshot = make_snapshot(prefs, gpa, capacity, special)
+        base = deferred_acceptance(prefs, gpa, capacity, special)
+
+        # 削除（特別希望枠の配属者を含む）・希望変更・定員変更（増加・減少の両方）を加える
+        removed = set(rng.sample(range(n), rng.randint(0, min(n, 2)))) if rng.random() < 0.5 else set()
+        if special and rng.random() < 0.5:
+            removed.add(next(iter(special.values()))[0])
+        changes = {}
+        for _ in range(rng.randint(0, 3)):
+            s = rng.randrange(n)
+            if s not in removed:
+                changes[f"S{s:03d}"] = (gpa[s], [f"L{j}" for j in rng.sample(range(m), rng.randint(0, m))])
+        changes.update({f"S{s:03d}": None for s in removed})
+        old_capacity, capacity_changes = {}, {}
+        for _ in range(rng.randint(0, 2)):
+            lab = rng.randrange(m)
+            old_capacity.setdefault(lab, capacity[lab])
+            capacity_changes[lab] = rng.randint(0, 6)
+        snapshot, remap = patch_snapshot(base_snapshot, changes, capacity=capacity_changes)
+        assignment = [-1] * snapshot.num_students
+        for s, new in enumerate(remap.tolist()):
+            if new >= 0:
+                assignment[new] = base.assignment[s]
+        changed = {int(remap[int(sid[1:])]) for sid, change in changes.items() if change is not None}
+        vacated, vacated_special = vacated_seats(base_snapshot, base.assignment, sorted(removed))
+
+        full = deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity, snapshot.special)
+        incremental = rematch_incremental(snapshot, assignment, changed, old_capacity, vacated, vacated_special)
+        assert incremental.assignment == full.assignment, seed
+        assert list(incremental.ranks) == full.ranks, seed
+        moved = {s for s in range(snapshot.num_students) if incremental.assignment[s] != assignment[s]}
+        assert moved | changed <= set(incremental.extra["touched"]), seed
+
+
+def test_deleting_a_special_seat_holder_passes_the_seat_on():
+    # S1が削除されると、研究室0の特別希望枠は次に登録したS0に移る
+    prefs, gpa, capacity, special = [[1], [0], [0, 1]], [2.0, 3.0, 3.9], [1, 1], {0: [1, 0]}
+    base_snapshot = make_snapshot(prefs, gpa, capacity, special)
+    base = deferred_acceptance(prefs, gpa, capacity, special)
+    snapshot, remap = patch_snapshot(base_snapshot, {"S001": None})
+    assignment = [base.assignment[s] for s in (0, 2)]
+    vacated, vacated_special = vacated_seats(base_snapshot, base.assignment, [1])
+    assert (vacated, vacated_special) == ([], [0])
+    outcome = rematch_incremental(snapshot, assignment, (), None, vacated, vacated_special)
+    assert outcome.assignment == [0, 1] and outcome.extra["full_rerun"]
+
+
+def test_incremental_touches_only_the_affected_chain():
+    # 100研究室×定員1、学生iは研究室iを第1希望。1人の変更で提案は数回に収まる
+    n = 100
+    prefs = [[i, (i + 1) % n] for i in range(n)]
+    gpa = [3.0] * n
+    base = deferred_acceptance(prefs, gpa, [1] * n)
+    prefs[10] = [20, 10]
+    snapshot = make_snapshot(prefs, gpa, [1] * n)
+    outcome = rematch_incremental(snapshot, base.assignment, [10])
+    assert outcome.assignment == deferred_acceptance(prefs, gpa, [1] * n).assignment
+    assert outcome.proposals < 5
+
+
+def test_patch_snapshot_matches_rebuilt_input():
+    prefs = [[0, 1], [1], [], [2, 0], [1, 2]]
+    snapshot = make_snapshot(prefs, [3.0, 2.0, 3.5, 2.5, 3.1], [1, 2, 1], {0: [1, 3], 2: [4]})
+    patched, remap = patch_snapshot(snapshot, {
+        "S001": (3.9, ["L2", "L0", "LX"]),  # 研究室LXは入力に無い
+        "S002": None,
+        "S010": (2.2, ["L1"]),
+    }, special={"S003": ["L2", "L1"], "S001": [], "S010": ["L0"]}, capacity={1: 3})
+    assert remap.tolist() == [0, 1, -1, 2, 3]
+    assert patched.student_ids == ["S000", "S001", "S003", "S004", "S010"]
+    assert patched.prefs == [[0, 1], [2, 0], [2, 0], [1, 2], [1]]
+    assert list(patched.gpa) == [3.0, 3.9, 2.5, 3.1, 2.2]
+    assert list(patched.capacity) == [1, 3, 1]
+    # S001の登録は外れ、S003は研究室0の登録を失い研究室2・1へ登録、S010は研究室0へ追加
+    assert patched.special == {0: [4], 2: [3, 2], 1: [2]}
+
+
+def test_verify_changes_finds_the_same_pairs_as_full_verification():
+    for seed in range(200):
+        rng = random.Random(seed)
+        n, m = rng.randint(2, 30), rng.randint(1, 5)
+        prefs = [rng.sample(range(m), rng.randint(0, m)) for _ in range(n)]
+        snapshot = make_snapshot(prefs, [round(rng.uniform(2, 4), 1) for _ in range(n)],
+                                 [rng.randint(0, 4) for _ in range(m)])
+        assignment = list(deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity).assignment)
+        # 安定な配属から1人を別の研究室（または未配属）へ動かす
+        s = rng.randrange(n)
+        before = assignment[s]
+        assignment[s] = rng.randrange(-1, m)
+        full = verify_assignment(snapshot, assignment)
+        local = verify_changes(snapshot, assignment, [s], {before} - {-1})
+        assert sorted(local.blocking_pairs) == sorted(full.blocking_pairs), seed
+        assert local.capacity_violations == full.capacity_violations, seed
+        assert local.unranked_placements == full.unranked_placements, seed
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_incremental@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_incremental@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_incremental_endpoint_applies_capacity_change(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025100{i}", "name": f"学生{i}", "email": f"inc{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボI", "teacher_name": "佐藤", "capacity": 2, "field_tag": "AI"}
+    lab_id = client.post("/api/v1/laboratories", data=json.dumps(lab),
+                         content_type="application/json").get_json()["lab_id"]
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025100{i}", "preferences": [{"lab_id": lab_id, "rank": 1}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    res = client.post("/api/v1/admin/matching/run", headers=headers)
+    base_batch_id = res.get_json()["job_id"]
+    matching_runner.wait(base_batch_id, timeout=10)
+
+    res = client.post("/api/v1/admin/matching/incremental", data=json.dumps({"capacities": {lab_id: 3}}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 201
+    data = res.get_json()
+    assert data["base_batch_id"] == base_batch_id
+    assert data["moved_students"] == 1
+    assert data["summary"]["mode"] == "incremental"
+    assert data["summary"]["unassigned"] == 0
+    with app.app_context():
+        assert db.session.get(Student, "20251003").assigned_lab == lab_id
+
+    res = client.post("/api/v1/admin/matching/incremental", data=json.dumps({"capacities": {lab_id: 0}}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 400
+    res = client.post("/api/v1/admin/matching/incremental", data=json.dumps({"base_batch_id": "missing"}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 404
+
+
+def test_incremental_endpoint_writes_only_changed_rows(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5, 3.3], start=1):
+        student = {"student_id": f"2025110{i}", "name": f"学生{i}", "email": f"incd{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab_ids = []
+    for name in ["ラボJ", "ラボK"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 2, "field_tag": "AI"}
+        lab_ids.append(client.post("/api/v1/laboratories", data=json.dumps(lab),
+                                   content_type="application/json").get_json()["lab_id"])
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025110{i}", "preferences": [{"lab_id": lab_ids[0], "rank": 1},
+                                                             {"lab_id": lab_ids[1], "rank": 2}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    base_batch_id = client.post("/api/v1/admin/matching/run", headers=headers).get_json()["job_id"]
+    matching_runner.wait(base_batch_id, timeout=10)
+
+    # 学生4（GPA 3.3）が起点バッチの後に希望を登録し、学生3（GPA 2.5）を押し出す。学生1は削除
+    prefs = {"student_id": "20251104", "preferences": [{"lab_id": lab_ids[0], "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    with app.app_context():
+        db.session.delete(db.session.get(Student, "20251101"))
+        db.session.commit()
+    res = client.post("/api/v1/admin/matching/incremental",
+                      data=json.dumps({"student_ids": ["20251104", "20251101"]}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 201
+    data = res.get_json()
+    assert data["summary"]["students"] == 3
+    assert data["summary"]["verification"]["ok"]
+    with app.app_context():
+        header = MatchingBatch.query.filter_by(batch_id=data["batch_id"]).one()
+        # 行を持つのは連鎖で辿った学生（学生3・4）と削除された学生1だけ
+        assert sorted(unpack_ids(header.student_ids)) == ["20251101", "20251103", "20251104"]
+        assert load_batch_arrays(data["batch_id"]).to_dict() == {
+            "20251102": lab_ids[0], "20251103": lab_ids[1], "20251104": lab_ids[0]}
+    page = client.get(f"/api/v1/matching/results?batch_id={data['batch_id']}&limit=2").get_json()
+    assert [r["student_id"] for r in page["results"]] == ["20251102", "20251103"]
+    assert page["results"][0]["name"] == "学生2" and page["next_after"] == "20251103"
+    page = client.get(f"/api/v1/matching/results?after=20251103").get_json()
+    assert page["results"] == [{"student_id": "20251104", "name": "学生4", "assigned_lab": lab_ids[0],
+                                "lab_name": "ラボJ"}]
@@ -0,0 +1,102 @@
+import json
+import threading
+
+from app import matching_runner
+from matching_jobs import MatchingJobRunner, CANCELLED, SUCCEEDED, FAILED
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_jobs@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_jobs@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client):
+    student = {"student_id": "20254444", "name": "ジョブ太郎", "email": "job@example.com", "gpa": 3.1}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボJ", "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = {"student_id": "20254444", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+
+
+def test_runner_cancels_running_job():
+    runner = MatchingJobRunner(max_workers=1)
+    started = threading.Event()
+    reports = []
+
+    def job(ctx):
+        with ctx.phase_timer('match'):
+            started.set()
+            while True:
+                ctx.check_cancelled()
+
+    runner.submit("job-1", job, ['match'], report=lambda ctx: reports.append((ctx.status, ctx.phase)))
+    started.wait(5)
+    assert runner.cancel("job-1")
+    ctx = runner.wait("job-1", timeout=5)
+    assert ctx.status == CANCELLED
+    assert reports[-1] == (CANCELLED, 'match')
+    assert not runner.cancel("job-1")
+
+
+def test_runner_records_phase_timings_and_failures():
+    runner = MatchingJobRunner(max_workers=1)
+
+    def job(ctx):
+        with ctx.phase_timer('load'):
+            pass
+        with ctx.phase_timer('match'):
+            pass
+
+    # 完了したジョブはランナーから外れるため、submitが返したコンテキストを見る
+    ctx = runner.submit("job-2", job, ['load', 'match'])
+    runner.wait(ctx.job_id, timeout=5)
+    assert ctx.status == SUCCEEDED
+    assert set(ctx.timings) == {'load', 'match'}
+    assert ctx.progress == 1.0
+
+    def broken(ctx):
+        raise RuntimeError("boom")
+
+    ctx = runner.submit("job-3", broken, ['load'])
+    runner.wait(ctx.job_id, timeout=5)
+    assert ctx.status == FAILED
+    assert ctx.error == "boom"
+
+
+def test_run_matching_returns_job_and_reports_status(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    res = client.post("/api/v1/admin/matching/run", headers=headers)
+    assert res.status_code == 202
+    job_id = res.get_json()["job_id"]
+    assert res.get_json()["result_id"] == job_id
+    matching_runner.wait(job_id, timeout=10)
+    res = client.get(f"/api/v1/admin/matching/jobs/{job_id}", headers=headers)
+    job = res.get_json()
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1.0
+    assert set(job["timings"]) == {"load", "match", "verify", "save"}
+    assert job["elapsed_ms"] is not None
+    res = client.get("/api/v1/admin/matching/jobs", headers=headers)
+    assert [j["job_id"] for j in res.get_json()["jobs"]] == [job_id]
+    # 終了済みジョブはキャンセルできない
+    res = client.post(f"/api/v1/admin/matching/jobs/{job_id}/cancel", headers=headers)
+    assert res.status_code == 400
+
+
+def test_get_unknown_job(client):
+    token = get_admin_token(client)
+    res = client.get("/api/v1/admin/matching/jobs/unknown", headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 404
@@ -0,0 +1,92 @@
+import itertools
+import random
+import tracemalloc
+from array import array
+
+from matching_engine import assign_special_seats, prefs_rank, satisfaction_score
+from matching_optimal import max_satisfaction_assignment
+from matching_snapshot import MatchingSnapshot
+from matching_strategies import run_strategy
+from matching_synthetic import generate_cohort
+
+
+def random_snapshot(rng, num_students, num_labs):
+    ptr, labs = array('i', [0]), array('i')
+    for _ in range(num_students):
+        labs.extend(rng.sample(range(num_labs), rng.randint(0, num_labs)))
+        ptr.append(len(labs))
+    gpa = array('d', [round(rng.uniform(2.0, 4.0), 1) for _ in range(num_students)])
+    capacity = array('i', [rng.randint(0, 3) for _ in range(num_labs)])
+    special = {rng.randrange(num_labs): [rng.randrange(num_students)]} if rng.random() < 0.3 else {}
+    return MatchingSnapshot([f"S{i}" for i in range(num_students)], gpa, [f"L{j}" for j in range(num_labs)],
+                            capacity, ptr, labs, special)
+
+
+def brute_force(snapshot):
+    """全配属を列挙して (特別枠以外の総納得度, 配属人数) の最大値を求める"""
+    seats = list(snapshot.capacity)
+    fixed = assign_special_seats(snapshot.special, snapshot.num_students, seats, prefs_rank(snapshot.prefs))
+    prefs = snapshot.prefs
+    free = [s for s in range(snapshot.num_students) if fixed[s] < 0]
+    best = (0, 0)
+    for combo in itertools.product(*[[-1] + prefs[s] for s in free]):
+        used = [0] * snapshot.num_labs
+        for lab in combo:
+            if lab >= 0:
+                used[lab] += 1
+        if any(u > c for u, c in zip(used, seats)):
+            continue
+        total = sum(satisfaction_score(prefs[s].index(lab) + 1, len(prefs[s]))
+                    for s, lab in zip(free, combo) if lab >= 0)
+        best = max(best, (total, sum(lab >= 0 for lab in combo)))
+    return best, fixed
+
+
+def test_matches_brute_force_optimum():
+    for seed in range(300):
+        rng = random.Random(seed)
+        snapshot = random_snapshot(rng, rng.randint(1, 6), rng.randint(1, 4))
+        (total, assigned), fixed = brute_force(snapshot)
+        outcome = max_satisfaction_assignment(snapshot)
+        prefs = snapshot.prefs
+        got = sum(satisfaction_score(outcome.ranks[s], len(prefs[s]))
+                  for s in range(snapshot.num_students) if fixed[s] < 0)
+        assert outcome.extra["optimal"]
+        assert got == total, seed
+        assert sum(1 for s, lab in enumerate(outcome.assignment) if lab >= 0 and fixed[s] < 0) == assigned, seed
+
+
+def test_not_worse_than_deferred_acceptance():
+    snapshot = generate_cohort(2000, 40, pref_length=5, skew=1.0, seed=2)
+    optimal, stats = run_strategy('max_satisfaction', snapshot)
+    stable, _ = run_strategy('gale_shapley', snapshot)
+    da_total = sum(satisfaction_score(r, len(p)) for r, p in zip(stable.ranks, snapshot.prefs))
+    assert stats["optimal"] and stats["total_satisfaction"] >= da_total
+
+
+def test_time_budget_returns_best_so_far():
+    snapshot = generate_cohort(3000, 30, pref_length=5, skew=1.0, seed=4)
+    outcome, stats = run_strategy('max_satisfaction', snapshot, time_budget=1e-6)
+    assert stats["optimal"] is False
+    counts = [0] * snapshot.num_labs
+    for s, lab in enumerate(outcome.assignment):
+        if lab >= 0:
+            counts[lab] += 1
+            if lab in snapshot.prefs[s]:
+                assert outcome.ranks[s] == snapshot.prefs[s].index(lab) + 1
+    assert all(c <= cap for c, cap in zip(counts, snapshot.capacity))
+    # 暫定解でも空き定員は貪欲に埋められる
+    assert sum(counts) > 0
+
+
+def test_memory_scales_with_preferences_not_students_times_labs():
+    # 20000人×400研究室の密な費用行列（int32）なら32MBになる。希望は1人3件
+    snapshot = generate_cohort(20000, 400, pref_length=3, skew=1.0, seed=1)
+    snapshot.prefs
+    tracemalloc.start()
+    try:
+        max_satisfaction_assignment(snapshot, time_budget=0.5)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 16 * 1024 * 1024
@@ -0,0 +1,125 @@
+import json
+
+from sqlalchemy import update
+
+from app import app, db, matching_runner, MatchingBatch, MatchingResult, Student, load_batch_assignment
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_results@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_results@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def run_batch(client, token, force=False):
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"force": force}),
+                      content_type="application/json", headers={"Authorization": f"Bearer {token}"})
+    job_id = res.get_json()["job_id"]
+    matching_runner.wait(job_id, timeout=10)
+    return job_id
+
+
+def setup_cohort(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025000{i}", "name": f"学生{i}", "email": f"s{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボR", "teacher_name": "佐藤", "capacity": 2, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025000{i}", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+
+
+def test_results_are_persisted_and_paginated(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    batch_id = run_batch(client, token)
+
+    res = client.get("/api/v1/matching/results?limit=2")
+    page = res.get_json()
+    assert page["batch_id"] == batch_id
+    assert page["results"] == [
+        {"student_id": "20250001", "name": "学生1", "assigned_lab": "LAB01", "lab_name": "ラボR"},
+        {"student_id": "20250002", "name": "学生2", "assigned_lab": "LAB01", "lab_name": "ラボR"},
+    ]
+    assert page["next_after"] == "20250002"
+    res = client.get(f"/api/v1/matching/results?batch_id={batch_id}&limit=2&after={page['next_after']}")
+    page = res.get_json()
+    assert page["results"] == [{"student_id": "20250003", "name": "学生3", "assigned_lab": None, "lab_name": None}]
+    assert page["next_after"] is None
+
+    history = client.get("/api/v1/students/20250003/matching_history").get_json()
+    assert history[0]["batch_id"] == batch_id
+    summary = json.loads(history[0]["summary"])
+    assert summary["assigned"] == 2 and summary["unassigned"] == 1
+    with app.app_context():
+        assert MatchingResult.query.filter_by(batch_id=batch_id).count() == 3
+        # 実行日時・サマリはヘッダに1回だけ持ち、配属はヘッダ1行から復元できる
+        header = MatchingBatch.query.filter_by(batch_id=batch_id).one()
+        assert header.num_students == 3
+        assert load_batch_assignment(batch_id) == {"20250001": "LAB01", "20250002": "LAB01", "20250003": None}
+
+
+def test_latest_batch_is_default(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    run_batch(client, token)
+    second = run_batch(client, token, force=True)
+    assert client.get("/api/v1/matching/results").get_json()["batch_id"] == second
+
+
+def test_results_unknown_batch(client):
+    assert client.get("/api/v1/matching/results").get_json()["results"] == []
+    assert client.get("/api/v1/matching/results?batch_id=nope").status_code == 404
+
+
+def test_supplementary_round_fills_vacancies_for_leftovers(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    base = run_batch(client, token)
+    # 定員1の研究室を追加し、未配属の学生3が第2希望として登録
+    lab = {"lab_name": "ラボS", "teacher_name": "鈴木", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = {"student_id": "20250003", "preferences": [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+
+    # 現在の配属（students.assigned_lab）ではなく起点バッチの配属を確定として扱う
+    with app.app_context():
+        db.session.execute(update(Student).where(Student.student_id == "20250001").values(assigned_lab=None))
+        db.session.commit()
+
+    res = client.post("/api/v1/admin/matching/supplementary", headers=headers)
+    assert res.status_code == 201
+    data = res.get_json()
+    assert data["base_batch_id"] == base
+    assert data["summary"]["round_students"] == 1 and data["summary"]["snapshot_id"] is not None
+    assert data["summary"]["students"] == 3 and data["summary"]["assigned"] == 3
+    assert data["summary"]["vacancies"] == 1 and data["summary"]["remaining_seats"] == 0
+    with app.app_context():
+        assert MatchingBatch.query.filter_by(batch_id=data["batch_id"]).one().num_students == 1
+    # 最新（補充）バッチの結果は起点バッチに重ねた全員分
+    page = client.get("/api/v1/matching/results").get_json()
+    assert page["batch_id"] == data["batch_id"]
+    assert page["results"] == [
+        {"student_id": "20250001", "name": "学生1", "assigned_lab": "LAB01", "lab_name": "ラボR"},
+        {"student_id": "20250002", "name": "学生2", "assigned_lab": "LAB01", "lab_name": "ラボR"},
+        {"student_id": "20250003", "name": "学生3", "assigned_lab": "LAB02", "lab_name": "ラボS"},
+    ]
+
+    # 補充バッチを起点とした増分再マッチングは起点バッチの配属と合成される
+    res = client.post("/api/v1/admin/matching/incremental", content_type="application/json", headers=headers)
+    assert res.get_json()["moved_students"] == 0
+
+    res = client.post("/api/v1/admin/matching/supplementary", headers=headers)
+    assert res.status_code == 200
+    assert res.get_json()["batch_id"] is None
@@ -0,0 +1,90 @@
+import json
+from array import array
+
+from matching_scenarios import Scenario, run_scenarios
+from matching_snapshot import MatchingSnapshot
+
+
+def small_snapshot():
+    # 3学生・2研究室、全員がL0を第1希望
+    prefs = [[0, 1], [0, 1], [0]]
+    ptr, labs = array('i', [0]), array('i')
+    for p in prefs:
+        labs.extend(p)
+        ptr.append(len(labs))
+    return MatchingSnapshot(["S1", "S2", "S3"], array('d', [3.0, 3.5, 2.0]), ["L0", "L1"],
+                            array('i', [1, 1]), ptr, labs, {1: [2]})
+
+
+def test_scenarios_apply_overrides_in_parallel():
+    scenarios = [
+        Scenario("base"),
+        Scenario("bigger-L0", capacity={"L0": 3}),
+        Scenario("top1", max_preferences=1, special_seats=False),
+    ]
+    results = run_scenarios(small_snapshot(), scenarios, workers=2)
+    assert [r["name"] for r in results] == ["base", "bigger-L0", "top1"]
+    base, bigger, top1 = results
+    # S3は特別枠でL1、S2がL0、S1はL1が埋まっているため未配属
+    assert base["unassigned"] == 1
+    assert base["fill_rate"] == {"L0": 1.0, "L1": 1.0}
+    assert bigger["unassigned"] == 0
+    assert bigger["satisfaction"]["first_choice"] == 2
+    assert top1["unassigned"] == 2
+    assert sum(base["satisfaction"]["histogram"].values()) == 3
+
+
+def test_scenario_from_dict_validation():
+    scenario = Scenario.from_dict({"name": "x", "capacity": {"L0": 2}, "max_preferences": 5})
+    assert scenario.capacity == {"L0": 2} and scenario.max_preferences == 5
+    for bad in [{}, {"name": "x", "capacity": {"L0": -1}}, {"name": "x", "max_preferences": "5"},
+                {"name": "x", "special_seats": "false"}, {"name": "x", "special_seats": 0},
+                {"name": "x", "disable_special": "L0"}, {"name": "x", "disable_special": [1]}]:
+        try:
+            Scenario.from_dict(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+
+
+def test_disable_special_by_lab_or_student():
+    # S3はL1の特別希望枠（L0は第1希望で定員1、GPAはS2が最も高い）
+    results = run_scenarios(small_snapshot(), [Scenario("base"), Scenario("lab", disable_special=["L1"]),
+                                               Scenario("student", disable_special=["S3"])], workers=1)
+    # 無効化するとL1はS3ではなく第2希望のS1が使う（S1: 50、S2: 100、S3: 未配属）
+    assert [r["satisfaction"]["mean"] for r in results] == [33.33, 50.0, 50.0]
+
+
+def get_admin_token(client):
+    admin_data = {"email": "admin_scen@example.com", "password": "adminpass", "role": "admin"}
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    res = client.post("/api/v1/auth/login", data=json.dumps({"email": "admin_scen@example.com", "password": "adminpass"}),
+                      content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_scenarios_endpoint_does_not_touch_assignments(client):
+    student = {"student_id": "20255555", "name": "シナリオ", "email": "scen@example.com", "gpa": 3.0}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボS", "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+    client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = {"student_id": "20255555", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    token = get_admin_token(client)
+    body = {"scenarios": [{"name": "closed", "capacity": {"LAB01": 0}}, {"name": "base"}], "workers": 1}
+    res = client.post("/api/v1/admin/matching/scenarios", data=json.dumps(body), content_type="application/json",
+                      headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 200
+    closed, base = res.get_json()["scenarios"]
+    assert closed["unassigned"] == 1 and base["unassigned"] == 0
+    assert client.get("/api/v1/students/20255555/assignment").get_json()["assigned_lab"] is None
+    for bad in [{"name": "bad", "capacity": {"LAB99": 1}}, {"name": "bad", "special_seats": "false"},
+                {"name": "bad", "disable_special": ["LAB99"]}, {"name": "bad", "disable_special": "LAB01"}]:
+        res = client.post("/api/v1/admin/matching/scenarios", data=json.dumps({"scenarios": [bad]}),
+                          content_type="application/json", headers={"Authorization": f"Bearer {token}"})
+        assert res.status_code == 400, bad
+    body = {"scenarios": [{"name": "ok", "special_seats": False, "disable_special": ["LAB01", "20255555"]}],
+            "workers": 1}
+    res = client.post("/api/v1/admin/matching/scenarios", data=json.dumps(body), content_type="application/json",
+                      headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 200
@@ -0,0 +1,171 @@
+import json
+import pickle
+from array import array
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from app import app, db, matching_runner, freeze_matching_input, LabSpecialStudent, Student, load_batch_assignment
+from matching_cache import snapshot_hash
+from matching_snapshot import MatchingSnapshot, load_snapshot, pack_snapshot, unpack_snapshot, vacancy_snapshot
+from sqlite_profile import READ_ENGINE_KEY
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_snapshot@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_snapshot@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client):
+    for i, gpa in enumerate([3.0, 3.8, None], start=1):
+        student = {"student_id": f"2025000{i}", "name": f"学生{i}", "email": f"s{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボA", "ラボB"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = {
+        "20250001": [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}],
+        "20250002": [{"lab_id": "LAB02", "rank": 3}, {"lab_id": "LAB01", "rank": 1}],
+    }
+    for sid, p in prefs.items():
+        client.post("/api/v1/preferences", data=json.dumps({"student_id": sid, "preferences": p}),
+                    content_type="application/json")
+
+
+def test_load_snapshot_uses_fixed_number_of_queries(client):
+    setup_cohort(client)
+    with app.app_context():
+        db.session.add(LabSpecialStudent(lab_id="LAB02", student_id="20250003"))
+        db.session.commit()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            snapshot = load_snapshot(db.session)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+    assert len(statements) == 4
+    assert snapshot.student_ids == ["20250001", "20250002", "20250003"]
+    assert snapshot.lab_ids == ["LAB01", "LAB02"]
+    assert list(snapshot.gpa) == [3.0, 3.8, 0.0]
+    assert list(snapshot.capacity) == [1, 1]
+    # 希望順位（rank）順に並ぶ
+    assert snapshot.prefs == [[0, 1], [0, 1], []]
+    assert snapshot.special == {1: [2]}
+    assert snapshot.student_index["20250002"] == 1
+
+
+def test_vacancy_snapshot_keeps_only_leftovers(client):
+    setup_cohort(client)
+    with app.app_context():
+        db.session.add(LabSpecialStudent(lab_id="LAB02", student_id="20250003"))
+        db.session.commit()
+        snapshot = load_snapshot(db.session)
+    # 学生1だけがLAB01に配属済み
+    vacancy, students = vacancy_snapshot(snapshot, np.asarray([0, -1, -1], dtype=np.int32))
+    assert students.tolist() == [1, 2]
+    assert vacancy.student_ids == ["20250002", "20250003"]
+    assert list(vacancy.gpa) == [3.8, 0.0]
+    assert list(vacancy.capacity) == [0, 1]
+    assert vacancy.prefs == [[0, 1], []]
+    assert vacancy.special == {1: [1]}
+
+
+def test_pack_snapshot_round_trip(client):
+    setup_cohort(client)
+    with app.app_context():
+        db.session.add(LabSpecialStudent(lab_id="LAB02", student_id="20250003"))
+        db.session.commit()
+        snapshot = load_snapshot(db.session)
+
+    class Row:
+        pass
+
+    row = Row()
+    row.__dict__.update(pack_snapshot(snapshot))
+    restored = unpack_snapshot(row)
+    assert restored.prefs == snapshot.prefs and restored.special == snapshot.special
+    assert snapshot_hash(restored, "v") == snapshot_hash(snapshot, "v")
+
+
+def test_frozen_snapshot_ignores_late_writes(client):
+    setup_cohort(client)
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    res = client.post("/api/v1/admin/matching/snapshots", data=json.dumps({"label": "締切"}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 201
+    frozen = res.get_json()
+    assert (frozen["students"], frozen["labs"], frozen["preferences"]) == (3, 2, 4)
+
+    # 締切後の希望変更は凍結済みの入力に影響しない
+    late = {"student_id": "20250003", "preferences": [{"lab_id": "LAB01", "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(late), content_type="application/json")
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"snapshot_id": frozen["snapshot_id"]}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 202 and res.get_json()["snapshot_id"] == frozen["snapshot_id"]
+    batch_id = res.get_json()["job_id"]
+    matching_runner.wait(batch_id, timeout=10)
+    with app.app_context():
+        assert load_batch_assignment(batch_id)["20250003"] is None
+
+    # 指定なしの実行はその時点の入力を凍結し、内容が同じなら同じスナップショットを使う
+    first = client.post("/api/v1/admin/matching/run", headers=headers).get_json()
+    matching_runner.wait(first["job_id"], timeout=10)
+    assert first["snapshot_id"] != frozen["snapshot_id"]
+    res = client.post("/api/v1/admin/matching/snapshots", headers=headers)
+    assert res.status_code == 200 and res.get_json()["reused"]
+    assert res.get_json()["snapshot_id"] == first["snapshot_id"]
+    listing = client.get("/api/v1/admin/matching/snapshots", headers=headers).get_json()["snapshots"]
+    assert [s["snapshot_id"] for s in listing] == [first["snapshot_id"], frozen["snapshot_id"]]
+
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"snapshot_id": 999}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 404
+
+
+def test_freeze_reads_without_holding_the_write_lock(client):
+    setup_cohort(client)
+    writes = []
+
+    def write_during_load(conn, cursor, statement, parameters, context, executemany):
+        # 最初の SELECT の後（読み込みの途中）に別接続が待たずに（busy_timeout 0）書き込める
+        if writes or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        with writer.begin() as other:
+            other.execute(sa.text("INSERT INTO preferences (student_id, lab_id, rank) VALUES ('20250003', 'LAB01', 1)"))
+        writes.append(statement)
+
+    with app.app_context():
+        writer = sa.create_engine(db.engine.url, connect_args={"timeout": 0})
+        read_engine = app.extensions[READ_ENGINE_KEY]
+        event.listen(read_engine, "after_cursor_execute", write_during_load)
+        try:
+            frozen, snapshot, reused = freeze_matching_input()
+        finally:
+            event.remove(read_engine, "after_cursor_execute", write_during_load)
+            writer.dispose()
+        assert writes and not reused
+        # 読み込みは開始時点の内容で揃い、途中の書き込みは次の凍結に入る
+        assert snapshot.prefs == [[0, 1], [0, 1], []]
+        assert unpack_snapshot(frozen).prefs == snapshot.prefs
+        assert freeze_matching_input()[1].prefs[2] == [0]
+
+
+def test_pref_rank_is_cached_per_snapshot_and_not_pickled():
+    snapshot = MatchingSnapshot(["S0", "S1"], array('d', [3.0, 2.0]), ["L0", "L1"], array('i', [1, 1]),
+                                array('i', [0, 2, 3]), array('i', [1, 0, 1]), {})
+    assert snapshot.pref_rank is snapshot.pref_rank
+    assert (snapshot.pref_rank(0, 0), snapshot.pref_rank(0, 1), snapshot.pref_rank(1, 0)) == (2, 1, 0)
+    restored = pickle.loads(pickle.dumps(snapshot))
+    assert restored.pref_rank(1, 1) == 1 and restored.prefs == [[1, 0], [1]]
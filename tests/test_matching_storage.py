@@ -0,0 +1,18 @@
+import pytest
+
+from matching_storage import MAX_LABS, pack_batch, unpack_assignment, unpack_array, SATISFACTION_DTYPE
+
+
+def test_pack_batch_round_trip():
+    columns = pack_batch(["S1", "S2", "S3"], ["LAB01", "LAB02"], [1, -1, 0], [100, 0, 50])
+    assert len(columns["assignment"]) == 3 * 2
+    assert unpack_assignment(columns["student_ids"], columns["lab_ids"], columns["assignment"]) == {
+        "S1": "LAB02", "S2": None, "S3": "LAB01"}
+    assert unpack_array(columns["satisfaction"], SATISFACTION_DTYPE).tolist() == [100, 0, 50]
+
+
+def test_pack_batch_empty_and_too_many_labs():
+    columns = pack_batch([], [], [], [])
+    assert unpack_assignment(columns["student_ids"], columns["lab_ids"], columns["assignment"]) == {}
+    with pytest.raises(ValueError):
+        pack_batch(["S1"], [f"L{j}" for j in range(MAX_LABS + 1)], [0], [0])
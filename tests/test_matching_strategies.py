@@ -0,0 +1,147 @@
+import json
+import random
+from array import array
+
+import pytest
+
+from app import matching_runner
+from matching_engine import MatchingCancelled, assign_special_seats, prefs_rank
+from matching_snapshot import MatchingSnapshot
+from matching_strategies import STRATEGIES, get_strategy, run_strategies, run_strategy
+
+
+def random_snapshot(seed, num_students=40, num_labs=6):
+    rng = random.Random(seed)
+    ptr, labs = array('i', [0]), array('i')
+    for _ in range(num_students):
+        labs.extend(rng.sample(range(num_labs), rng.randint(0, num_labs)))
+        ptr.append(len(labs))
+    gpa = array('d', [round(rng.uniform(2.0, 4.0), 1) for _ in range(num_students)])
+    capacity = array('i', [rng.randint(0, 8) for _ in range(num_labs)])
+    special = {rng.randrange(num_labs): [rng.randrange(num_students)]} if rng.random() < 0.5 else {}
+    return MatchingSnapshot([f"S{i}" for i in range(num_students)], gpa, [f"L{j}" for j in range(num_labs)],
+                            capacity, ptr, labs, special)
+
+
+def has_blocking_pair(snapshot, assignment):
+    seats = list(snapshot.capacity)
+    fixed = assign_special_seats(snapshot.special, snapshot.num_students, seats, prefs_rank(snapshot.prefs))
+    prefs = snapshot.prefs
+    members = {}
+    for s, lab in enumerate(assignment):
+        if lab >= 0 and fixed[s] < 0:
+            members.setdefault(lab, []).append(s)
+    for s, p in enumerate(prefs):
+        if fixed[s] >= 0:
+            continue
+        current = p.index(assignment[s]) if assignment[s] >= 0 else len(p)
+        for k, lab in enumerate(p[:current], start=1):
+            held = members.get(lab, [])
+            if len(held) < seats[lab]:
+                return True
+            key = (snapshot.gpa[s], -k, -s)
+            if any(key > (snapshot.gpa[t], -(prefs[t].index(lab) + 1), -t) for t in held):
+                return True
+    return False
+
+
+def test_all_strategies_respect_capacity_and_preferences():
+    for seed in range(100):
+        snapshot = random_snapshot(seed)
+        fixed = assign_special_seats(snapshot.special, snapshot.num_students, list(snapshot.capacity),
+                                     prefs_rank(snapshot.prefs))
+        for name in STRATEGIES:
+            outcome, stats = run_strategy(name, snapshot)
+            assert stats["strategy"] == name and stats["proposals"] == outcome.proposals
+            counts = {}
+            for s, lab in enumerate(outcome.assignment):
+                if lab >= 0:
+                    counts[lab] = counts.get(lab, 0) + 1
+                    # 特別枠以外は希望した研究室にのみ配属される
+                    assert fixed[s] == lab or lab in snapshot.prefs[s]
+                    assert outcome.ranks[s] == (snapshot.prefs[s].index(lab) + 1 if lab in snapshot.prefs[s] else 0)
+            assert all(c <= snapshot.capacity[lab] for lab, c in counts.items())
+
+
+def test_deferred_acceptance_variants_are_stable():
+    for seed in range(100):
+        snapshot = random_snapshot(seed)
+        student = run_strategy('gale_shapley', snapshot)[0]
+        assert run_strategy('gale_shapley_np', snapshot)[0].assignment == student.assignment
+        lab = run_strategy('lab_proposing', snapshot)[0]
+        assert not has_blocking_pair(snapshot, student.assignment)
+        assert not has_blocking_pair(snapshot, lab.assignment)
+        # 学生提案型は全学生にとって研究室提案型以上に良い
+        for s in range(snapshot.num_students):
+            assert (student.ranks[s] or 99) <= (lab.ranks[s] or 99)
+
+
+def test_boston_and_serial_dictatorship():
+    # S0(GPA3.0): L0 > L1, S1(GPA3.5): L1 > L0, S2(GPA4.0): L1 > L0。定員は各1
+    ptr, labs = array('i', [0, 2, 4, 6]), array('i', [0, 1, 1, 0, 1, 0])
+    snapshot = MatchingSnapshot(["S0", "S1", "S2"], array('d', [3.0, 3.5, 4.0]), ["L0", "L1"],
+                                array('i', [1, 1]), ptr, labs, {})
+    # Boston: 第1希望でS0→L0、S2→L1が確定し、S1は第2希望のL0も埋まっている
+    assert run_strategy('boston', snapshot)[0].assignment == [0, -1, 1]
+    # GPA順: S2→L1、S1→L0、S0は空きなし
+    assert run_strategy('serial_dictatorship', snapshot)[0].assignment == [-1, 0, 1]
+
+
+def test_strategy_cancellation_and_unknown_name():
+    with pytest.raises(MatchingCancelled):
+        run_strategy('boston', random_snapshot(1), should_stop=lambda: True)
+    with pytest.raises(ValueError):
+        get_strategy('nope')
+
+
+def test_run_strategies_in_worker_processes_matches_in_process():
+    snapshot = random_snapshot(7)
+    names = ['gale_shapley', 'boston', 'lab_proposing']
+    parallel = run_strategies(snapshot, names, workers=2, trace=True)
+    serial = run_strategies(snapshot, names, workers=1, trace=True)
+    assert [stats["strategy"] for _, stats in parallel] == names
+    assert [o.assignment for o, _ in parallel] == [o.assignment for o, _ in serial]
+    assert parallel[0][0].trace.size == serial[0][0].trace.size
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_strategies@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_strategies@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_run_matching_with_strategy(client):
+    student = {"student_id": "20252001", "name": "学生", "email": "strategy@example.com", "gpa": 3.0}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボT", "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+    lab_id = client.post("/api/v1/laboratories", data=json.dumps(lab),
+                         content_type="application/json").get_json()["lab_id"]
+    prefs = {"student_id": "20252001", "preferences": [{"lab_id": lab_id, "rank": 1}]}
+    client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"strategy": "boston"}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 202 and res.get_json()["strategy"] == "boston"
+    batch_id = res.get_json()["job_id"]
+    matching_runner.wait(batch_id, timeout=10)
+    history = client.get("/api/v1/students/20252001/matching_history").get_json()
+    summary = json.loads(history[0]["summary"])
+    assert summary["strategy"] == "boston" and summary["engine"] == "boston-1"
+    assert summary["proposals"] == 1 and "match_ms" in summary
+
+    # 増分再マッチングはDeferred Acceptance以外のバッチを起点にできない
+    res = client.post("/api/v1/admin/matching/incremental", content_type="application/json", headers=headers)
+    assert res.status_code == 400
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"strategy": "nope"}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 400
@@ -0,0 +1,117 @@
+import json
+import random
+
+from app import matching_runner
+from matching_engine import deferred_acceptance
+from matching_trace import (NO_SEAT_REASON, REJECT_REASON, MatchingTrace, explain_student, pack_trace,
+                            unpack_trace)
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_trace@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_trace@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_trace_rebuilds_every_students_story():
+    rng = random.Random(7)
+    lab_ids = [f"L{j}" for j in range(5)]
+    student_ids = [f"S{i}" for i in range(30)]
+    for _ in range(20):
+        prefs = [rng.sample(range(5), rng.randint(0, 5)) for _ in range(30)]
+        gpa = [round(rng.uniform(2.0, 4.0), 1) for _ in range(30)]
+        capacity = [rng.randint(0, 6) for _ in range(5)]
+        special = {0: [rng.randrange(30)]}
+        plain = deferred_acceptance(prefs, gpa, capacity, special)
+        traced = deferred_acceptance(prefs, gpa, capacity, special, trace=MatchingTrace())
+        # トレースの有無で結果は変わらない
+        assert traced.assignment == plain.assignment and traced.proposals == plain.proposals
+        trace = unpack_trace(pack_trace(traced.trace))
+        for s, lab in enumerate(traced.assignment):
+            story = explain_student(trace, s, lab_ids, student_ids)
+            if lab >= 0:
+                assert story[-1]["event"] in ("accepted", "special") and story[-1]["lab_id"] == lab_ids[lab]
+            else:
+                assert all(e["event"] != "special" for e in story)
+                assert len([e for e in story if e["event"] != "displaced"]) == len(prefs[s])
+                assert not story or story[-1]["event"] in ("rejected", "displaced")
+            # 押し出した学生は押し出された時点でその研究室に仮受入されている
+            for e in story:
+                if e["event"] == "displaced":
+                    by = student_ids.index(e["by"])
+                    assert any(x["event"] == "accepted" and x["lab_id"] == e["lab_id"]
+                               for x in explain_student(trace, by, lab_ids, student_ids))
+
+
+def test_trace_records_displacement():
+    # S0が仮受入された後、GPAの高いS1に押し出されて第2希望へ
+    outcome = deferred_acceptance([[0, 1], [0]], [2.0, 3.5], [1, 1], trace=MatchingTrace())
+    story = explain_student(unpack_trace(pack_trace(outcome.trace)), 0, ["L0", "L1"], ["S0", "S1"])
+    assert [(e["event"], e["lab_id"], e["rank"]) for e in story] == [
+        ("accepted", "L0", 1), ("displaced", "L0", 1), ("accepted", "L1", 2)]
+    assert story[1]["by"] == "S1"
+    assert outcome.trace.size == 1
+
+
+def test_trace_distinguishes_rejection_reasons():
+    # L0は定員1をGPAの高いS0が先に埋め、L1は特別希望枠で満席
+    outcome = deferred_acceptance([[0], [0, 1, 2], [1]], [3.5, 2.0, 3.0], [1, 1, 1], {1: [2]},
+                                  trace=MatchingTrace())
+    story = explain_student(unpack_trace(pack_trace(outcome.trace)), 1, ["L0", "L1", "L2"], ["S0", "S1", "S2"])
+    assert [(e["event"], e["lab_id"], e.get("reason")) for e in story] == [
+        ("rejected", "L0", REJECT_REASON), ("rejected", "L1", NO_SEAT_REASON), ("accepted", "L2", None)]
+
+
+def setup_cohort(client):
+    for i, gpa in enumerate([3.0, 3.8], start=1):
+        student = {"student_id": f"2025800{i}", "name": f"経緯{i}", "email": f"t{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボT1", "ラボT2"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i in range(1, 3):
+        prefs = {"student_id": f"2025800{i}", "preferences": [{"lab_id": "LAB01", "rank": 1},
+                                                               {"lab_id": "LAB02", "rank": 2}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+
+
+def run_batch(client, headers, **options):
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps(dict(options, force=True)),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 202
+    job_id = res.get_json()["job_id"]
+    matching_runner.wait(job_id, timeout=10)
+    return job_id
+
+
+def test_matching_explanation_endpoint(client):
+    setup_cohort(client)
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    untraced = run_batch(client, headers)
+    assert client.get("/api/v1/students/20258001/matching_explanation").status_code == 404
+
+    batch_id = run_batch(client, headers, trace=True)
+    res = client.get("/api/v1/students/20258001/matching_explanation")
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["batch_id"] == batch_id and body["assigned_lab"] == "LAB02"
+    assert [(e["event"], e["lab_id"]) for e in body["events"]][-1] == ("accepted", "LAB02")
+    assert any(e["event"] in ("rejected", "displaced") and e["lab_id"] == "LAB01" for e in body["events"])
+    job = client.get(f"/api/v1/admin/matching/jobs/{batch_id}", headers=headers)
+    assert job.status_code == 200
+
+    res = client.get(f"/api/v1/students/20258001/matching_explanation?batch_id={untraced}")
+    assert res.status_code == 404
+    assert client.get("/api/v1/students/99999999/matching_explanation").status_code == 404
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({"strategy": "boston", "trace": True}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 400
@@ -0,0 +1,109 @@
+import json
+import random
+from array import array
+
+from app import app, db, matching_runner, Student
+from matching_engine import deferred_acceptance
+from matching_snapshot import MatchingSnapshot
+from matching_strategies import run_strategy
+from matching_verify import verify_assignment
+
+
+def random_snapshot(seed, num_students=40, num_labs=6):
+    rng = random.Random(seed)
+    ptr, labs = array('i', [0]), array('i')
+    for _ in range(num_students):
+        labs.extend(rng.sample(range(num_labs), rng.randint(0, num_labs)))
+        ptr.append(len(labs))
+    gpa = array('d', [round(rng.uniform(2.0, 4.0), 1) for _ in range(num_students)])
+    capacity = array('i', [rng.randint(0, 8) for _ in range(num_labs)])
+    special = {rng.randrange(num_labs): [rng.randrange(num_students)]} if rng.random() < 0.5 else {}
+    return MatchingSnapshot([f"S{i}" for i in range(num_students)], gpa, [f"L{j}" for j in range(num_labs)],
+                            capacity, ptr, labs, special)
+
+
+def test_deferred_acceptance_batches_verify_clean():
+    for seed in range(100):
+        snapshot = random_snapshot(seed)
+        outcome = deferred_acceptance(snapshot.prefs, snapshot.gpa, snapshot.capacity, snapshot.special)
+        report = verify_assignment(snapshot, outcome.assignment)
+        assert report.ok, seed
+        assert verify_assignment(snapshot, run_strategy('lab_proposing', snapshot)[0].assignment).ok
+
+
+def test_detects_blocking_pairs_capacity_and_unranked():
+    # S0(3.0): L0 > L1, S1(3.5): L0, S2(2.0): L1。定員は各1
+    ptr, labs = array('i', [0, 2, 3, 4]), array('i', [0, 1, 0, 1])
+    snapshot = MatchingSnapshot(["S0", "S1", "S2"], array('d', [3.0, 3.5, 2.0]), ["L0", "L1"],
+                                array('i', [1, 1]), ptr, labs, {})
+    assert verify_assignment(snapshot, [1, 0, -1]).ok
+    # S1を未配属にするとL0に対してS1がブロッキング、S2をL0に置くと希望外かつ定員超過（空いたL1ともブロッキング）
+    report = verify_assignment(snapshot, [0, -1, 0])
+    assert report.blocking_pairs == [(1, 0), (2, 1)]
+    assert report.capacity_violations == [(0, 1, 2)]
+    assert report.unranked_placements == [(2, 0)]
+    detail = report.to_dict(snapshot, limit=1)
+    assert detail["details"]["blocking_pairs"] == [{"student_id": "S1", "lab_id": "L0"}]
+    assert detail["blocking_pairs"] == 2
+    assert detail["ok"] is False and detail["capacity_violations"] == 1
+    # 空席のある上位希望もブロッキング
+    assert verify_assignment(snapshot, [-1, 0, 1]).blocking_pairs == [(0, 1)]
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_verify@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_verify@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def test_verify_endpoint_and_cli(client):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025300{i}", "name": f"学生{i}", "email": f"verify{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    lab = {"lab_name": "ラボV", "teacher_name": "佐藤", "capacity": 2, "field_tag": "AI"}
+    lab_id = client.post("/api/v1/laboratories", data=json.dumps(lab),
+                         content_type="application/json").get_json()["lab_id"]
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025300{i}", "preferences": [{"lab_id": lab_id, "rank": 1}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    batch_id = client.post("/api/v1/admin/matching/run", headers=headers).get_json()["job_id"]
+    matching_runner.wait(batch_id, timeout=10)
+
+    # バッチ実行時の検証結果はsummaryに記録される
+    history = client.get("/api/v1/students/20253001/matching_history").get_json()
+    verification = json.loads(history[0]["summary"])["verification"]
+    assert verification["ok"] is True and "elapsed_ms" in verification
+
+    res = client.get(f"/api/v1/admin/matching/verify?batch_id={batch_id}", headers=headers)
+    data = res.get_json()
+    assert data["ok"] is True and data["input_matches"] is True
+    assert client.get("/api/v1/admin/matching/verify?batch_id=nope", headers=headers).status_code == 404
+
+    result = app.test_cli_runner().invoke(args=["matching", "verify"])
+    assert result.exit_code == 0
+    # 既定ではバッチの実行に使った凍結済みの入力で検証するため、その後の変更は影響しない
+    with app.app_context():
+        db.session.execute(db.update(Student).where(Student.student_id == "20253003").values(gpa=3.9))
+        db.session.commit()
+    data = client.get("/api/v1/admin/matching/verify", headers=headers).get_json()
+    assert data["ok"] is True and data["input_matches"] is True
+    assert data["snapshot_id"] is not None
+    # 現在の入力ではGPAの変更により、保存済みバッチにブロッキングペアが生じる
+    data = client.get("/api/v1/admin/matching/verify?live=true", headers=headers).get_json()
+    assert data["snapshot_id"] is None and data["input_matches"] is False
+    assert data["details"]["blocking_pairs"] == [{"student_id": "20253003", "lab_id": lab_id}]
+    result = app.test_cli_runner().invoke(args=["matching", "verify", "--batch-id", batch_id])
+    assert result.exit_code == 0
+    result = app.test_cli_runner().invoke(args=["matching", "verify", "--batch-id", batch_id, "--live"])
+    assert result.exit_code == 1
+    assert json.loads(result.output)["blocking_pairs"] == 1
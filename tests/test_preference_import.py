@@ -0,0 +1,177 @@
+import io
+import json
+import time
+
+from app import app, db, Preference
+from preference_import import iter_csv_rows, iter_ndjson_rows, parse_rank, validate_rows
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_pref_import@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_pref_import@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client):
+    for i in range(1, 4):
+        student = {"student_id": f"2025500{i}", "name": f"学生{i}", "email": f"p{i}@example.com", "gpa": 3.0}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボA", "ラボB", "ラボC"]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 1, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    prefs = [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}]
+    for sid in ["20255001", "20255002"]:
+        client.post("/api/v1/preferences", data=json.dumps({"student_id": sid, "preferences": prefs}),
+                    content_type="application/json")
+
+
+def stored_prefs():
+    with app.app_context():
+        rows = db.session.query(Preference.student_id, Preference.lab_id, Preference.rank).all()
+    result = {}
+    for sid, lab_id, rank in rows:
+        result.setdefault(sid, {})[lab_id] = rank
+    return result
+
+
+def test_parse_rank_accepts_only_positive_integers():
+    assert [parse_rank(v) for v in ["3", 3, "10"]] == [3, 3, 10]
+    for value in ["0", 0, "-1", "1.5", 1.5, True, "", " 1", "²", "٣", "１", None, [1]]:
+        assert parse_rank(value) is None, value
+
+
+def test_validate_rows_single_pass():
+    rows = iter_csv_rows(io.StringIO(
+        "student_id,lab_id,rank\nS1,L1,1\nS1,L2,1\nS1,L1,2\nS9,L1,1\nS2,L9,1\nS2,L1,0\nS2,,1\nS2,L2,3\n"))
+    result = validate_rows(rows, {"S1", "S2"}, {"L1", "L2"})
+    assert result.prefs == {"S1": {"L1": 1}, "S2": {"L2": 3}}
+    assert result.rows == 8
+    assert [(e["row"], e["error"]) for e in result.errors] == [
+        (3, "同じ学生のrankが重複しています"),
+        (4, "同じ学生のlab_idが重複しています"),
+        (5, "student_idが存在しません"),
+        (6, "lab_idが存在しません"),
+        (7, "rankは1以上の整数で入力してください"),
+        (8, "student_id, lab_id, rankは必須です"),
+    ]
+    assert result.invalid_students == {"S1", "S2"}
+    assert result.drop_invalid_students() == ["S1", "S2"] and result.prefs == {}
+    ndjson = ['{"student_id": "S1", "lab_id": "L1", "rank": 1}', '', 'oops', '[1]',
+              '{"student_id": "S1", "lab_id": "L2", "rank": true}']
+    result = validate_rows(iter_ndjson_rows(ndjson), {"S1"}, {"L1", "L2"})
+    assert result.prefs == {"S1": {"L1": 1}}
+    assert [e["row"] for e in result.errors] == [3, 4, 5]
+
+
+def test_plan_upsert_against_existing():
+    result = validate_rows(iter_ndjson_rows([
+        '{"student_id": "S1", "lab_id": "L1", "rank": 2}',
+        '{"student_id": "S1", "lab_id": "L2", "rank": 1}',
+        '{"student_id": "S1", "lab_id": "L4", "rank": 3}',
+        '{"student_id": "S2", "lab_id": "L1", "rank": 1}',
+    ]), {"S1", "S2"}, {"L1", "L2", "L3", "L4"})
+    existing = {"S1": {"L1": (10, 1), "L2": (11, 2), "L3": (12, 3)}, "S2": {"L1": (20, 1)}}
+    updates, inserts = result.plan_upsert(existing)
+    # L1とL2の入れ替えは可能、L4はファイルに無いL3のrankと重なるためエラー、S2は変更なし
+    assert updates == [{"id": 10, "rank": 2}, {"id": 11, "rank": 1}]
+    assert inserts == []
+    assert result.errors == [{"row": 3, "error": "rankが既存の希望と重複しています"}]
+
+
+def test_import_replace_csv(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    csv_content = ("student_id,lab_id,rank\n20255001,LAB03,1\n20255002,LAB03,1\n20255002,LAB09,2\n"
+                   "20255003,LAB02,1\n20255003,LAB01,2\n")
+    res = client.post("/api/v1/admin/preferences/import", headers={"Authorization": f"Bearer {token}"},
+                      content_type='multipart/form-data',
+                      data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'prefs.csv')})
+    data = res.get_json()
+    assert res.status_code == 200
+    assert data["mode"] == "replace"
+    assert (data["rows"], data["students"], data["inserted"], data["updated"], data["deleted"]) == (5, 2, 3, 0, 2)
+    assert data["errors"] == [{"row": 4, "error": "lab_idが存在しません"}]
+    # エラー行のある学生は有効な行も含めて読み飛ばし、既存の希望を残す
+    assert data["skipped_students"] == ["20255002"]
+    assert stored_prefs() == {
+        "20255001": {"LAB03": 1},
+        "20255002": {"LAB01": 1, "LAB02": 2},
+        "20255003": {"LAB02": 1, "LAB01": 2},
+    }
+
+
+def test_import_upsert_ndjson_body(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    body = "\n".join(json.dumps(item) for item in [
+        {"student_id": "20255001", "lab_id": "LAB03", "rank": 3},
+        {"student_id": "20255002", "lab_id": "LAB02", "rank": 1},
+        {"student_id": "20255002", "lab_id": "LAB01", "rank": 2},
+    ])
+    res = client.post("/api/v1/admin/preferences/import?mode=upsert", data=body,
+                      content_type="application/x-ndjson", headers={"Authorization": f"Bearer {token}"})
+    data = res.get_json()
+    assert res.status_code == 200
+    assert (data["inserted"], data["updated"], data["deleted"]) == (1, 2, 0)
+    assert stored_prefs()["20255001"] == {"LAB01": 1, "LAB02": 2, "LAB03": 3}
+    assert stored_prefs()["20255002"] == {"LAB01": 2, "LAB02": 1}
+
+
+def test_import_reports_unicode_digit_ranks_as_row_errors(client):
+    setup_cohort(client)
+    token = get_admin_token(client)
+    body = "student_id,lab_id,rank\n20255003,LAB01,²\n20255003,LAB02,１\n"
+    res = client.post("/api/v1/admin/preferences/import", data=body.encode('utf-8'),
+                      content_type="text/csv", headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 200
+    assert [e["error"] for e in res.get_json()["errors"]] == ["rankは1以上の整数で入力してください"] * 2
+
+
+def test_import_rejects_bad_requests(client):
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/v1/admin/preferences/import?mode=merge", data="", content_type="text/csv",
+                       headers=headers).status_code == 400
+    assert client.post("/api/v1/admin/preferences/import", data="student_id,rank\n", content_type="text/csv",
+                       headers=headers).status_code == 400
+    assert client.post("/api/v1/admin/preferences/import", json={}, headers=headers).status_code == 400
+    res = client.post("/api/v1/admin/preferences/import", headers=headers, content_type='multipart/form-data',
+                      data={'file': (io.BytesIO(b"x"), 'prefs.xlsx')})
+    assert res.status_code == 400
+
+
+def test_import_100k_rows_in_seconds(client):
+    from app import Laboratory, Student
+    token = get_admin_token(client)
+    num_students, num_labs, per_student = 10000, 100, 10
+    with app.app_context():
+        db.session.execute(db.insert(Laboratory), [
+            {"lab_id": f"L{j:03d}", "lab_name": f"ラボ{j}", "teacher_name": "佐藤", "capacity": 100, "field_tag": "AI"}
+            for j in range(num_labs)])
+        db.session.execute(db.insert(Student), [
+            {"student_id": f"S{i:05d}", "name": f"学生{i}", "email": f"s{i}@example.com", "gpa": 3.0}
+            for i in range(num_students)])
+        db.session.commit()
+    lines = ["student_id,lab_id,rank"]
+    lines += [f"S{i:05d},L{(i + k) % num_labs:03d},{k + 1}" for i in range(num_students) for k in range(per_student)]
+    body = ("\n".join(lines) + "\n").encode('utf-8')
+    start = time.perf_counter()
+    res = client.post("/api/v1/admin/preferences/import", data=body, content_type="text/csv",
+                      headers={"Authorization": f"Bearer {token}"})
+    elapsed = time.perf_counter() - start
+    data = res.get_json()
+    assert data["inserted"] == num_students * per_student and data["errors"] == []
+    assert elapsed < 10
+    # 同じファイルでupsertすると変更なし
+    res = client.post("/api/v1/admin/preferences/import?mode=upsert", data=body, content_type="text/csv",
+                      headers={"Authorization": f"Bearer {token}"})
+    assert (res.get_json()["inserted"], res.get_json()["updated"]) == (0, 0)
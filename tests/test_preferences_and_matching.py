@@ -1,6 +1,8 @@
 import json
 import pytest
 
+from app import matching_runner
+
 def get_student_token(client, student_id="20251111", email="student_pref@example.com"):
     # 学生登録
     student_data = {
@@ -74,6 +76,85 @@ def test_set_preferences_invalid(client):
     )
     assert res.status_code == 200  # 空リストでもエラー返さない現仕様
 
+def setup_labs(client, count=3):
+    for i in range(count):
+        lab = {"lab_name": f"ラボ{i}", "teacher_name": "佐藤", "capacity": 5, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+
+
+def test_set_preferences_writes_only_the_diff(client):
+    from sqlalchemy import event
+    from app import app, db
+    get_student_token(client, student_id="20251113", email="student_pref3@example.com")
+    setup_labs(client)
+    first = {"student_id": "20251113", "preferences": [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}]}
+    res = client.post("/api/v1/preferences", json=first)
+    assert (res.get_json()["inserted"], res.get_json()["unchanged"]) == (2, False)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        unchanged = client.post("/api/v1/preferences", json=first).get_json()
+        writes_when_unchanged = [sql for sql in statements if not sql.startswith("SELECT")]
+        # LAB02の順位を変え、LAB01を外してLAB03を追加
+        second = {"student_id": "20251113",
+                  "preferences": [{"lab_id": "LAB02", "rank": 1}, {"lab_id": "LAB03", "rank": 2}]}
+        statements.clear()
+        changed = client.post("/api/v1/preferences", json=second).get_json()
+    finally:
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", listener)
+    assert unchanged["unchanged"] is True and unchanged["message"] == "希望に変更はありません"
+    assert writes_when_unchanged == []
+    assert (changed["inserted"], changed["updated"], changed["deleted"]) == (1, 1, 1)
+    assert sum(1 for sql in statements if sql.startswith(("INSERT", "UPDATE", "DELETE"))) == 3
+    prefs = client.get("/api/v1/students/20251113/preferences").get_json()
+    assert sorted((p["lab_id"], p["rank"]) for p in prefs) == [("LAB02", 1), ("LAB03", 2)]
+
+
+def test_set_preferences_batch_payload(client):
+    setup_labs(client, count=2)
+    for i in range(3):
+        student = {"student_id": f"2025120{i}", "name": f"学生{i}", "email": f"b{i}@example.com", "gpa": 3.0}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    client.post("/api/v1/preferences", json={"student_id": "20251200", "preferences": [{"lab_id": "LAB01", "rank": 1}]})
+    payload = {"students": [
+        {"student_id": "20251200", "preferences": [{"lab_id": "LAB01", "rank": 1}]},
+        {"student_id": "20251201", "preferences": [{"lab_id": "LAB02", "rank": 1}, {"lab_id": "LAB01", "rank": 2}]},
+        {"student_id": "20251202", "preferences": []},
+    ]}
+    data = client.post("/api/v1/preferences", json=payload).get_json()
+    assert data["unchanged"] is False and data["inserted"] == 2
+    assert [s["unchanged"] for s in data["students"]] == [True, False, True]
+
+
+def test_set_preferences_rejects_bad_entries(client):
+    setup_labs(client, count=2)
+    student = {"student_id": "20251300", "name": "学生", "email": "c@example.com", "gpa": 3.0}
+    client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    bad = [
+        [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 1}],
+        [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB01", "rank": 2}],
+        [{"lab_id": "LAB01", "rank": "1"}],
+        [{"lab_id": "LAB09", "rank": 1}],
+    ]
+    for prefs in bad:
+        res = client.post("/api/v1/preferences", json={"student_id": "20251300", "preferences": prefs})
+        assert res.status_code == 400, prefs
+    res = client.post("/api/v1/preferences", json={"student_id": "nobody", "preferences": []})
+    assert res.status_code == 400
+    res = client.post("/api/v1/preferences", json={"students": [
+        {"student_id": "20251300", "preferences": [{"lab_id": "LAB01", "rank": 1}]},
+        {"student_id": "20251300", "preferences": []},
+    ]})
+    assert res.status_code == 400
+    assert "students[1]" in res.get_json()["message"]
+    # 1件でも不正なら何も書き込まない
+    assert client.get("/api/v1/students/20251300/preferences").get_json() == []
+
+
 def test_run_matching_success(client):
     # 事前に学生・研究室・希望データを登録
     student_id = "20252222"
@@ -115,8 +196,13 @@ def test_run_matching_success(client):
         "/api/v1/admin/matching/run",
         headers={"Authorization": f"Bearer {token}"}
     )
-    assert res.status_code == 200
-    assert "マッチングを実行しました" in res.get_json()["message"]
+    assert res.status_code == 202
+    job_id = res.get_json()["job_id"]
+    matching_runner.wait(job_id, timeout=10)
+    res = client.get(f"/api/v1/admin/matching/jobs/{job_id}", headers={"Authorization": f"Bearer {token}"})
+    assert res.get_json()["status"] == "succeeded"
+    res = client.get(f"/api/v1/students/{student_id}/assignment")
+    assert res.get_json()["assigned_lab"] == "LAB01"
 
 def test_run_matching_forbidden(client):
     # 事前に学生・研究室・希望データを登録
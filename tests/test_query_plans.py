@@ -0,0 +1,135 @@
+import json
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app import app, db, matching_runner, MatchingResult, Preference, Student, User
+from sqlite_profile import READ_ENGINE_KEY
+
+# 表全体の走査（SCAN）を許さない。索引による検索（SEARCH）と少数行のORDER BY用一時B木は許可する
+FULL_SCAN = re.compile(r'^SCAN ')
+WHERE = re.compile(r'\bWHERE\b')
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_plans@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_plans@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client, headers):
+    for i, gpa in enumerate([3.0, 3.8, 2.5], start=1):
+        student = {"student_id": f"2025700{i}", "name": f"学生{i}", "email": f"plan{i}@example.com", "gpa": gpa}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name, tag in [("ラボP1", "AI"), ("ラボP2", "DB")]:
+        lab = {"lab_name": name, "teacher_name": "佐藤", "capacity": 2, "field_tag": tag}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+    for i in range(1, 4):
+        prefs = {"student_id": f"2025700{i}",
+                 "preferences": [{"lab_id": "LAB01", "rank": 1}, {"lab_id": "LAB02", "rank": 2}]}
+        client.post("/api/v1/preferences", data=json.dumps(prefs), content_type="application/json")
+    client.put("/api/v1/admin/laboratories/LAB02/special_students", data=json.dumps({"student_ids": ["20257003"]}),
+               content_type="application/json", headers=headers)
+    res = client.post("/api/v1/admin/matching/run", data=json.dumps({}), content_type="application/json",
+                      headers=headers)
+    job_id = res.get_json()["job_id"]
+    matching_runner.wait(job_id, timeout=10)
+    return job_id
+
+
+class StatementLog:
+    """書き込み用・読み取り専用の両エンジンで実行された SELECT 文を記録する"""
+
+    def __init__(self):
+        self.statements = []
+        self.engines = [db.engine, app.extensions.get(READ_ENGINE_KEY)]
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        for engine in filter(None, self.engines):
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in filter(None, self.engines):
+            event.remove(engine, "before_cursor_execute", self._record)
+
+
+def query_plans(statements):
+    """WHERE 付きの参照（一覧の件数・LIMIT付き先頭取得を除く）ごとに EXPLAIN QUERY PLAN の内容を返す"""
+    with db.engine.connect() as conn:
+        return [(statement, [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)])
+                for statement, parameters in statements if WHERE.search(statement)]
+
+
+def full_scans(statements):
+    return [(statement, detail) for statement, plan in query_plans(statements)
+            for detail in plan if FULL_SCAN.match(detail)]
+
+
+@pytest.mark.parametrize("method, url", [
+    ("get", "/api/v1/laboratories?field_tag=AI"),
+    ("get", "/api/v1/preferences/20257001"),
+    ("get", "/api/v1/students/20257001/preferences"),
+    ("get", "/api/v1/students/20257001/assignment"),
+    ("get", "/api/v1/students/20257002/matching_history"),
+    ("get", "/api/v1/matching/results?batch_id={batch_id}&after=20257001&limit=1"),
+    ("get", "/api/v1/admin/laboratories/LAB02/special_students"),
+    ("post", "/api/v1/preferences"),
+])
+def test_endpoint_queries_use_indexes(client, method, url):
+    token = get_admin_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    batch_id = setup_cohort(client, headers)
+    kwargs = {"headers": headers}
+    if method == "post":
+        prefs = {"student_id": "20257001", "preferences": [{"lab_id": "LAB02", "rank": 1}]}
+        kwargs.update(data=json.dumps(prefs), content_type="application/json")
+    with app.app_context():
+        log = StatementLog()
+    with log:
+        res = getattr(client, method)(url.format(batch_id=batch_id), **kwargs)
+    assert res.status_code in (200, 201)
+    assert any(WHERE.search(statement) for statement, _ in log.statements)
+    with app.app_context():
+        assert full_scans(log.statements) == []
+
+
+def test_preferences_and_history_are_read_from_covering_indexes(client):
+    with app.app_context(), StatementLog() as log:
+        Preference.query.filter_by(student_id="20257001").order_by(Preference.rank).all()
+        db.session.query(MatchingResult.batch_id, MatchingResult.assigned_lab, MatchingResult.satisfaction) \
+            .filter(MatchingResult.student_id == "20257001").all()
+        (_, preference_plan), (_, history_plan) = query_plans(log.statements)
+    # rank順の並べ替えも表の参照も不要
+    assert preference_plan == ["SEARCH preferences USING COVERING INDEX ix_preferences_student_rank (student_id=?)"]
+    assert history_plan == ["SEARCH matching_results USING COVERING INDEX ix_matching_results_student_history "
+                            "(student_id=?)"]
+
+
+def test_reverse_foreign_key_lookups_use_indexes(client):
+    # 研究室の配属学生・学生に紐づくユーザーの参照（研究室・学生の削除時の参照元確認）
+    with app.app_context(), StatementLog() as log:
+        Student.query.filter_by(assigned_lab="LAB01").all()
+        User.query.filter_by(student_id="20257001").all()
+        assert len(log.statements) == 2
+        assert full_scans(log.statements) == []
+
+
+def test_full_scan_is_detected(client):
+    with app.app_context(), StatementLog() as log:
+        Student.query.filter_by(name="学生1").all()
+        assert len(full_scans(log.statements)) == 1
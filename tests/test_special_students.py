@@ -0,0 +1,74 @@
+import json
+
+
+def get_admin_token(client):
+    admin_data = {
+        "email": "admin_special@example.com",
+        "password": "adminpass",
+        "role": "admin"
+    }
+    client.post("/api/v1/auth/register", data=json.dumps(admin_data), content_type="application/json")
+    login_data = {
+        "email": "admin_special@example.com",
+        "password": "adminpass"
+    }
+    res = client.post("/api/v1/auth/login", data=json.dumps(login_data), content_type="application/json")
+    return res.get_json()["access_token"]
+
+
+def setup_cohort(client):
+    for sid, name in [("20255001", "特別一郎"), ("20255002", "特別二郎"), ("20255003", "特別三郎")]:
+        student = {"student_id": sid, "name": name, "email": f"{sid}@example.com", "gpa": 3.0}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+    for name in ["ラボS1", "ラボS2"]:
+        lab = {"lab_name": name, "teacher_name": "田中", "capacity": 2, "field_tag": "AI"}
+        client.post("/api/v1/laboratories", data=json.dumps(lab), content_type="application/json")
+
+
+def test_replace_and_get_special_students(client):
+    setup_cohort(client)
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    url = "/api/v1/admin/laboratories/LAB01/special_students"
+    res = client.put(url, data=json.dumps({"student_ids": ["20255002", "20255001", "20255002"]}),
+                     content_type="application/json", headers=headers)
+    assert res.status_code == 200
+    assert res.get_json()["student_ids"] == ["20255002", "20255001"]
+    res = client.put(url, data=json.dumps({"student_ids": ["20255003"]}),
+                     content_type="application/json", headers=headers)
+    assert res.status_code == 200
+    assert client.get(url, headers=headers).get_json()["student_ids"] == ["20255003"]
+
+
+def test_replace_rejects_unknown_student_and_lab(client):
+    setup_cohort(client)
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    res = client.put("/api/v1/admin/laboratories/LAB01/special_students",
+                     data=json.dumps({"student_ids": ["20255001", "99999999"]}),
+                     content_type="application/json", headers=headers)
+    assert res.status_code == 400
+    assert "99999999" in res.get_json()["message"]
+    res = client.put("/api/v1/admin/laboratories/LAB99/special_students",
+                     data=json.dumps({"student_ids": []}), content_type="application/json", headers=headers)
+    assert res.status_code == 404
+
+
+def test_bulk_add_skips_existing_pairs(client):
+    setup_cohort(client)
+    headers = {"Authorization": f"Bearer {get_admin_token(client)}"}
+    entries = [{"lab_id": "LAB01", "student_id": "20255001"},
+               {"lab_id": "LAB02", "student_id": "20255001"},
+               {"lab_id": "LAB02", "student_id": "20255002"}]
+    res = client.post("/api/v1/admin/special_students/bulk", data=json.dumps({"entries": entries}),
+                      content_type="application/json", headers=headers)
+    assert res.status_code == 201
+    assert res.get_json() == {"added": 3, "skipped": 0}
+    res = client.post("/api/v1/admin/special_students/bulk", data=json.dumps({"entries": entries[1:]}),
+                      content_type="application/json", headers=headers)
+    assert res.get_json() == {"added": 0, "skipped": 2}
+    res = client.get("/api/v1/admin/laboratories/LAB02/special_students", headers=headers)
+    assert res.get_json()["student_ids"] == ["20255001", "20255002"]
+
+
+def test_special_students_requires_admin(client):
+    res = client.get("/api/v1/admin/laboratories/LAB01/special_students")
+    assert res.status_code == 401
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from app import app, db, Student
+from sqlite_benchmark import run_benchmark
+from sqlite_profile import READ_ENGINE_KEY, read_only_url
+
+
+def test_writer_connections_use_configured_pragmas(client):
+    with app.app_context():
+        assert db.session.execute(sa.text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.session.execute(sa.text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert db.session.execute(sa.text("PRAGMA busy_timeout")).scalar() == 5000
+        assert db.session.execute(sa.text("PRAGMA cache_size")).scalar() == -64 * 1024
+
+
+def test_get_requests_read_through_read_only_pool(client):
+    read_engine = app.extensions[READ_ENGINE_KEY]
+    checkouts = []
+    listener = lambda *args: checkouts.append(1)
+    event.listen(read_engine.pool, "checkout", listener)
+    try:
+        student = {"student_id": "20256001", "name": "学生", "email": "ro@example.com", "gpa": 3.0}
+        client.post("/api/v1/students", data=json.dumps(student), content_type="application/json")
+        assert checkouts == []
+        res = client.get("/api/v1/students/20256001")
+        assert res.status_code == 200 and res.get_json()["name"] == "学生"
+        assert len(checkouts) == 1
+    finally:
+        event.remove(read_engine.pool, "checkout", listener)
+
+
+def test_read_only_pool_rejects_writes_and_flushes_go_to_writer(client):
+    read_engine = app.extensions[READ_ENGINE_KEY]
+    with read_engine.connect() as conn:
+        with pytest.raises(sa.exc.OperationalError):
+            conn.execute(sa.text("INSERT INTO laboratories (lab_id, lab_name, teacher_name, capacity) "
+                                 "VALUES ('X', 'x', 'x', 1)"))
+    # GETリクエスト中でも書き込み（flush）は書き込み用のエンジンを使う
+    with app.test_request_context("/api/v1/students", method="GET"):
+        app.preprocess_request()
+        db.session.add(Student(student_id="20256002", name="学生", email="rw@example.com", gpa=3.0))
+        db.session.commit()
+        assert db.session.get(Student, "20256002") is not None
+        db.session.remove()
+
+
+def test_read_only_url_keeps_the_same_file():
+    url = read_only_url("sqlite:////tmp/app.db")
+    assert url.database == "file:/tmp/app.db?mode=ro"
+    assert url.query == {"uri": "true"}
+
+
+def test_benchmark_reports_each_profile(tmp_path):
+    report = run_benchmark(directory=str(tmp_path), writers=1, readers=1, seconds=0.3, students=50, labs=10)
+    assert [r["profile"] for r in report["results"]] == ["baseline", "tuned"]
+    for r in report["results"]:
+        assert r["writes"] > 0 and r["reads"] > 0
+        assert r["write_p99_ms"] >= r["write_p50_ms"] > 0